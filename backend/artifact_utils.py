@@ -0,0 +1,139 @@
+import os
+import time
+import logging
+import threading
+from retrieval_utils import tokenize
+from sqldb_utils import get_clause_artifact
+from sqldb_utils import load_clause_artifact_keys
+from sqldb_utils import upsert_clause_artifact
+from sqldb_utils import delete_clause_artifacts
+
+logger = logging.getLogger(__name__)
+
+CLAUSE_ARTIFACTS = os.getenv("CLAUSE_ARTIFACTS", "0") == "1"
+CLAUSE_ARTIFACT_KINDS = tuple(
+    kind.strip() for kind in os.getenv("CLAUSE_ARTIFACT_KINDS", "checklist").split(",") if kind.strip()
+)  # 'checklist' and/or 'sop'
+CLAUSE_ARTIFACT_MAX_DEPTH = int(os.getenv("CLAUSE_ARTIFACT_MAX_DEPTH", "3"))  # 7.3.7 is depth 3
+CLAUSE_ARTIFACT_PER_MINUTE = float(os.getenv("CLAUSE_ARTIFACT_PER_MINUTE", "10"))
+CLAUSE_ARTIFACT_MAX_FAILURES = int(os.getenv("CLAUSE_ARTIFACT_MAX_FAILURES", "5"))
+
+# words that only say what to produce, not which part of the clause
+REQUEST_WORDS = frozenset(
+    "audit checklist checklists question questions create draft generate make please prepare produce "
+    "provide write sop sops standard operating procedure procedures clause section subclause sub "
+    "iso 15189 requirements internal".split()
+)
+
+
+def is_whole_clause_request(question: str, number: str) -> bool:
+    """
+    True for "checklist for clause 7.3", False for narrower requests such
+    as "SOP for 7.4 sample transport" that need a tailored answer.
+    """
+    return all(term == number or term in REQUEST_WORDS for term in tokenize(question))
+
+
+class ClauseArtifactStore:
+    """
+    Checklists and SOP drafts pre-generated per clause of the ingested
+    standard, stored in SQLite per corpus version. After each ingestion a
+    background worker walks the clause index and calls generators[kind]
+    (number, snapshot), at most per_minute times a minute so interactive
+    traffic keeps its share of the provider quota. Whole-clause checklist
+    and SOP requests are then answered with a single row lookup.
+    """
+    def __init__(self, generators, enabled=CLAUSE_ARTIFACTS, kinds=CLAUSE_ARTIFACT_KINDS,
+                 max_depth=CLAUSE_ARTIFACT_MAX_DEPTH, per_minute=CLAUSE_ARTIFACT_PER_MINUTE,
+                 max_failures=CLAUSE_ARTIFACT_MAX_FAILURES):
+        self.generators = generators
+        self.enabled = enabled
+        self.kinds = tuple(kind for kind in kinds if kind in generators)
+        self.max_depth = max_depth
+        self.interval = 60 / per_minute if per_minute > 0 else 0
+        self.max_failures = max_failures
+        self._run_id = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self.generated = 0
+        self.served = 0
+        self.failures = 0
+
+    def lookup(self, kind: str, question: str, snapshot):
+        """
+        The stored artifact for a whole-clause request, or None.
+        """
+        if not self.enabled or kind not in self.kinds:
+            return None
+        number = snapshot.clause_index.resolve(question)
+        if number is None or not is_whole_clause_request(question, number):
+            return None
+        content = get_clause_artifact(snapshot.corpus_version, number, kind)
+        if content is not None:
+            self.served += 1
+            logger.info(f'Served precomputed {kind} for clause {number}')
+        return content
+
+    def schedule(self, snapshot):
+        """
+        Starts generating what is missing for the snapshot's corpus version;
+        a run for an older version stops before its next artifact.
+        """
+        if not self.enabled or not self.kinds or not snapshot.corpus_version:
+            return
+        with self._lock:
+            self._run_id += 1
+            run_id = self._run_id
+        threading.Thread(
+            target=self._run, args=(snapshot, run_id), name="clause-artifacts", daemon=True
+        ).start()
+
+    def _run(self, snapshot, run_id):
+        version = snapshot.corpus_version
+        done = load_clause_artifact_keys(version)
+        todo = [
+            (number, kind)
+            for number in snapshot.clause_index.numbers()
+            if number.count(".") < self.max_depth
+            for kind in self.kinds
+            if (number, kind) not in done
+        ]
+        logger.info(f'Generating {len(todo)} clause artifacts for corpus version {version}')
+        self._running = True
+        consecutive_failures = 0
+        next_call = 0.0
+        try:
+            for number, kind in todo:
+                time.sleep(max(next_call - time.monotonic(), 0))
+                if run_id != self._run_id:
+                    logger.info(f'Clause artifact run for {version} superseded')
+                    return
+                next_call = time.monotonic() + self.interval
+                try:
+                    content = self.generators[kind](number, snapshot)
+                except Exception as e:
+                    self.failures += 1
+                    consecutive_failures += 1
+                    logger.error(f"Failed to generate {kind} for clause {number}: {e}")
+                    if consecutive_failures >= self.max_failures:
+                        logger.error(f'Stopping clause artifact run after {consecutive_failures} failures in a row')
+                        return
+                    continue
+                consecutive_failures = 0
+                upsert_clause_artifact(version, number, kind, content)
+                self.generated += 1
+            delete_clause_artifacts(keep_version=version)
+            logger.info(f'Clause artifacts complete for corpus version {version}')
+        finally:
+            if run_id == self._run_id:
+                self._running = False
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "kinds": list(self.kinds),
+            "running": self._running,
+            "generated": self.generated,
+            "served": self.served,
+            "failures": self.failures,
+        }
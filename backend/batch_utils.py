@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import logging
+from embedding_utils import normalize_query
+from langchain_utils import retrieval_chain
+from langchain_utils import retrieve_context
+from langchain_utils import answer_from_context
+from langchain_utils import checklist_from_answer
+from langchain_utils import format_sop_text
+from langchain_utils import get_retrieval_snapshot
+from langchain_utils import clause_artifacts
+from artifact_utils import is_whole_clause_request
+from sqldb_utils import insert_application_logs
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_RATE_LIMIT = os.getenv("BATCH_RATE_LIMIT", "10/hour")
+
+
+def _sources(context):
+    sources = []
+    for doc in context or []:
+        source = {"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}
+        if source not in sources:
+            sources.append(source)
+    return sources
+
+
+class BatchRunner:
+    """
+    Runs audit question sets for /chat/batch. Items share one corpus
+    snapshot. Answer items asking the same question share one retrieval +
+    QA run. Checklist and SOP items asking the same question share one
+    retrieval and one generation; differently worded items only share a
+    generation when both ask for a whole clause and retrieve the same
+    chunks, as precomputed clause artifacts are shared by every such
+    request. The semaphore is shared by every batch, so bulk
+    work never holds more than `concurrency` worker threads, whatever
+    interactive /chat traffic is doing.
+    """
+    def __init__(self, concurrency=BATCH_CONCURRENCY):
+        self.concurrency = max(concurrency, 1)
+        self._semaphore = None
+        self.batches = 0
+        self.items = 0
+        self.shared_retrievals = 0
+        self.shared_generations = 0
+        self.failures = 0
+
+    def _slot(self):
+        # created lazily so it binds to the serving event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def run(self, items, session_id, user_id=None):
+        """
+        Yields one result dict per item, in completion order.
+        """
+        self.batches += 1
+        self.items += len(items)
+        snapshot = get_retrieval_snapshot()
+        config = {'configurable': {'snapshot': snapshot}}
+        answers = {}      # normalized question -> retrieval + QA
+        contexts = {}     # normalized question -> retrieved chunks
+        generations = {}  # (intent, question or whole clause, chunk ids) -> checklist or SOP
+        tasks = (answers, contexts, generations)
+
+        def generation_key(item, key, context):
+            number = snapshot.clause_index.resolve(item.question)
+            if number is not None and is_whole_clause_request(item.question, number):
+                key = f"clause {number}"
+            return (item.intent, key, tuple(sorted(doc.id for doc in context)))
+
+        def shared(runs, key, fn, *args):
+            task = runs.get(key)
+            if task is None:
+                task = runs[key] = asyncio.ensure_future(self._in_slot(fn, *args))
+            elif runs is generations:
+                self.shared_generations += 1
+            else:
+                self.shared_retrievals += 1
+            return task
+
+        async def run_item(index, item):
+            start = time.perf_counter()
+            try:
+                context = []
+                key = normalize_query(item.question)
+                if item.intent == "answer":
+                    retrieved = await shared(
+                        answers, key, retrieval_chain.invoke, {'input': item.question, 'chat_history': []}, config
+                    )
+                    answer = retrieved['answer']
+                    context = retrieved.get('context')
+                else:
+                    answer = await asyncio.to_thread(clause_artifacts.lookup, item.intent, item.question, snapshot)
+                    if answer is None:
+                        context = await shared(contexts, key, retrieve_context, item.question, snapshot)
+                        answer = await shared(
+                            generations, generation_key(item, key, context),
+                            self._generate, item.intent, item.question, context, config
+                        )
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Batch item {index} failed for '{item.question}': {e}")
+                return {"type": "error", "index": index, "question": item.question, "intent": item.intent,
+                        "error": "Could not process this item. Please try again."}
+            insert_application_logs(session_id, item.question, answer, user_id=user_id)
+            return {
+                "type": "result",
+                "index": index,
+                "question": item.question,
+                "intent": item.intent,
+                "answer": answer,
+                "sources": _sources(context),
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            }
+
+        pending = [asyncio.ensure_future(run_item(index, item)) for index, item in enumerate(items)]
+        try:
+            for finished in asyncio.as_completed(pending):
+                yield await finished
+        finally:
+            # client went away: stop work that has not started yet
+            for task in pending + [task for runs in tasks for task in runs.values()]:
+                task.cancel()
+
+    @staticmethod
+    def _generate(intent, question, context, config):
+        answer = answer_from_context(question, context, config)
+        if intent == "checklist":
+            return checklist_from_answer(answer, config)
+        return format_sop_text(answer, config)
+
+    async def _in_slot(self, fn, *args):
+        async with self._slot():
+            return await asyncio.to_thread(fn, *args)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "shared_retrievals": self.shared_retrievals,
+            "shared_generations": self.shared_generations,
+            "failures": self.failures,
+        }
@@ -0,0 +1,502 @@
+"""
+Offline end-to-end benchmark for the chat backend.
+
+Runs main.app in-process behind uvicorn with fake LLM providers
+(deterministic text, configurable time to first token and token rate) and
+fake or real bge-small embeddings, then reports:
+
+  - run_ingestion throughput over a synthetic PDF corpus
+  - SQLite write latency of the application_logs writer
+  - /chat time to first token, total latency and requests/s at a given concurrency
+  - event-loop blocking time while /chat is under load
+
+Results are written as JSON; pass --baseline to compare against an
+earlier run and exit non-zero on regressions.
+
+    cd backend
+    python benchmark.py --requests 200 --concurrency 16 --output bench.json
+    python benchmark.py --output new.json --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+
+QUESTIONS = [
+    "What does clause 7.3.7 require?",
+    "How should the laboratory handle nonconforming work?",
+    "What are the requirements for personnel competence?",
+    "Explain the requirements for measurement uncertainty",
+    "What is required for equipment calibration and traceability?",
+    "How often should management review be performed?",
+    "Create an audit checklist for document control",
+    "Draft an SOP for sample reception and rejection",
+    "Help me prepare for our assessment visit next month",
+    "hello",
+]
+
+# (metric path, True when higher is better)
+REGRESSION_METRICS = [
+    ("chat.ttft_ms.p50", False),
+    ("chat.ttft_ms.p95", False),
+    ("chat.latency_ms.p95", False),
+    ("chat.requests_per_s", True),
+    ("event_loop.max_lag_ms", False),
+    ("event_loop.blocked_ms", False),
+    ("sqlite.enqueue_ms.p95", False),
+    ("sqlite.batch_write_ms.p95", False),
+    ("ingestion.pages_per_s", True),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark for the chat backend")
+    parser.add_argument("--requests", type=int, default=100, help="measured /chat requests")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured /chat requests sent first")
+    parser.add_argument("--sessions", type=int, default=None, help="distinct sessions (default: concurrency)")
+    parser.add_argument("--unique-questions", action="store_true", help="make every question distinct to defeat caches")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=60)
+    parser.add_argument("--embeddings", choices=["fake", "bge"], default="fake")
+    parser.add_argument("--embed-ms", type=float, default=2.0, help="fake embedding cost per text")
+    parser.add_argument("--pdf-files", type=int, default=4)
+    parser.add_argument("--pdf-pages", type=int, default=40)
+    parser.add_argument("--log-rows", type=int, default=2000, help="rows written in the SQLite phase")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a temporary one)")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="earlier result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency changes smaller than this")
+    return parser.parse_args()
+
+
+def percentiles(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(int(len(ordered) * q), len(ordered) - 1)], 2)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 2),
+    }
+
+
+# ---------------------------------------------------------------- fakes
+
+def install_fakes(args):
+    """
+    Swaps the provider clients and the embedding model for fakes. Must run
+    before langchain_utils / main are imported.
+    """
+    from typing import Any
+    import langchain_groq
+    import langchain_mistralai
+    import chromadb_utils
+    from fake_utils import HashEmbeddings
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.language_models.chat_models import generate_from_stream, agenerate_from_stream
+    from langchain_core.messages import AIMessageChunk
+    from langchain_core.outputs import ChatGenerationChunk
+
+    class FakeChatModel(BaseChatModel):
+        provider: str
+        first_token_ms: float
+        tokens_per_s: float
+        answer_tokens: int
+        extra: Any = None
+
+        @property
+        def _llm_type(self):
+            return "benchmark-fake"
+
+        def _reply(self, messages):
+            prompt = "\n".join(str(message.content) for message in messages)
+            words = [f"requirement{i % 17}" for i in range(self.answer_tokens)]
+            answer = "The laboratory shall " + " ".join(words) + "."
+            if "Do I need to use a tool?" in prompt:
+                return "Thought: Do I need to use a tool? No\nAI: " + answer
+            return answer
+
+        def _tokens(self, messages):
+            text = self._reply(messages)
+            return [token if i == 0 else " " + token for i, token in enumerate(text.split(" "))]
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.first_token_ms / 1000)
+            for i, token in enumerate(self._tokens(messages)):
+                if i:
+                    time.sleep(1 / self.tokens_per_s)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.first_token_ms / 1000)
+            for i, token in enumerate(self._tokens(messages)):
+                if i:
+                    await asyncio.sleep(1 / self.tokens_per_s)
+                chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+                if run_manager:
+                    await run_manager.on_llm_new_token(token, chunk=chunk)
+                yield chunk
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager))
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager))
+
+    def provider(name):
+        def factory(**kwargs):
+            return FakeChatModel(
+                provider=name,
+                first_token_ms=args.llm_first_token_ms,
+                tokens_per_s=args.llm_tokens_per_s,
+                answer_tokens=args.llm_answer_tokens,
+                extra=kwargs
+            )
+        return factory
+
+    langchain_groq.ChatGroq = provider("groq")
+    langchain_mistralai.ChatMistralAI = provider("mistral")
+
+    class FakeEmbeddings(HashEmbeddings):
+        cost = args.embed_ms / 1000
+
+    if args.embeddings == "fake":
+        chromadb_utils.HuggingFaceEmbeddings = FakeEmbeddings
+
+
+# ---------------------------------------------------------------- corpus
+
+def write_corpus(data_dir, files, pages_per_file):
+    from fake_utils import write_pdf
+    os.makedirs(data_dir, exist_ok=True)
+    topics = ["personnel competence", "equipment calibration", "external quality assessment",
+              "measurement uncertainty", "document control", "sample reception", "risk management"]
+    for f in range(files):
+        pages = []
+        for p in range(pages_per_file):
+            clause = f"{f + 4}.{p // 8 + 1}.{p % 8 + 1}"
+            topic = topics[(f + p) % len(topics)]
+            lines = [f"{clause} Requirements for {topic}"]
+            lines += [
+                f"The laboratory shall document {topic} procedures, record item {i} and review "
+                f"them at planned intervals to ensure continuing suitability ({clause})."
+                for i in range(45)
+            ]
+            pages.append(lines)
+        write_pdf(os.path.join(data_dir, f"synthetic_{f:02d}.pdf"), pages)
+
+
+# ---------------------------------------------------------------- phases
+
+def bench_ingestion(args, data_dir):
+    from chromadb_utils import run_ingestion
+    write_corpus(data_dir, args.pdf_files, args.pdf_pages)
+    start = time.perf_counter()
+    result = run_ingestion(data_dir)
+    elapsed = time.perf_counter() - start
+    throughput = result.get("throughput", {})
+    return {
+        "files": args.pdf_files,
+        "pages": args.pdf_files * args.pdf_pages,
+        "chunks_added": result["added"],
+        "seconds": round(elapsed, 3),
+        "pages_per_s": round(args.pdf_files * args.pdf_pages / elapsed, 1),
+        "chunks_per_s": throughput.get("chunks_per_s"),
+        "embeddings_per_s": throughput.get("embeddings_per_s"),
+    }
+
+
+class WriteTimer:
+    """
+    Wraps LogWriter._write to time every batch commit.
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.batches = []
+        original = writer._write
+
+        def timed(batch):
+            start = time.perf_counter()
+            original(batch)
+            if batch:
+                self.batches.append(((time.perf_counter() - start) * 1000, len(batch)))
+
+        writer._write = timed
+
+
+def bench_sqlite(args, timer):
+    from sqldb_utils import insert_application_logs, log_writer
+    timer.batches.clear()
+    enqueue = []
+    start = time.perf_counter()
+    for i in range(args.log_rows):
+        t = time.perf_counter()
+        insert_application_logs(f"bench-sqlite-{i % 50}", f"question {i}", "answer " * 40)
+        enqueue.append((time.perf_counter() - t) * 1000)
+    while log_writer._pending:
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": args.log_rows,
+        "enqueue_ms": percentiles(enqueue),
+        "batch_write_ms": percentiles([ms for ms, _ in timer.batches]),
+        "avg_batch_rows": round(sum(rows for _, rows in timer.batches) / len(timer.batches), 1) if timer.batches else 0,
+        "rows_per_s": round(args.log_rows / elapsed, 1),
+    }
+
+
+class LoopMonitor:
+    """
+    Measures event-loop lag: how late a periodic sleep wakes up.
+    """
+    def __init__(self, interval=0.005, threshold_ms=1.0):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.lags = []
+        self.running = False
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while self.running:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max((loop.time() - start - self.interval) * 1000, 0.0))
+
+    def report(self):
+        blocked = [lag for lag in self.lags if lag > self.threshold_ms]
+        return {
+            "samples": len(self.lags),
+            "lag_ms": percentiles(self.lags),
+            "max_lag_ms": round(max(self.lags), 2) if self.lags else 0.0,
+            "blocked_ms": round(sum(blocked), 1),
+        }
+
+
+class Server:
+    """
+    uvicorn serving main.app on its own event loop in a background thread.
+    """
+    def __init__(self, app):
+        import uvicorn
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="benchmark-server", daemon=True)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+async def _chat_once(client, question, session_id):
+    start = time.perf_counter()
+    first = None
+    ok = False
+    async with client.stream("POST", "/chat", json={"question": question, "session_id": session_id}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            frame = json.loads(line)
+            if frame.get("type") == "token" and first is None:
+                first = time.perf_counter()
+                ok = "encountered an error" not in frame.get("content", "")
+            elif frame.get("type") == "end":
+                break
+    end = time.perf_counter()
+    return {
+        "ttft_ms": (first - start) * 1000 if first else None,
+        "latency_ms": (end - start) * 1000,
+        "ok": ok and response.status_code == 200,
+    }
+
+
+async def bench_chat(args, server):
+    import httpx
+    sessions = args.sessions or args.concurrency
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    def question(i):
+        text = QUESTIONS[i % len(QUESTIONS)]
+        return f"{text} (variant {i})" if args.unique_questions else text
+
+    async with httpx.AsyncClient(base_url=server.url, limits=limits, timeout=300) as client:
+        for i in range(args.warmup):
+            await _chat_once(client, question(i), f"bench-warmup-{i}")
+
+        monitor = LoopMonitor()
+        monitor.running = True
+        monitor_future = server.submit(monitor.run())
+
+        counter = iter(range(args.requests))
+        results = []
+
+        async def worker():
+            for i in counter:
+                results.append(await _chat_once(client, question(i), f"bench-{i % sessions}"))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+        monitor.running = False
+        await asyncio.wrap_future(monitor_future)
+        cache_stats = (await client.get("/admin/cache/stats")).json()
+
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": sum(1 for r in results if not r["ok"]),
+        "seconds": round(elapsed, 3),
+        "requests_per_s": round(args.requests / elapsed, 2),
+        "ttft_ms": percentiles([r["ttft_ms"] for r in results if r["ttft_ms"] is not None]),
+        "latency_ms": percentiles([r["latency_ms"] for r in results]),
+        "caches": cache_stats,
+    }, monitor.report()
+
+
+# ---------------------------------------------------------------- reporting
+
+def _lookup(result, path):
+    for key in path.split("."):
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    """
+    Prints metric deltas against the baseline; returns the regressed metrics.
+    Latency changes below min_delta_ms are treated as noise.
+    """
+    regressions = []
+    print(f"{'metric':32} {'baseline':>12} {'current':>12} {'change':>9}")
+    for path, higher_is_better in REGRESSION_METRICS:
+        old, new = _lookup(baseline, path), _lookup(result, path)
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or old == 0:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        noise = not higher_is_better and abs(new - old) < min_delta_ms
+        flag = "  REGRESSION" if worse > tolerance and not noise else ""
+        if flag:
+            regressions.append(path)
+        print(f"{path:32} {old:>12.2f} {new:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="iso15189-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    # the app reads its configuration from the environment at import time
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("MISTRALAI_API_KEY", "benchmark")
+    os.environ["CHROMA_PERSIST_DIR"] = os.path.join(workdir, "chroma_db")
+    os.environ.setdefault("CLAUSE_SOURCES", "synthetic_*.pdf")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    install_fakes(args)
+    import main as app_main
+    from sqldb_utils import log_writer
+
+    app_main.limiter.enabled = False
+    timer = WriteTimer(log_writer)
+    server = Server(app_main.app)
+    server.start()
+    try:
+        ingestion = bench_ingestion(args, os.path.join(workdir, "data"))
+        sqlite = bench_sqlite(args, timer)
+        timer.batches.clear()
+        chat, event_loop = asyncio.run(bench_chat(args, server))
+        sqlite["chat_batch_write_ms"] = percentiles([ms for ms, _ in timer.batches])
+    finally:
+        server.stop()
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+        "ingestion": ingestion,
+        "sqlite": sqlite,
+        "chat": chat,
+        "event_loop": event_loop,
+    }
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Wrote {output}")
+    print(json.dumps({key: result[key] for key in ("ingestion", "event_loop")}, indent=2))
+    print(f"chat: {chat['requests_per_s']} req/s, ttft p50 {chat['ttft_ms'].get('p50')} ms, "
+          f"latency p95 {chat['latency_ms'].get('p95')} ms, errors {chat['errors']}")
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqldb_utils import create_answer_cache
+from sqldb_utils import upsert_answer_cache
+from sqldb_utils import delete_answer_cache
+from sqldb_utils import load_answer_cache
+from embedding_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "0") == "1"
+
+
+class SemanticAnswerCache:
+    """
+    Bounded LRU/TTL cache of RAG answers keyed on the embedding of the
+    standalone question. A lookup hits when the cosine similarity to a stored
+    question reaches `threshold` and the entry belongs to the current corpus.
+    """
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL,
+                 threshold=ANSWER_CACHE_THRESHOLD, persist=ANSWER_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0.0
+
+        if self.persist and self.max_entries > 0:
+            create_answer_cache()
+            for entry in reversed(load_answer_cache(self.max_entries)):
+                entry["embedding"] = self._unit(entry["embedding"])
+                self._entries[entry["cache_key"]] = entry
+            logger.info(f'Loaded {len(self._entries)} cached answers from SQLite')
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def _unit(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds > 0 and now - entry["created_at"] > self.ttl_seconds
+
+    def _remove(self, cache_keys):
+        for key in cache_keys:
+            self._entries.pop(key, None)
+        self._matrix = None
+        if self.persist and cache_keys:
+            delete_answer_cache(cache_keys)
+
+    def _similarity_matrix(self):
+        if self._matrix is None and self._entries:
+            self._keys = list(self._entries)
+            self._matrix = np.stack([self._entries[key]["embedding"] for key in self._keys])
+        return self._matrix
+
+    def lookup(self, embedding, corpus_version: str):
+        """
+        Returns the closest cached entry for the embedding, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        start = time.perf_counter()
+        with self._lock:
+            now = time.time()
+            stale = [
+                key for key, entry in self._entries.items()
+                if self._expired(entry, now) or entry["corpus_version"] != corpus_version
+            ]
+            self._remove(stale)
+
+            matrix = self._similarity_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None
+
+            scores = matrix @ self._unit(embedding)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            key = self._keys[best]
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            lookup_ms = (time.perf_counter() - start) * 1000
+            self.latency_saved_ms += max(entry["latency_ms"] - lookup_ms, 0.0)
+            return entry
+
+    def store(self, question: str, embedding, answer: str, source_ids,
+              corpus_version: str, latency_ms: float):
+        if not self.enabled:
+            return
+
+        normalized = normalize_query(question)
+        entry = {
+            "cache_key": hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+            "question": normalized,
+            "embedding": self._unit(embedding),
+            "answer": answer,
+            "source_ids": list(source_ids),
+            "corpus_version": corpus_version,
+            "latency_ms": latency_ms,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._entries[entry["cache_key"]] = entry
+            self._entries.move_to_end(entry["cache_key"])
+            self._matrix = None
+
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                evicted = list(self._entries)[:overflow]
+                self.evictions += overflow
+                self._remove(evicted)
+
+            if self.persist:
+                upsert_answer_cache(dict(entry, embedding=entry["embedding"].tolist()))
+
+    def invalidate(self, corpus_version: str = None):
+        """
+        Drops every cached answer. Registered as an ingestion listener.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self.invalidations += 1
+            if self.persist:
+                delete_answer_cache()
+        logger.info(f'Answer cache invalidated for corpus version {corpus_version}')
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "latency_saved_ms": round(self.latency_saved_ms, 1),
+        }
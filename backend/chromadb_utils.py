@@ -1,53 +1,415 @@
 import os
-from langchain_community.document_loaders import DirectoryLoader
+import glob
+import json
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_huggingface import HuggingFaceEmbeddings
+from ingestion_utils import IngestionPipeline
+from ingestion_utils import count_pages, parse_pages
+from clause_utils import ClauseExtractor, ClauseIndex, is_clause_source
+from embedding_utils import QueryEmbeddingService
 from functools import lru_cache
+import hashlib
 import logging
+import threading
+import uuid
 
 logger = logging.getLogger(__name__)
 
 PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
+CORPUS_VERSION_FILE = os.path.join(PERSIST_DIR, "corpus_version")
+MANIFEST_FILE = os.path.join(PERSIST_DIR, "ingest_manifest.json")
+ACTIVE_COLLECTION_FILE = os.path.join(PERSIST_DIR, "active_collection")
+CLAUSE_INDEX_FILE = os.path.join(PERSIST_DIR, "clause_index.json")
+DEFAULT_COLLECTION = "langchain"
+WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", "256"))
+NOT_RETIRED = 2**62  # retired_gen of chunks still in the corpus
+
+_corpus_version = None
+_ingestion_listeners = []
+_ingestion_lock = threading.Lock()
+
+def get_corpus_version():
+    """
+    Returns the hash of the currently ingested corpus ('' if never recorded).
+    """
+    global _corpus_version
+    if _corpus_version is None:
+        try:
+            with open(CORPUS_VERSION_FILE) as f:
+                _corpus_version = f.read().strip()
+        except FileNotFoundError:
+            _corpus_version = ""
+    return _corpus_version
+
+def register_ingestion_listener(callback):
+    """
+    Registers a callable invoked with the new corpus version whenever
+    run_ingestion changes the corpus.
+    """
+    _ingestion_listeners.append(callback)
+
+def _set_corpus_version(version: str):
+    global _corpus_version
+    if version == get_corpus_version():
+        return
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    with open(CORPUS_VERSION_FILE, "w") as f:
+        f.write(version)
+    _corpus_version = version
+    logger.info(f'Corpus version changed to {version}')
+    _notify_ingestion_listeners(version)
+
+def _notify_ingestion_listeners(version: str):
+    for callback in _ingestion_listeners:
+        try:
+            callback(version)
+        except Exception as e:
+            logger.error(f"Ingestion listener failed: {e}")
+
+def get_active_collection() -> str:
+    try:
+        with open(ACTIVE_COLLECTION_FILE) as f:
+            return f.read().strip() or DEFAULT_COLLECTION
+    except FileNotFoundError:
+        return DEFAULT_COLLECTION
+
+def _set_active_collection(name: str):
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    tmp_path = ACTIVE_COLLECTION_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(name)
+    os.replace(tmp_path, ACTIVE_COLLECTION_FILE)
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    """
+    Shared bge-small model behind the query-embedding cache and micro-batcher.
+    """
+    return QueryEmbeddingService(HuggingFaceEmbeddings(
+    model_name="BAAI/bge-small-en",
+    model_kwargs={"device": "cpu"}
+    ))
+
+def open_collection(name: str):
+    return Chroma(
+        collection_name=name,
+        persist_directory=PERSIST_DIR,
+        embedding_function=get_embeddings()
+    )
 
 @lru_cache(maxsize=1)
 def get_chroma():
+    """
+    Returns the vector store for the active collection. The cache is cleared
+    when an ingestion swaps in a new collection.
+    """
     logger.info(f'Loading ChromaDB from {PERSIST_DIR}')
     try:
-        embeddings = HuggingFaceEmbeddings(
-        model_name="BAAI/bge-small-en",
-        model_kwargs={"device": "cpu"}
-        )
-        db = Chroma(persist_directory=PERSIST_DIR, embedding_function=embeddings)
+        db = open_collection(get_active_collection())
         logger.info(f'Successfully loaded and cached ChromaDB')
         return db
     except Exception as e:
         logger.error(f"Error in Loading Chroma DB: {e}")
 
-def run_ingestion(data_path: str = "./data"):
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _save_manifest(manifest):
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    tmp_path = MANIFEST_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, MANIFEST_FILE)
+
+def get_corpus_generation():
     """
-    Loads documents, splits, embeds, and persists them into ChromaDB.
+    Generation of the published corpus, or None for a collection indexed
+    before chunks carried generations (searched without a filter).
     """
-    print("Loading documents...")
-    loader = DirectoryLoader(data_path, glob="**/*.pdf")  # or .docx, .txt etc.
-    documents = loader.load()
+    manifest = load_manifest()
+    return manifest.get("generation") if manifest else None
+
+def get_corpus_chunk_ids() -> set:
+    """
+    Ids of the chunks in the published corpus generation, from the manifest.
+    """
+    manifest = load_manifest()
+    if not manifest:
+        return set()
+    return {chunk_id for entry in manifest["files"].values() for chunk_id in entry["chunk_ids"]}
+
+def generation_filter(generation):
+    """
+    Chroma where-filter for the chunks visible at a corpus generation:
+    added at or before it and not retired by then.
+    """
+    if generation is None:
+        return None
+    return {"$and": [{"added_gen": {"$lte": generation}}, {"retired_gen": {"$gt": generation}}]}
+
+def load_clause_index() -> ClauseIndex:
+    return ClauseIndex.load(CLAUSE_INDEX_FILE)
+
+def _load_clause_sources():
+    try:
+        with open(CLAUSE_INDEX_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
 
-    print(f"Loaded {len(documents)} documents.")
+def _save_clause_sources(clause_sources):
+    os.makedirs(PERSIST_DIR, exist_ok=True)
+    tmp_path = CLAUSE_INDEX_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(clause_sources, f)
+    os.replace(tmp_path, CLAUSE_INDEX_FILE)
 
-    text_splitter = RecursiveCharacterTextSplitter(
+def _extract_clauses(source, path):
+    """
+    Clause hierarchy of a file that is not going through the pipeline
+    (indexed before clause extraction existed).
+    """
+    extractor = ClauseExtractor(source)
+    for page, text in enumerate(parse_pages(path, 0, count_pages(path))):
+        extractor.add_page(page, text)
+    return extractor.finish()
+
+def _text_splitter():
+    return RecursiveCharacterTextSplitter(
     chunk_size=1200,
     chunk_overlap=200
     )
-    docs = text_splitter.split_documents(documents)
 
-    print(f"Split into {len(docs)} chunks.")
+def _set_chunk_metadata(collection, ids, metadata):
+    """
+    Merges metadata into stored chunks; embeddings and documents are untouched.
+    """
+    ids = list(ids)
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        batch = ids[start:start + WRITE_BATCH_SIZE]
+        collection._collection.update(ids=batch, metadatas=[metadata] * len(batch))
 
-    embeddings = HuggingFaceEmbeddings(
-    model_name="BAAI/bge-small-en",
-    model_kwargs={"device": "cpu"}
+def _prepare_generations(collection, manifest) -> int:
+    """
+    Returns the published generation after bringing the collection in line
+    with it: chunks of a collection indexed before generations existed are
+    stamped generation 0 (a metadata-only pass, once), leftovers of an
+    ingestion that failed before publishing are undone, and chunks retired
+    before the published generation, which no current snapshot sees, are
+    deleted.
+    """
+    published = manifest.get("generation")
+    if published is None:
+        ids = []
+        offset = 0
+        while True:
+            page = collection._collection.get(limit=WRITE_BATCH_SIZE, offset=offset, include=[])
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            ids.extend(page["ids"])
+        _set_chunk_metadata(collection, ids, {"added_gen": 0, "retired_gen": NOT_RETIRED})
+        logger.info(f'Stamped {len(ids)} chunks with corpus generation 0')
+        return 0
+
+    collection._collection.delete(where={"added_gen": {"$gt": published}})
+    unpublished = collection._collection.get(
+        where={"$and": [{"retired_gen": {"$gt": published}}, {"retired_gen": {"$lt": NOT_RETIRED}}]},
+        include=[]
+    )
+    _set_chunk_metadata(collection, unpublished["ids"], {"retired_gen": NOT_RETIRED})
+    collection._collection.delete(where={"retired_gen": {"$lte": published}})
+    return published
+
+def _drop_retired_collections(keep):
+    client = get_chroma()._client
+    for collection in client.list_collections():
+        name = collection if isinstance(collection, str) else collection.name
+        if name not in keep:
+            client.delete_collection(name)
+            logger.info(f'Dropped retired collection {name}')
+
+def _report(progress, stage, done, total):
+    if progress is not None:
+        progress(stage, done, total)
+
+def run_ingestion(data_path: str = "./data", progress=None, remove=()):
+    """
+    Incrementally syncs the PDFs under data_path into ChromaDB. Files and
+    chunks are tracked by content hash in a manifest, so only new or changed
+    chunks are embedded and chunks of replaced files are dropped. Documents
+    leave the corpus only when named in `remove` (paths relative to
+    data_path): a file missing from data_path, e.g. after the data directory
+    was lost, keeps its chunks.
+
+    Each ingestion is a new corpus generation written into the active
+    collection: new chunks are tagged added_gen, dropped ones get
+    retired_gen, and retrieval snapshots filter on the generation they were
+    built for (generation_filter). Readers of the previous snapshot keep a
+    consistent view until the manifest publishes the new generation, and an
+    upload costs only the chunks it adds. Retired chunks are deleted by the
+    ingestion after next. `progress(stage, done, total)` is called as work
+    advances.
+    """
+    with _ingestion_lock:
+        return _run_ingestion(data_path, progress, set(remove))
+
+def _run_ingestion(data_path, progress, remove):
+    active = get_chroma()
+    if active is None:
+        raise RuntimeError(f"ChromaDB is not available at {PERSIST_DIR}")
+
+    manifest = load_manifest()
+    legacy = manifest is None
+    if legacy:
+        # collections built before the manifest existed have random ids; rebuild once
+        manifest = {"files": {}}
+
+    files = manifest["files"]
+    current = {}
+    for path in sorted(glob.glob(os.path.join(data_path, "**", "*.pdf"), recursive=True)):
+        source = os.path.relpath(path, data_path)
+        if source not in remove:
+            current[source] = path
+
+    _report(progress, "hashing", 0, len(current))
+    changed = {}
+    for done, (source, path) in enumerate(current.items(), start=1):
+        file_hash = _file_hash(path)
+        previous = files.get(source)
+        if not previous or previous["sha256"] != file_hash:
+            changed[source] = file_hash
+        _report(progress, "hashing", done, len(current))
+    removed_files = sorted(remove & set(files))
+    missing = set(files) - set(current) - remove
+    if missing:
+        logger.warning(f"{len(missing)} indexed files are missing from {data_path}; keeping their chunks")
+    skipped = len(current) - len(changed)
+
+    clause_sources = _load_clause_sources()
+    for source in removed_files:
+        clause_sources.pop(source, None)
+    backfill = [
+        source for source in current
+        if source not in changed and source not in clause_sources and is_clause_source(source)
+    ]
+    for source in backfill:
+        clause_sources[source] = _extract_clauses(source, current[source])
+
+    if not changed and not removed_files and not legacy:
+        if backfill:
+            _save_clause_sources(clause_sources)
+            _notify_ingestion_listeners(get_corpus_version())
+        logger.info(f"Ingestion complete: corpus unchanged ({skipped} files).")
+        return {
+            "added": 0,
+            "removed": 0,
+            "unchanged_files": skipped,
+            "corpus_version": get_corpus_version(),
+        }
+
+    previous_name = get_active_collection()
+    if legacy:
+        # rebuilt in a new collection, swapped in once complete
+        collection_name = f"corpus_{uuid.uuid4().hex[:12]}"
+        collection = open_collection(collection_name)
+        generation = 1
+    else:
+        collection_name = previous_name
+        collection = active
+        generation = _prepare_generations(collection, manifest) + 1
+        # collections left over from the legacy rebuild or the old staging swaps
+        _drop_retired_collections({collection_name})
+
+    stale_ids = set()
+    for source in removed_files:
+        stale_ids.update(files.pop(source)["chunk_ids"])
+        logger.info(f"Removed {source}.")
+
+    extractors = {}
+
+    def page_sink(source, page, text):
+        if not is_clause_source(source):
+            return
+        if source not in extractors:
+            extractors[source] = ClauseExtractor(source)
+        extractors[source].add_page(page, text)
+
+    # invisible to published snapshots until the manifest below is saved
+    pipeline = IngestionPipeline(
+        get_embeddings(),
+        collection,
+        _text_splitter(),
+        progress=progress,
+        write_batch_size=WRITE_BATCH_SIZE,
+        page_sink=page_sink,
+        chunk_metadata={"added_gen": generation, "retired_gen": NOT_RETIRED}
+    )
+    old_ids = {source: set(files[source]["chunk_ids"]) if source in files else set() for source in changed}
+    chunk_ids = pipeline.run(
+        (source, current[source], old_ids[source]) for source in changed
     )
+    added = 0
+    for source in changed:
+        ids = chunk_ids.get(source, [])
+        stale_ids.update(old_ids[source] - set(ids))
+        added += len(set(ids) - old_ids[source])
+        files[source] = {"sha256": changed[source], "chunk_ids": ids}
+        if source in extractors:
+            clause_sources[source] = extractors[source].finish()
+        else:
+            # not part of the standard, or no text; re-extracted if CLAUSE_SOURCES changes
+            clause_sources.pop(source, None)
 
-    db = Chroma.from_documents(docs, embeddings, persist_directory=PERSIST_DIR)
-    db.persist()
+    # still visible to the published generation, hidden from the new one
+    _set_chunk_metadata(collection, stale_ids, {"retired_gen": generation})
 
-    print(f"Stored embeddings in {PERSIST_DIR}")
+    # publish: the manifest first, then readers build snapshots of the new generation
+    manifest["collection"] = collection_name
+    manifest["generation"] = generation
+    _save_manifest(manifest)
+    _save_clause_sources(clause_sources)
+    if legacy:
+        _set_active_collection(collection_name)
+        get_chroma.cache_clear()
+
+    digest = hashlib.sha256()
+    for source in sorted(files):
+        digest.update(source.encode("utf-8"))
+        digest.update(files[source]["sha256"].encode("utf-8"))
+    version = digest.hexdigest()[:16]
+    if version == get_corpus_version():
+        # same files as the published version (e.g. a file removed and restored); refresh anyway
+        _notify_ingestion_listeners(version)
+    else:
+        _set_corpus_version(version)
+
+    if legacy:
+        # the previous collection may still serve in-flight requests; drop older ones
+        _drop_retired_collections({collection_name, previous_name})
+
+    throughput = pipeline.stats.report()
+    logger.info(f"Ingestion complete: {added} chunks embedded, {len(stale_ids)} removed, {skipped} files unchanged.")
+    logger.info(
+        f"Throughput: {throughput['pages_per_s']} pages/s, {throughput['chunks_per_s']} chunks/s, "
+        f"{throughput['embeddings_per_s']} embeddings/s over {throughput['seconds']}s"
+    )
+    return {
+        "added": added,
+        "removed": len(stale_ids),
+        "unchanged_files": skipped,
+        "corpus_version": get_corpus_version(),
+        "throughput": throughput,
+    }
@@ -0,0 +1,168 @@
+import os
+import re
+import json
+import fnmatch
+import logging
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+CLAUSE_INCLUDE_SUBCLAUSES = os.getenv("CLAUSE_INCLUDE_SUBCLAUSES", "1") == "1"
+CLAUSE_MAX_CHARS = int(os.getenv("CLAUSE_MAX_CHARS", "6000"))
+CLAUSE_MAX_TOP_LEVEL = 20
+# comma-separated glob patterns of the standard's files, matched against the
+# source path; clauses are only taken from these, never from a lab's own SOPs
+CLAUSE_SOURCES = [pattern.strip() for pattern in os.getenv("CLAUSE_SOURCES", "*15189*.pdf").split(",") if pattern.strip()]
+
+# "7.3.7 Ensuring the validity of examination results" on a line of its own
+HEADING_PATTERN = re.compile(r"^\s*(\d{1,2}(?:\.\d{1,2}){0,4})\.?\s+([A-Z][^\n]{2,150})$")
+# table-of-contents entries end in dot leaders and/or a page number
+TOC_PATTERN = re.compile(r"(?:(?:\s*[.…·]){3,}\s*\d*|\s+\d+)\s*$")
+# "7.3.7", "clause 8", "section 4"
+REFERENCE_PATTERN = re.compile(
+    r"\b(?:clause|section|sub-?clause)\s+(\d{1,2}(?:\.\d{1,2}){0,4})\b|(?<![\d.:])(\d{1,2}(?:\.\d{1,2}){1,4})(?![\d.]*\d)",
+    re.IGNORECASE
+)
+
+
+def parent_of(number: str):
+    return number.rsplit(".", 1)[0] if "." in number else None
+
+
+def is_clause_source(source: str, patterns=None):
+    patterns = CLAUSE_SOURCES if patterns is None else patterns
+    return any(fnmatch.fnmatch(source.lower(), pattern.lower()) for pattern in patterns)
+
+
+def _clause_key(number: str):
+    return tuple(int(part) for part in number.split("."))
+
+
+class ClauseExtractor:
+    """
+    Collects the clause hierarchy of one PDF from its page texts, fed in page
+    order. A line is a heading when it starts with the next top-level number
+    or with a sub-clause number whose parent has already been seen, so
+    numbered list items and table-of-contents entries are not mistaken for
+    clauses.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.clauses = []
+        self._seen = set()
+        self._top_level = None
+        self._current = None
+        self._lines = []
+
+    def add_page(self, page: int, text: str):
+        for line in (text or "").splitlines():
+            match = HEADING_PATTERN.match(line)
+            if match and not TOC_PATTERN.search(match.group(2)) and self._is_heading(match.group(1)):
+                self._close()
+                number = match.group(1)
+                self._seen.add(number)
+                if "." not in number:
+                    self._top_level = int(number)
+                self._current = {
+                    "number": number,
+                    "title": match.group(2).strip(),
+                    "parent": parent_of(number),
+                    "source": self.source,
+                    "page": page,
+                }
+            elif self._current is not None:
+                self._lines.append(line)
+
+    def _is_heading(self, number: str):
+        parent = parent_of(number)
+        if parent is None:
+            if self._top_level is None:
+                return 0 < int(number) <= CLAUSE_MAX_TOP_LEVEL
+            return int(number) == self._top_level + 1
+        return parent in self._seen
+
+    def _close(self):
+        if self._current is not None:
+            self._current["text"] = "\n".join(self._lines).strip()
+            self.clauses.append(self._current)
+        self._current = None
+        self._lines = []
+
+    def finish(self):
+        self._close()
+        return self.clauses
+
+
+class ClauseIndex:
+    """
+    Precomputed clause number -> clause lookup built at ingestion time,
+    from the files matching CLAUSE_SOURCES only. When a number appears in
+    more than one of them (several editions of the standard) the file whose
+    name sorts last wins, e.g. ISO15189-2022.pdf over ISO15189-2012.pdf.
+    """
+    def __init__(self, clauses_by_source=None, sources=None):
+        self._clauses = {}
+        self._children = {}
+        for source in sorted(clauses_by_source or {}):
+            if not is_clause_source(source, sources):
+                continue
+            for clause in clauses_by_source[source]:
+                self._clauses[clause["number"]] = clause
+        for number in sorted(self._clauses, key=_clause_key):
+            parent = parent_of(number)
+            if parent is not None:
+                self._children.setdefault(parent, []).append(number)
+
+    @classmethod
+    def load(cls, path: str):
+        try:
+            with open(path) as f:
+                index = cls(json.load(f))
+        except FileNotFoundError:
+            index = cls()
+        logger.info(f'Loaded clause index with {len(index)} clauses')
+        return index
+
+    def __len__(self):
+        return len(self._clauses)
+
+    def get(self, number: str):
+        return self._clauses.get(number)
+
+    def numbers(self):
+        """
+        Every known clause number, in document order.
+        """
+        return sorted(self._clauses, key=_clause_key)
+
+    def resolve(self, question: str):
+        """
+        Returns the clause number the question refers to, or None when it
+        names no known clause or more than one.
+        """
+        numbers = set()
+        for match in REFERENCE_PATTERN.finditer(question):
+            number = match.group(1) or match.group(2)
+            if number in self._clauses:
+                numbers.add(number)
+        return numbers.pop() if len(numbers) == 1 else None
+
+    def documents(self, number: str, include_subclauses=CLAUSE_INCLUDE_SUBCLAUSES, max_chars=CLAUSE_MAX_CHARS):
+        """
+        The clause text (and its sub-clauses, depth first) as context documents.
+        """
+        documents = []
+        budget = max_chars
+        pending = [number]
+        while pending and budget > 0:
+            clause = self._clauses[pending.pop(0)]
+            content = f"{clause['number']} {clause['title']}\n{clause['text']}"[:budget]
+            budget -= len(content)
+            documents.append(Document(
+                id=f"clause:{clause['source']}:{clause['number']}",
+                page_content=content,
+                metadata={"source": clause["source"], "page": clause["page"], "clause": clause["number"]}
+            ))
+            if include_subclauses:
+                pending = self._children.get(clause["number"], []) + pending
+        return documents
@@ -0,0 +1,109 @@
+import os
+import asyncio
+import logging
+from embedding_utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+CHAT_COALESCE = os.getenv("CHAT_COALESCE", "1") == "1"
+
+_END = object()
+
+
+def coalesce_key(question: str, intent: str, corpus_version: str):
+    return (intent, normalize_query(question), corpus_version)
+
+
+class _Flight:
+    def __init__(self):
+        self.tokens = []
+        self.subscribers = []
+        self.finished = False
+        self.task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        # late joiners replay what was streamed so far
+        queue = asyncio.Queue()
+        for token in self.tokens:
+            queue.put_nowait(token)
+        if self.finished:
+            queue.put_nowait(_END)
+        self.subscribers.append(queue)
+        return queue
+
+    def publish(self, token):
+        self.tokens.append(token)
+        for queue in self.subscribers:
+            queue.put_nowait(token)
+
+    def finish(self):
+        self.finished = True
+        for queue in self.subscribers:
+            queue.put_nowait(_END)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical chat requests: the first request for a
+    key runs the pipeline, later ones attach to it and receive the same
+    token stream from the start. The flight is forgotten once the pipeline
+    finishes (completed answers are the answer cache's job) or when every
+    subscriber has disconnected, which cancels it. Event-loop only.
+    """
+    def __init__(self, enabled=CHAT_COALESCE):
+        self.enabled = enabled
+        self._flights = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def stream(self, key, produce):
+        """
+        Yields the tokens of produce() (an async generator function), shared
+        with every concurrent caller using the same key.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+            self.leaders += 1
+        else:
+            self.followers += 1
+            logger.info(f'Coalesced request onto in-flight run for: {key[1]}')
+        queue = flight.subscribe()
+        try:
+            while True:
+                token = await queue.get()
+                if token is _END:
+                    return
+                yield token
+        finally:
+            flight.subscribers.remove(queue)
+            if not flight.subscribers and not flight.finished:
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    async def _run(self, key, flight, produce):
+        tokens = produce()
+        try:
+            async for token in tokens:
+                flight.publish(token)
+        except Exception as e:
+            logger.error(f"Coalesced run failed for {key[1]}: {e}")
+        finally:
+            await tokens.aclose()
+            self._forget(key, flight)
+            flight.finish()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        total = self.leaders + self.followers
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "pipeline_runs": self.leaders,
+            "coalesced": self.followers,
+            "coalesced_rate": self.followers / total if total else 0.0,
+        }
@@ -0,0 +1,135 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBED_CACHE_SIZE = int(os.getenv("QUERY_EMBED_CACHE_SIZE", "2048"))
+QUERY_EMBED_BATCH_WAIT_MS = float(os.getenv("QUERY_EMBED_BATCH_WAIT_MS", "5"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+
+
+def normalize_query(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingService(Embeddings):
+    """
+    Embeddings wrapper used by the vector store. Query embeddings go through
+    an LRU cache keyed on normalized text, and cache misses from concurrent
+    requests are collected for up to QUERY_EMBED_BATCH_WAIT_MS and embedded
+    in one batched forward pass on a worker thread. Document embeddings
+    (ingestion) pass straight through.
+    """
+    def __init__(self, base, cache_size=QUERY_EMBED_CACHE_SIZE,
+                 batch_wait_ms=QUERY_EMBED_BATCH_WAIT_MS, max_batch=QUERY_EMBED_MAX_BATCH):
+        self.base = base
+        self.cache_size = cache_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_batch = max(max_batch, 1)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._inflight = {}  # normalized text -> Future, so duplicates share one pass
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_queries = 0
+
+    def embed_documents(self, texts):
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._submit(text).result()
+
+    async def aembed_query(self, text):
+        return await asyncio.wrap_future(self._submit(text))
+
+    def _submit(self, text) -> Future:
+        key = normalize_query(text)
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(list(vector))
+                return future
+            self.misses += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = Future()
+            self._inflight[key] = future
+
+        self._ensure_worker()
+        self._requests.put((key, text, future))
+        return future
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._worker.start()
+
+    def _embed_queries(self, texts):
+        # HuggingFaceEmbeddings applies query-specific encode kwargs in embed_query
+        if hasattr(self.base, "_embed") and hasattr(self.base, "query_encode_kwargs"):
+            encode_kwargs = self.base.query_encode_kwargs or self.base.encode_kwargs
+            return self.base._embed(texts, encode_kwargs)
+        if len(texts) == 1:
+            return [self.base.embed_query(texts[0])]
+        return self.base.embed_documents(texts)
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            try:
+                while len(batch) < self.max_batch:
+                    batch.append(self._requests.get(timeout=self.batch_wait))
+            except queue.Empty:
+                pass
+
+            try:
+                vectors = self._embed_queries([text for _, text, _ in batch])
+            except Exception as e:
+                logger.error(f"Query embedding batch of {len(batch)} failed: {e}")
+                with self._cache_lock:
+                    for key, _, future in batch:
+                        self._inflight.pop(key, None)
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.batched_queries += len(batch)
+            with self._cache_lock:
+                for (key, _, _), vector in zip(batch, vectors):
+                    self._inflight.pop(key, None)
+                    if self.cache_size > 0:
+                        self._cache[key] = list(vector)
+                        self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            for (_, _, future), vector in zip(batch, vectors):
+                future.set_result(list(vector))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "batches": self.batches,
+            "avg_batch_size": self.batched_queries / self.batches if self.batches else 0.0,
+        }
@@ -0,0 +1,79 @@
+"""
+Offline stand-ins shared by the tests and benchmark.py: hash embeddings in
+place of the bge-small model and a minimal PDF writer for ingestion inputs.
+"""
+import time
+import hashlib
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic 384-d unit vectors derived from the text hash, optionally
+    with a fixed CPU cost per text. Counts the texts it embeds, so tests can
+    assert what was (not) re-embedded.
+    """
+    cost = 0.0  # seconds of busy CPU per text
+
+    def __init__(self, model_name=None, model_kwargs=None, encode_kwargs=None):
+        self.embedded = 0
+
+    @staticmethod
+    def vector(text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(384)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _burn(self, count):
+        deadline = time.perf_counter() + self.cost * count
+        while time.perf_counter() < deadline:
+            pass
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        self._burn(len(texts))
+        return [self.vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """
+    Minimal text-only PDF writer; pages is a list of lists of lines.
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    next_id = 4
+    for lines in pages:
+        body = b" ".join(b"(" + _pdf_escape(line).encode("latin-1", "replace") + b") '" for line in lines)
+        stream = b"BT /F1 9 Tf 40 800 Td 11 TL " + body + b" ET"
+        objects[next_id] = (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (next_id + 1)
+        )
+        objects[next_id + 1] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+        kids.append(next_id)
+        next_id += 2
+    objects[2] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % kid for kid in kids) + b"] /Count %d >>" % len(kids)
+
+    data = b"%PDF-1.4\n"
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(data)
+        data += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for number in sorted(objects):
+        data += b"%010d 00000 n \n" % offsets[number]
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(data)
@@ -0,0 +1,239 @@
+import os
+import time
+import queue
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = int(os.getenv("INGEST_PARSE_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "4"))
+
+_STOP = object()
+
+
+def chunk_id(source: str, text: str, occurrence: int) -> str:
+    """
+    Deterministic chunk id: the same text in the same file always maps to the same id.
+    """
+    digest = hashlib.sha256(f"{source}\0{occurrence}\0{text}".encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def count_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def parse_pages(path: str, start: int, end: int):
+    """
+    Extracts the text of pages [start, end). Runs inside the parser processes.
+    """
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+class IngestionStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pages = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.written = 0
+
+    def report(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "seconds": round(elapsed, 3),
+            "pages": self.pages,
+            "chunks": self.chunks,
+            "embeddings": self.embeddings,
+            "written": self.written,
+            "pages_per_s": round(self.pages / elapsed, 1),
+            "chunks_per_s": round(self.chunks / elapsed, 1),
+            "embeddings_per_s": round(self.embeddings / elapsed, 1),
+        }
+
+
+class IngestionPipeline:
+    """
+    Streaming PDF -> chunks -> embeddings -> Chroma pipeline.
+
+    Page ranges are parsed in a process pool, chunked per page as results
+    arrive (in submission order, so chunk ids stay deterministic), embedded in
+    fixed-size batches on one thread and written in bounded batches on
+    another. Every hand-off is a bounded queue, so a slow stage stalls the
+    ones before it and memory stays flat regardless of corpus size.
+    `page_sink(source, page, text)`, if given, sees every page in order, and
+    `chunk_metadata` is stored with every new chunk.
+    """
+    def __init__(self, embeddings, vector_db, text_splitter, progress=None,
+                 parse_workers=PARSE_WORKERS, pages_per_task=PAGES_PER_TASK,
+                 embed_batch_size=EMBED_BATCH_SIZE, write_batch_size=256,
+                 queue_depth=QUEUE_DEPTH, page_sink=None, chunk_metadata=None):
+        self.embeddings = embeddings
+        self.vector_db = vector_db
+        self.text_splitter = text_splitter
+        self.progress = progress
+        self.parse_workers = max(parse_workers, 1)
+        self.pages_per_task = max(pages_per_task, 1)
+        self.embed_batch_size = max(embed_batch_size, 1)
+        self.write_batch_size = max(write_batch_size, 1)
+        self.queue_depth = max(queue_depth, 1)
+        self.page_sink = page_sink
+        self.chunk_metadata = dict(chunk_metadata or {})
+        self.stats = IngestionStats()
+        self._errors = []
+
+    def run(self, files):
+        """
+        files: iterable of (source, path, existing_chunk_ids). Chunks whose id
+        is already stored are not re-embedded. Returns {source: [chunk ids]}.
+        """
+        tasks = []
+        for source, path, existing_ids in files:
+            pages = count_pages(path)
+            for start in range(0, pages, self.pages_per_task):
+                tasks.append((source, path, existing_ids, start, min(start + self.pages_per_task, pages)))
+        total_pages = sum(end - start for _, _, _, start, end in tasks)
+
+        embed_queue = queue.Queue(maxsize=self.queue_depth)
+        write_queue = queue.Queue(maxsize=self.queue_depth)
+        embedder = threading.Thread(target=self._embed_stage, args=(embed_queue, write_queue), name="ingest-embed")
+        writer = threading.Thread(target=self._write_stage, args=(write_queue,), name="ingest-write")
+        embedder.start()
+        writer.start()
+
+        results = {}
+        try:
+            self._parse_stage(tasks, total_pages, embed_queue, results)
+        finally:
+            embed_queue.put(_STOP)
+            embedder.join()
+            writer.join()
+
+        if self._errors:
+            raise self._errors[0]
+        logger.info(f'Ingestion throughput: {self.stats.report()}')
+        return results
+
+    def _report(self, stage, done, total):
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    def _parse_stage(self, tasks, total_pages, embed_queue, results):
+        occurrences = {}
+        batch = []
+
+        def consume(task, texts):
+            source, _, existing_ids, start, _ = task
+            ids = results.setdefault(source, [])
+            seen = occurrences.setdefault(source, {})
+            for offset, text in enumerate(texts):
+                if self.page_sink is not None:
+                    self.page_sink(source, start + offset, text)
+                page = Document(page_content=text, metadata={"source": source, "page": start + offset, **self.chunk_metadata})
+                for doc in self.text_splitter.split_documents([page]):
+                    occurrence = seen.get(doc.page_content, 0)
+                    seen[doc.page_content] = occurrence + 1
+                    doc_id = chunk_id(source, doc.page_content, occurrence)
+                    ids.append(doc_id)
+                    self.stats.chunks += 1
+                    if doc_id not in existing_ids:
+                        batch.append((doc_id, doc))
+                    if len(batch) >= self.embed_batch_size:
+                        self._put(embed_queue, list(batch))
+                        batch.clear()
+            self.stats.pages += len(texts)
+            self._report("parsing", self.stats.pages, total_pages)
+
+        # small uploads are not worth spawning processes for
+        if len(tasks) <= 1 or self.parse_workers == 1:
+            for task in tasks:
+                consume(task, parse_pages(task[1], task[3], task[4]))
+        else:
+            workers = min(self.parse_workers, len(tasks))
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                pending = deque()
+                remaining = iter(tasks)
+                for task in remaining:
+                    pending.append((task, pool.submit(parse_pages, task[1], task[3], task[4])))
+                    # bounded window of parsed-but-unconsumed pages
+                    if len(pending) >= workers * 2:
+                        break
+                while pending:
+                    task, future = pending.popleft()
+                    consume(task, future.result())
+                    next_task = next(remaining, None)
+                    if next_task is not None:
+                        pending.append((next_task, pool.submit(parse_pages, next_task[1], next_task[3], next_task[4])))
+
+        if batch:
+            self._put(embed_queue, list(batch))
+
+    def _put(self, target, item):
+        if self._errors:
+            raise self._errors[0]
+        target.put(item)
+
+    def _embed_stage(self, embed_queue, write_queue):
+        try:
+            while True:
+                batch = embed_queue.get()
+                if batch is _STOP:
+                    break
+                if self._errors:
+                    continue
+                vectors = self.embeddings.embed_documents([doc.page_content for _, doc in batch])
+                self.stats.embeddings += len(vectors)
+                write_queue.put((batch, vectors))
+        except Exception as e:
+            self._errors.append(e)
+            # keep draining so the parser never blocks on a full queue
+            while embed_queue.get() is not _STOP:
+                pass
+        finally:
+            write_queue.put(_STOP)
+
+    def _write_stage(self, write_queue):
+        pending_docs = []
+        pending_vectors = []
+
+        def flush():
+            self.vector_db._collection.upsert(
+                ids=[doc_id for doc_id, _ in pending_docs],
+                embeddings=pending_vectors,
+                documents=[doc.page_content for _, doc in pending_docs],
+                metadatas=[doc.metadata for _, doc in pending_docs]
+            )
+            self.stats.written += len(pending_docs)
+            self._report("writing", self.stats.written, self.stats.chunks)
+            pending_docs.clear()
+            pending_vectors.clear()
+
+        try:
+            while True:
+                item = write_queue.get()
+                if item is _STOP:
+                    break
+                if self._errors:
+                    continue
+                batch, vectors = item
+                pending_docs.extend(batch)
+                pending_vectors.extend(vectors)
+                if len(pending_docs) >= self.write_batch_size:
+                    flush()
+            if pending_docs and not self._errors:
+                flush()
+        except Exception as e:
+            self._errors.append(e)
+            while write_queue.get() is not _STOP:
+                pass
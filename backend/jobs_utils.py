@@ -0,0 +1,101 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from chromadb_utils import run_ingestion
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "8"))
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IngestionJobs:
+    """
+    Runs run_ingestion as background jobs on a bounded worker pool, off the
+    event loop, and keeps their status and progress for the admin API.
+    """
+    def __init__(self, max_workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING,
+                 history=INGEST_JOB_HISTORY):
+        self.max_pending = max_pending
+        self.history = history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestion")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active_count(self):
+        return sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+
+    def submit(self, data_path: str, filename: str = None, remove=()):
+        with self._lock:
+            if self._active_count() >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} ingestion jobs already pending")
+
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "filename": filename,
+                "remove": list(remove),
+                "status": "queued",
+                "stage": None,
+                "done": 0,
+                "total": 0,
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            # forget the oldest finished jobs
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]["status"] in ("queued", "running"):
+                    break
+                self._jobs.pop(oldest)
+
+        self._executor.submit(self._run, job_id, data_path, remove)
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, data_path, remove):
+        self._update(job_id, status="running", started_at=time.time())
+
+        def progress(stage, done, total):
+            self._update(job_id, stage=stage, done=done, total=total)
+
+        try:
+            result = run_ingestion(data_path, progress=progress, remove=remove)
+            self._update(job_id, status="succeeded", result=result, finished_at=time.time())
+            logger.info(f'Ingestion job {job_id} finished: {result}')
+        except Exception as e:
+            self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+            logger.error(f'Ingestion job {job_id} failed: {e}')
+
+    def shutdown(self):
+        """
+        Drops queued jobs and waits for the running one to finish.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] == "queued":
+                    job["status"] = "cancelled"
+
+
+ingestion_jobs = IngestionJobs()
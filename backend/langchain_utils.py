@@ -3,35 +3,69 @@ import os, re
 from langchain.tools import tool
 from langchain_groq import ChatGroq
 from langchain_mistralai import ChatMistralAI
-from langchain.chains import create_history_aware_retriever, create_retrieval_chain
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from sqldb_utils import insert_application_logs
 from sqldb_utils import get_chat_history
 from chromadb_utils import get_chroma
+from chromadb_utils import get_corpus_version
+from chromadb_utils import get_corpus_generation
+from chromadb_utils import get_corpus_chunk_ids
+from chromadb_utils import generation_filter
+from chromadb_utils import load_clause_index
+from chromadb_utils import register_ingestion_listener
+from cache_utils import SemanticAnswerCache
+from rerank_utils import CrossEncoderReranker
+from rewrite_utils import QuestionRewriter
+from prompt_utils import ConversationSummarizer, context_budget, fit_documents, truncate_tokens
+from prompt_utils import PROMPT_TOKEN_BUDGET, PROMPT_OVERHEAD_TOKENS
+from artifact_utils import ClauseArtifactStore
+from provider_utils import RoutedChatModel
+from metrics_utils import span, current_trace, TraceHandler
+from retrieval_utils import BM25Index, HybridRetriever, HYBRID_SEARCH
+from router_utils import CHECKLIST, SOP, OUT_OF_SCOPE
+from router_utils import out_of_scope_reply
 from langchain.agents import initialize_agent, AgentType
 from langchain.callbacks.base import BaseCallbackHandler
-from langchain.schema.agent import AgentFinish
 import logging
 import asyncio
+import contextvars
+import time
+from functools import lru_cache
 
 logger  = logging.getLogger(__name__)
 
-def get_llm():
-    try:
-        return ChatGroq(
-        model_name="llama-3.1-8b-instant",
-        groq_api_key=groq_api_key,
-        temperature = 0.0,
-        streaming = True
-        )
-    except Exception as e:
-        logging.error(f'Groq Initialization failed: {e}')
-        return ChatMistralAI(
-            model="mistral-small-3.1", 
+LLM_REQUEST_TIMEOUT = int(os.getenv("LLM_REQUEST_TIMEOUT", "60"))
+AGENT_VERBOSE = os.getenv("AGENT_VERBOSE", "0") == "1"  # prints every agent step to stdout
+
+@lru_cache(maxsize=1)
+def get_providers():
+    """
+    One client per provider, in failover order. Retries are left to
+    RoutedChatModel, which fails over instead of retrying a struggling provider.
+    """
+    return [
+        ('groq', ChatGroq(
+            model_name="llama-3.1-8b-instant",
+            groq_api_key=groq_api_key,
+            temperature = 0.0,
+            streaming = True,
+            max_retries=0,
+            request_timeout=LLM_REQUEST_TIMEOUT
+        )),
+        ('mistral', ChatMistralAI(
+            model="mistral-small-3.1",
+            api_key=mistral_api_key,
             temperature=0.0,
-            streaming = True
-        )
+            streaming = True,
+            max_retries=0,
+            timeout=LLM_REQUEST_TIMEOUT
+        )),
+    ]
+
+def get_llm():
+    return RoutedChatModel(providers=get_providers())
 
 template = ChatPromptTemplate.from_messages(
     [
@@ -45,14 +79,66 @@ template = ChatPromptTemplate.from_messages(
     ]
 )
 
-vectorDB = get_chroma()
-retriever = vectorDB.as_retriever(search_kwargs = {'k' : 2})
-history_aware_retriever = create_history_aware_retriever(
-    llm=get_llm(),
-    retriever=retriever,
-    prompt=template
+class RetrievalSnapshot:
+    """
+    Vector store, retrievers and clause index for one corpus version. Replaced as a whole
+    after ingestion so in-flight requests keep the snapshot they started with; searches
+    only see the chunks of the corpus generation it was built for. The BM25 index is
+    derived from the previous snapshot's with the chunks added and retired since.
+    """
+    def __init__(self, vector_db, previous=None):
+        self.vector_db = vector_db
+        self.generation = get_corpus_generation()
+        self.filter = generation_filter(self.generation)
+        self.lexical_index = self._lexical_index(previous) if HYBRID_SEARCH else None
+        self.retriever = HybridRetriever(vector_db=vector_db, lexical_index=self.lexical_index, filter=self.filter)
+        self.clause_index = load_clause_index()
+        self.corpus_version = get_corpus_version()
+
+    def _lexical_index(self, previous):
+        if (previous is None or previous.lexical_index is None or previous.vector_db is not self.vector_db
+                or previous.generation is None or self.generation is None):
+            return BM25Index.from_vector_db(self.vector_db, where=self.filter)
+        corpus = get_corpus_chunk_ids()
+        indexed = set(previous.lexical_index.ids)
+        return previous.lexical_index.updated(self.vector_db, corpus - indexed, indexed - corpus)
+
+_snapshot = RetrievalSnapshot(get_chroma())
+
+def get_retrieval_snapshot() -> RetrievalSnapshot:
+    return _snapshot
+
+def refresh_retrieval_snapshot(corpus_version: str = None):
+    global _snapshot
+    # a single reference assignment, so readers see either the old or the new snapshot
+    _snapshot = RetrievalSnapshot(get_chroma(), previous=_snapshot)
+    logger.info(f'Retrieval snapshot swapped to corpus version {_snapshot.corpus_version}')
+
+# one client per provider/config, shared by every chain so HTTP keep-alive connections are reused
+llm = get_llm()
+
+rephrase_chain = template | llm | StrOutputParser()
+question_rewriter = QuestionRewriter()
+
+summary_prompt = ChatPromptTemplate.from_messages([
+    ("system", '''
+    You maintain a running summary of a conversation between a laboratory user and an ISO 15189 assistant.
+    Update the summary with the new turns. Keep clause numbers, the user's laboratory context, decisions
+    and open requests; drop greetings and the full text of answers. Reply with the summary only,
+    in at most 150 words.
+    '''),
+    ("human", "Current summary:\n{summary}\n\nNew turns:\n{turns}"),
+])
+summary_chain = summary_prompt | llm | StrOutputParser()
+conversation_summarizer = ConversationSummarizer(
+    lambda summary, turns: summary_chain.invoke({'summary': summary or '(none)', 'turns': turns})
 )
 
+answer_cache = SemanticAnswerCache()
+register_ingestion_listener(answer_cache.invalidate)
+reranker = CrossEncoderReranker()
+register_ingestion_listener(refresh_retrieval_snapshot)
+
 qa_prompt = ChatPromptTemplate.from_messages([
     ("system", """You are an ISO 15189 expert assistant. Your job is to answer questions and create outputs 
 strictly using the retrieved context provided from the RAG pipeline.  
@@ -78,57 +164,166 @@ Answer the user questions based on the following context: {context}
 ])
 
 qa_chain = create_stuff_documents_chain(
-    llm=get_llm(),
+    llm=llm,
     prompt=qa_prompt
 )
 
-retrieval_chain = create_retrieval_chain(
-    retriever=history_aware_retriever,
-    combine_docs_chain=qa_chain
-)
+def _answer_config(config) -> dict:
+    """
+    Tags the user-facing LLM call so DummyHandler streams it, when the caller
+    asked for it with configurable['stream_answer'].
+    """
+    config = config or {}
+    answer_config = {'callbacks': config.get('callbacks')}
+    if config.get('configurable', {}).get('stream_answer'):
+        answer_config['tags'] = [FINAL_LLM_TAG]
+    return answer_config
 
-model = get_llm()
-def make_rag_answer_tool(session_id: str):
-    @tool('rag_answer')
-    def rag_answer(question: str):
-        """
-        Answer ISO 15189 questions using the RAG pipeline.
-        Args:
-          question: the user's question
-        Returns:
-          answer text string
-        """
-        chat_history = get_chat_history(session_id)
-        result = retrieval_chain.invoke(
-          {
-            'input': question,
-            'chat_history': chat_history
-          }
+def _inner_config(config) -> dict:
+    """
+    Same request config for intermediate steps, without answer streaming.
+    """
+    config = dict(config or {})
+    config['configurable'] = {**config.get('configurable', {}), 'stream_answer': False}
+    return config
+
+def _request_callbacks(handler=None) -> list:
+    """
+    Callbacks for one request: the streaming handler, if any, plus a
+    TraceHandler when a trace is active (see metrics_utils.start_trace).
+    """
+    callbacks = [handler] if handler else []
+    trace = current_trace()
+    if trace is not None:
+        callbacks.append(TraceHandler(trace))
+    return callbacks
+
+def get_standalone_question(question: str, chat_history) -> str:
+    """
+    Rewrites a follow-up into a standalone question. First turns and
+    self-contained follow-ups pass through without an LLM call.
+    """
+    return question_rewriter.rewrite(
+        question,
+        chat_history,
+        lambda: rephrase_chain.invoke(
+            {'input': question, 'chat_history': chat_history},
+            config = {'callbacks': _request_callbacks()}
         )
-        answer = result['answer'] if isinstance(result, dict) else str(result)
+    )
 
-        return {'output': answer}
-    return rag_answer
+def _search(snapshot, question: str, chat_history, standalone_question: str, embedding) -> list:
+    """
+    Hybrid search, optional rerank, trimmed to the prompt's context budget.
+    """
+    if reranker.enabled:
+        # over-fetch, then keep only the chunks the cross-encoder ranks best
+        with span("retrieval"):
+            candidates = snapshot.retriever.search_by_vector(standalone_question, embedding, k=reranker.fetch_n)
+        with span("rerank"):
+            context = reranker.rerank(standalone_question, candidates)
+    else:
+        with span("retrieval"):
+            context = snapshot.retriever.search_by_vector(standalone_question, embedding)
+    return fit_documents(context, context_budget(question, chat_history))
+
+def retrieve_context(question: str, snapshot) -> list:
+    """
+    The context cached_retrieval would answer a question without history
+    from, without the QA call or the answer cache.
+    """
+    clause_number = snapshot.clause_index.resolve(question)
+    if clause_number is not None:
+        with span("clause_lookup"):
+            return fit_documents(snapshot.clause_index.documents(clause_number), context_budget(question, []))
+    with span("embed"):
+        embedding = snapshot.vector_db.embeddings.embed_query(question)
+    return _search(snapshot, question, [], question, embedding)
+
+def answer_from_context(question: str, context, config=None) -> str:
+    """
+    QA over an already retrieved context, for a question without history.
+    """
+    with span("qa"):
+        return qa_chain.invoke(
+            {'input': question, 'chat_history': [], 'context': context},
+            config = _answer_config(config)
+        )
 
-def make_create_checklist(session_id: str):
-    @tool('create_checklist')
-    def create_checklist(question: str):
-        """
-        Converts retrieved ISO 15189 text into a practical checklist 
-        using LLM + retrieval pipeline.
-        """
-        chat_history = get_chat_history(session_id)
-        retrieved = retrieval_chain.invoke(
-            {"input": question, "chat_history": chat_history}
+def cached_retrieval(inputs: dict, config: RunnableConfig) -> dict:
+    """
+    History-aware retrieval + QA with a semantic answer cache keyed on the
+    standalone question. Returns the same keys as create_retrieval_chain.
+    Uses the snapshot passed in config['configurable'], else the current one.
+    Only turns without history use the cache: otherwise the session's history
+    is in the QA prompt and shapes the answer, which must not leak to other
+    sessions asking a similar question.
+    """
+    snapshot = config.get('configurable', {}).get('snapshot') or get_retrieval_snapshot()
+    vectorDB = snapshot.vector_db
+    question = inputs['input']
+    chat_history = inputs.get('chat_history') or []
+    start = time.perf_counter()
+
+    clause_number = snapshot.clause_index.resolve(question)
+    if clause_number is not None:
+        # an unambiguous clause reference needs neither the rewrite nor vector search.
+        # Not cached: "7.3.6" and "7.3.7" questions embed within the cache threshold
+        logger.info(f'Clause lookup {clause_number} for: {question}')
+        with span("clause_lookup"):
+            context = fit_documents(
+                snapshot.clause_index.documents(clause_number),
+                context_budget(question, chat_history)
+            )
+        with span("qa"):
+            answer = qa_chain.invoke(
+                {**inputs, 'chat_history': chat_history, 'context': context},
+                config = _answer_config(config)
+            )
+        return {**inputs, 'context': context, 'answer': answer}
+
+    with span("rewrite"):
+        standalone_question = get_standalone_question(question, chat_history)
+    with span("embed"):
+        embedding = vectorDB.embeddings.embed_query(standalone_question)
+    corpus_version = snapshot.corpus_version
+    cacheable = not chat_history
+
+    if cacheable:
+        with span("cache.lookup"):
+            cached = answer_cache.lookup(embedding, corpus_version)
+        if cached is not None:
+            logger.info(f'Answer cache hit for: {standalone_question}')
+            context = vectorDB.get_by_ids(cached['source_ids']) if cached['source_ids'] else []
+            return {**inputs, 'context': context, 'answer': cached['answer']}
+
+    context = _search(snapshot, question, chat_history, standalone_question, embedding)
+    with span("qa"):
+        answer = qa_chain.invoke(
+            {**inputs, 'chat_history': chat_history, 'context': context},
+            config = _answer_config(config)
         )
 
-        retrieved_text = (
-            retrieved.get("answer") 
-            if isinstance(retrieved, dict) 
-            else str(retrieved)
+    if cacheable:
+        answer_cache.store(
+            standalone_question,
+            embedding,
+            answer,
+            [doc.id for doc in context if doc.id],
+            corpus_version,
+            (time.perf_counter() - start) * 1000
         )
-        
-        prompt = f"""
+    return {**inputs, 'context': context, 'answer': answer}
+
+retrieval_chain = RunnableLambda(cached_retrieval)
+
+model = llm
+sop_llm = RoutedChatModel(providers=[
+    ('mistral', ChatMistralAI(model="mistral-tiny", temperature=0, api_key=mistral_api_key, max_retries=0, timeout=LLM_REQUEST_TIMEOUT)),
+    get_providers()[0],
+])
+
+CHECKLIST_PROMPT = """
         You are an ISO 15189 Internal Audit Checklist generator.  
         Your task is to convert the following standard text into a practical checklist.  
 
@@ -143,15 +338,111 @@ def make_create_checklist(session_id: str):
 
         Checklist:
         """
-        raw_output = model.invoke(prompt)
 
-        # make sure we only store string content
-        checklist_text = raw_output.content if hasattr(raw_output, "content") else str(raw_output)
+def generate_checklist(question: str, chat_history, config=None) -> str:
+    """
+    Retrieval + QA, then converts the grounded answer into an audit checklist.
+    """
+    retrieved = retrieval_chain.invoke(
+        {"input": question, "chat_history": chat_history},
+        config = _inner_config(config)
+    )
+
+    retrieved_text = (
+        retrieved.get("answer") 
+        if isinstance(retrieved, dict) 
+        else str(retrieved)
+    )
+    return checklist_from_answer(retrieved_text, config)
 
-        return {'output': checklist_text}
-    return create_checklist
+def checklist_from_answer(retrieved_text: str, config=None) -> str:
+    """
+    Converts a grounded answer into an audit checklist.
+    """
+    raw_output = model.invoke(
+        CHECKLIST_PROMPT.format(retrieved_text=truncate_tokens(retrieved_text, PROMPT_TOKEN_BUDGET - PROMPT_OVERHEAD_TOKENS)),
+        config = _answer_config(config)
+    )
 
-@tool('final_answer')
+    # make sure we only store string content
+    return raw_output.content if hasattr(raw_output, "content") else str(raw_output)
+
+def format_sop_text(raw_text: str, config=None) -> str:
+    response = sop_llm.invoke(
+        f"Format the following draft into a professional SOP:\n\n{truncate_tokens(raw_text, PROMPT_TOKEN_BUDGET - PROMPT_OVERHEAD_TOKENS)}",
+        config = _answer_config(config)
+    )
+    return response.content
+
+def _clause_checklist(number: str, snapshot) -> str:
+    return generate_checklist(
+        f"Create an audit checklist for clause {number}", [],
+        {'configurable': {'snapshot': snapshot}}
+    )
+
+def _clause_sop(number: str, snapshot) -> str:
+    config = {'configurable': {'snapshot': snapshot}}
+    retrieved = retrieval_chain.invoke(
+        {'input': f"Write an SOP for clause {number}", 'chat_history': []},
+        config = config
+    )
+    return format_sop_text(retrieved['answer'], config)
+
+# built by the same chains as live requests, so stored and live output match
+clause_artifacts = ClauseArtifactStore({CHECKLIST: _clause_checklist, SOP: _clause_sop})
+register_ingestion_listener(lambda version: clause_artifacts.schedule(get_retrieval_snapshot()))
+
+# The legacy AgentExecutor does not forward config to tools, so agent runs
+# carry their per-request configurable through this context variable instead.
+_agent_request = contextvars.ContextVar('agent_request', default={})
+
+def _request_state(config: RunnableConfig):
+    """
+    Per-request session id, history and snapshot passed via config['configurable'].
+    """
+    configurable = (config or {}).get('configurable') or _agent_request.get()
+    session_id = configurable.get('session_id')
+    chat_history = configurable.get('chat_history')
+    if chat_history is None:
+        chat_history = get_chat_history(session_id) if session_id else []
+    return chat_history, {'configurable': {'snapshot': configurable.get('snapshot')}}
+
+@tool('rag_answer')
+def rag_answer(question: str, config: RunnableConfig):
+    """
+    Answer ISO 15189 questions using the RAG pipeline.
+    Args:
+      question: the user's question
+    Returns:
+      answer text string
+    """
+    chat_history, retrieval_config = _request_state(config)
+    result = retrieval_chain.invoke(
+      {
+        'input': question,
+        'chat_history': chat_history
+      },
+      config = retrieval_config
+    )
+    answer = result['answer'] if isinstance(result, dict) else str(result)
+
+    return {'output': answer}
+
+@tool('create_checklist')
+def create_checklist(question: str, config: RunnableConfig):
+    """
+    Converts retrieved ISO 15189 text into a practical checklist 
+    using LLM + retrieval pipeline.
+    """
+    chat_history, retrieval_config = _request_state(config)
+    snapshot = retrieval_config['configurable']['snapshot'] or get_retrieval_snapshot()
+    checklist_text = clause_artifacts.lookup(CHECKLIST, question, snapshot)
+    if checklist_text is None:
+        checklist_text = generate_checklist(question, chat_history, config = retrieval_config)
+
+    return {'output': checklist_text}
+
+@tool('final_answer', return_direct=True)
 def final_answer(answer: str):
     """
     Provide the final answer to the user. Use this tool IMMEDIATELY after getting information from rag_answer or create_checklist.
@@ -169,78 +460,134 @@ def format_sop(raw_text: str) -> str:
     polished, structured SOP according to ISO 15189 style.
     Always include Purpose, Scope, Responsibilities, Procedure, and References sections.
     """
-    llm = ChatMistralAI(model="mistral-tiny", temperature=0)
-    response = llm.invoke(f"Format the following draft into a professional SOP:\n\n{raw_text}")
-    return response.content
+    return format_sop_text(raw_text)
+
+def run_fast_path(intent: str, question: str, chat_history, handler=None) -> dict:
+    """
+    Runs the chain for a classified intent directly, without the agent.
+    The user-facing LLM call is streamed through handler.
+    """
+    if intent == OUT_OF_SCOPE:
+        return {'output': out_of_scope_reply(question)}
+
+    snapshot = get_retrieval_snapshot()
+    if intent in (CHECKLIST, SOP):
+        precomputed = clause_artifacts.lookup(intent, question, snapshot)
+        if precomputed is not None:
+            return {'output': precomputed}
+
+    config = {
+        'callbacks': _request_callbacks(handler),
+        'configurable': {'snapshot': snapshot, 'stream_answer': True},
+    }
+    if intent == CHECKLIST:
+        return {'output': generate_checklist(question, chat_history, config)}
+
+    if intent == SOP:
+        retrieved = retrieval_chain.invoke(
+            {'input': question, 'chat_history': chat_history},
+            config = _inner_config(config)
+        )
+        return {'output': format_sop_text(retrieved['answer'], config)}
+
+    result = retrieval_chain.invoke(
+        {'input': question, 'chat_history': chat_history},
+        config = config
+    )
+    return {'output': result['answer']}
+
 
 
+AGENT_LLM_TAG = 'agent_llm'
+FINAL_LLM_TAG = 'final_llm'
+
+# The conversational agent finishes either with "AI: <answer>" or by calling
+# the final_answer tool, so anything after these markers is user-facing text.
+FINAL_ANSWER_MARKER = re.compile(
+    r"(?:^|\n)\s*AI:|Action:\s*final_answer\s*\n+\s*Action Input:"
+)
 
 class DummyHandler(BaseCallbackHandler):
-    def __init__(self):
-        self.captured_output = ""   # For internal tool output capture
+    """
+    Forwards final-answer tokens from the agent LLM, and from fast-path LLM
+    calls tagged FINAL_LLM_TAG, onto an asyncio queue as they are generated.
+    Tool reasoning and nested chain tokens are dropped.
+
+    Synchronous: the fast path calls it from a worker thread, where an
+    async handler would get a new event loop for every event.
+    """
+    run_inline = True
+
+    def __init__(self, queue: asyncio.Queue = None):
+        self.queue = queue or asyncio.Queue()
         self.final_answer_output = ""  # Only what should go to UI
         self.found_answer = False
-        self.final_answer_called = False
-
-    def on_llm_new_token(self, token: str, **kwargs) -> None:
-        tool_name = kwargs.get("tool_name")
-        # Only append tokens from final_answer tool for streaming
-        if tool_name == "final_answer":
-            self.final_answer_output += token
+        self._loop = asyncio.get_running_loop()
+        self._pending = {}    # run_id -> agent text seen before the marker
+        self._streaming = {}  # run_id -> True until first non-blank token
+
+    def on_llm_new_token(self, token: str, *, run_id, tags=None, **kwargs) -> None:
+        if not tags:
+            return
+
+        # fast-path answers are user-facing from the first token
+        if FINAL_LLM_TAG in tags and run_id not in self._streaming:
+            self._streaming[run_id] = True
+
+        if run_id in self._streaming:
+            self._emit(run_id, token)
+            return
+
+        if AGENT_LLM_TAG not in tags:
+            return
+
+        buffer = self._pending.get(run_id, "") + token
+        match = FINAL_ANSWER_MARKER.search(buffer)
+        if match:
+            self._pending.pop(run_id, None)
+            self._streaming[run_id] = True
+            self._emit(run_id, buffer[match.end():])
         else:
-            self.captured_output += token
-
-    def on_tool_end(self, output, **kwargs) -> None:
-        tool_name = kwargs.get("tool_name")
-        
-        # Mark if a final_answer tool was called
-        if tool_name == "final_answer":
-            self.final_answer_called = True
-            if isinstance(output, dict) and "output" in output:
-                self.final_answer_output += output["output"]
-            else:
-                self.final_answer_output += str(output)
-        else:
-            # Capture other tool outputs (rag_answer / format_sop)
-            if isinstance(output, dict) and "output" in output:
-                self.captured_output += output["output"]
-            else:
-                self.captured_output += str(output)
-
-def get_streaming_llm(callbacks = None):
-    try:
-        return ChatGroq(
-        model_name="llama-3.1-8b-instant",
-        groq_api_key=groq_api_key,
-        temperature = 0.0,
-        streaming = True,
-        max_retries=1,
-        request_timeout=100,
-        callbacks = callbacks or []
-        )
-    except Exception as e:
-        logging.error(f'Groq Initialization failed: {e}')
-        return ChatMistralAI(
-            model="mistral-small-3.1", 
-            temperature=0.0,
-            streaming = True,
-            max_retries=1,
-            request_timeout=100,
-            callbacks = callbacks or []
-        )
+            self._pending[run_id] = buffer
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._pending.pop(run_id, None)
+        self._streaming.pop(run_id, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._pending.pop(run_id, None)
+        self._streaming.pop(run_id, None)
 
+    def _emit(self, run_id, text: str) -> None:
+        if self._streaming[run_id]:
+            text = text.lstrip()
+            if not text:
+                return
+            self._streaming[run_id] = False
+        elif not text:
+            # e.g. the final chunk carrying only the finish reason
+            return
 
-def get_chat_agent(session_id: str, handler):
-    rag_tool = make_rag_answer_tool(session_id)
-    checklist_tool = make_create_checklist(session_id)
+        self.found_answer = True
+        self.final_answer_output += text
+        # tokens may arrive from a worker thread when tools run synchronously
+        self._loop.call_soon_threadsafe(self.queue.put_nowait, text)
 
-    streaming_model = get_streaming_llm(callbacks = [handler])
+def get_streaming_llm():
+    return RoutedChatModel(providers=get_providers(), tags=[AGENT_LLM_TAG])
 
+
+@lru_cache(maxsize=1)
+def get_chat_agent():
+    """
+    Builds the agent once. Session id, history, snapshot and the streaming
+    handler are supplied per request through get_agent_config.
+    """
     agent = initialize_agent(
-        tools=[rag_tool, checklist_tool, final_answer, format_sop],
-        llm=streaming_model,
+        tools=[rag_answer, create_checklist, final_answer, format_sop],
+        llm=get_streaming_llm(),
         agent=AgentType.CONVERSATIONAL_REACT_DESCRIPTION,
-        verbose=True,
+        verbose=AGENT_VERBOSE,
         return_intermediate_steps=False,
         max_iterations=3,
         early_stopping_method="generate",
@@ -272,7 +619,33 @@ CRITICAL formatting rules:
 4. Provide ONLY the HELPFUL, formatted answer directly.
 5. STOP immediately after giving the final answer.  
 """
-        },
-        callbacks = [handler]
+        }
     )
-    return agent
\ No newline at end of file
+    return agent
+
+def get_agent_config(session_id: str, handler, chat_history=None) -> dict:
+    """
+    Per-request config for get_chat_agent(): the history fetched by the
+    caller and the current corpus snapshot are shared with the tools.
+    """
+    return {
+        'callbacks': _request_callbacks(handler),
+        'configurable': {
+            'session_id': session_id,
+            'chat_history': chat_history,
+            'snapshot': get_retrieval_snapshot(),
+        },
+    }
+
+async def arun_chat_agent(question: str, chat_history, config: dict) -> dict:
+    """
+    Runs the shared agent with a per-request config from get_agent_config.
+    """
+    _agent_request.set(config.get('configurable', {}))
+    return await get_chat_agent().ainvoke(
+        {
+            'input': question,
+            'chat_history': chat_history
+        },
+        config = config
+    )
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import copy
+import json
+import queue
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from metrics_utils import Counter, current_trace
+
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # 'json' or 'text'
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "size")  # 'size', or a TimedRotatingFileHandler 'when' such as 'midnight'
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))  # share of chatty INFO/DEBUG records kept
+LOG_SAMPLED_LOGGERS = tuple(
+    name.strip() for name in os.getenv("LOG_SAMPLED_LOGGERS", "httpx,httpcore,langchain,langchain_core,langchain_community").split(",")
+    if name.strip()
+)
+
+log_records_dropped = Counter("log_records_dropped_total", "Log records not written, by reason", ("reason",))
+
+# attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger, message, the session id
+    when known, and any fields passed with extra= (e.g. stage timings).
+    """
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a share of the INFO/DEBUG records of chatty third-party loggers
+    (one line per HTTP call or chain step); warnings and errors always pass.
+    """
+    def __init__(self, loggers=LOG_SAMPLED_LOGGERS, rate=LOG_SAMPLE_RATE):
+        super().__init__()
+        self.loggers = loggers
+        self.rate = rate
+        self._sampled = {}  # logger name -> bool, the prefix match runs once per logger
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        sampled = self._sampled.get(record.name)
+        if sampled is None:
+            sampled = self._sampled[record.name] = any(
+                record.name == name or record.name.startswith(name + ".") for name in self.loggers
+            )
+        if not sampled or random.random() < self.rate:
+            return True
+        log_records_dropped.inc(reason="sampled")
+        return False
+
+
+class ContextFilter(logging.Filter):
+    """
+    Stamps records with the session id of the current request trace. Runs
+    on the calling thread, where the trace context variable is visible.
+    """
+    def filter(self, record):
+        if getattr(record, "session_id", None) is None:
+            trace = current_trace()
+            if trace is not None:
+                record.session_id = trace.session_id
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the writer thread. The caller only resolves the
+    message and exception text; formatting and file I/O happen on the
+    writer. When the queue is full the record is dropped, never waited on.
+    """
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_records_dropped.inc(reason="queue_full")
+
+
+def _file_handler():
+    if LOG_ROTATE_WHEN == "size":
+        handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    else:
+        handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s:%(name)s:%(message)s"))
+    return handler
+
+
+_lock = threading.Lock()
+_listener = None
+_running = False
+
+
+def setup_logging():
+    """
+    Routes the root logger through a bounded queue to a rotating file
+    written by a background thread. Safe to call again after stop_logging().
+    """
+    global _listener, _running
+    with _lock:
+        if _listener is None:
+            log_queue = queue.Queue(LOG_QUEUE_SIZE)
+            handler = NonBlockingQueueHandler(log_queue)
+            handler.addFilter(SamplingFilter())
+            handler.addFilter(ContextFilter())
+            root = logging.getLogger()
+            root.setLevel(LOG_LEVEL)
+            root.addHandler(handler)
+            _listener = QueueListener(log_queue, _file_handler(), respect_handler_level=True)
+        if not _running:
+            _listener.start()
+            _running = True
+
+
+def stop_logging():
+    """
+    Writes out the queued records and stops the writer thread.
+    """
+    global _running
+    with _lock:
+        if _running:
+            _listener.stop()
+            _running = False
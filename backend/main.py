@@ -1,26 +1,61 @@
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import shutil
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.middleware import SlowAPIMiddleware
-import os, json, re
+import os, json
 import uuid
+import base64
 import logging
+import time
+from logging_utils import setup_logging, stop_logging
+
+# JSON lines to a rotating app.log, written off the request path by a background thread.
+# Set up before the imports below, which already log (retrieval snapshot, providers)
+setup_logging()
+
 from pydantic_utils import QueryInput
+from pydantic_utils import BatchInput
 from chromadb_utils import get_chroma
-from chromadb_utils import run_ingestion
+from chromadb_utils import get_embeddings
+from jobs_utils import ingestion_jobs
+from jobs_utils import JobQueueFull
 from langchain_utils import get_chat_agent
-from sqldb_utils import get_chat_history
+from langchain_utils import get_agent_config
+from langchain_utils import arun_chat_agent
+from langchain_utils import run_fast_path
+from router_utils import classify_intent
+from router_utils import use_fast_path
+from langchain_utils import answer_cache
+from langchain_utils import reranker
+from langchain_utils import question_rewriter
+from langchain_utils import conversation_summarizer
+from langchain_utils import get_retrieval_snapshot
+from langchain_utils import clause_artifacts
+from coalesce_utils import SingleFlight, coalesce_key
+from batch_utils import BatchRunner, BATCH_MAX_ITEMS, BATCH_RATE_LIMIT
+from maintenance_utils import LogMaintenance, iter_log_pages, iter_archived_logs, LOG_EXPORT_PAGE_SIZE
+from provider_utils import provider_stats
+from metrics_utils import start_trace, activate_trace, finish_trace
+from metrics_utils import render_metrics, CHAT_TRACE_EVENTS
+from sqldb_utils import aget_chat_history
 from sqldb_utils import create_application_logs
+from sqldb_utils import create_chat_sessions
+from sqldb_utils import list_chat_sessions
+from sqldb_utils import get_chat_session
+from sqldb_utils import get_session_turns
+from sqldb_utils import delete_chat_session
+from sqldb_utils import create_session_summaries
+from sqldb_utils import create_clause_artifacts
 from sqldb_utils import insert_application_logs
+from sqldb_utils import start_log_writer
+from sqldb_utils import stop_log_writer
 from contextlib import asynccontextmanager
 import asyncio
 from langchain_utils import DummyHandler
 
-logging.basicConfig(filename = 'app.log', level = logging.INFO)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
@@ -28,11 +63,24 @@ async def lifespan(app: FastAPI):
         if chromadb_instance is None:
             logging.info(f'Chroma DB not loaded')
         create_application_logs()
+        create_chat_sessions()
+        create_session_summaries()
+        create_clause_artifacts()
+        start_log_writer()
+        log_maintenance.start()
+        get_chat_agent()
+        reranker.warm_up()
+        # backfills artifacts missing for the current corpus (CLAUSE_ARTIFACTS=1)
+        clause_artifacts.schedule(get_retrieval_snapshot())
         logging.info(f'Application Initialization complete')
     except Exception as e:
         logging.error(f'Error initializing Application: {e}')
     yield
+    await asyncio.to_thread(ingestion_jobs.shutdown)
+    await asyncio.to_thread(log_maintenance.stop)
+    await asyncio.to_thread(stop_log_writer)
     logging.info(f'Application Shutdown')
+    await asyncio.to_thread(stop_logging)
 
 
 def get_proxied_remote_address(request: Request):
@@ -46,6 +94,9 @@ def get_proxied_remote_address(request: Request):
         return get_remote_address(request)
 
 limiter = Limiter(key_func = get_proxied_remote_address)
+inflight = SingleFlight()
+batch_runner = BatchRunner()
+log_maintenance = LogMaintenance()
 
 app = FastAPI(lifespan = lifespan)
 app.state.limiter = limiter
@@ -65,89 +116,325 @@ app.add_middleware(
 @limiter.limit("15/minute")
 async def chat(request: Request, query: QueryInput):
     session_id = query.session_id or str(uuid.uuid4())
+    # started first so every record of this request carries the session id
+    trace = start_trace(session_id)
     logging.info(f"'Session ID': {session_id}, User question: {query.question}")
 
-    chat_history = get_chat_history(session_id)
-    queue = asyncio.Queue()
-    handler = DummyHandler()
-    chat_agent = get_chat_agent(session_id, handler)
+    chat_history = await aget_chat_history(session_id)
+    intent = classify_intent(query.question)
+    logging.info(f"'Session ID': {session_id}, intent: {intent}")
+    path = "fast" if use_fast_path(intent) else "agent"
+
+    async def answer_tokens():
+        """
+        Runs the pipeline for this request and yields the answer tokens.
+        """
+        queue = asyncio.Queue()
+        handler = DummyHandler(queue)
+        if path == "fast":
+            submitted = time.perf_counter()
+
+            def fast_path():
+                trace.queue_wait_ms = round((time.perf_counter() - submitted) * 1000, 2)
+                return run_fast_path(intent, query.question, chat_history, handler)
+
+            agent_task = asyncio.create_task(asyncio.to_thread(fast_path))
+        else:
+            # ambiguous requests (or CHAT_ROUTER_MODE=agent) go through the ReAct agent
+            agent_task = asyncio.create_task(arun_chat_agent(
+                query.question,
+                chat_history,
+                get_agent_config(session_id, handler, chat_history)
+            ))
+        # The sentinel is queued after every token the handler has scheduled
+        agent_task.add_done_callback(lambda _: queue.put_nowait(None))
 
-    async def token_generator():
-        full_answer = ""
         try:
-            yield (json.dumps({"type": "session", "session_id": session_id}) + "\n").encode("utf-8")
+            # Forward final-answer tokens as the agent LLM produces them
+            while True:
+                token = await queue.get()
+                if token is None:
+                    break
+                yield token
 
+            full_response = ""
             try:
-                result = await chat_agent.ainvoke({
-                    'input': query.question,
-                    'chat_history': chat_history
-                })
-                
-                # Try multiple ways to get the answer
-                full_response = ""
-                
-                # Method 1: Check if handler captured tool output
-                if hasattr(handler, 'found_answer') and handler.found_answer:
-                    full_response = handler.final_answer
-                
-                # Method 2: Extract from result
-                elif isinstance(result, dict):
+                result = agent_task.result()
+                if not handler.found_answer and isinstance(result, dict):
                     full_response = result.get('output', '') or result.get('answer', '')
-                
-                # Method 3: Extract from captured output
-                elif hasattr(handler, 'captured_output') and handler.captured_output:
-                    if "Final Answer:" in handler.captured_output:
-                        full_response = handler.captured_output.split("Final Answer:")[-1].strip()
-                    elif "'output':" in handler.captured_output:
-                        # Extract from the observation directly
-                        match = re.search(r"'output':\s*\"([^\"]+)\"", handler.captured_output)
-                        if match:
-                            full_response = match.group(1)
-                
-                # Fallback
-                if not full_response:
+                if not handler.found_answer and not full_response:
                     full_response = "I found information but couldn't format the response properly. Please try again."
-                    
             except Exception as e:
                 full_response = "I encountered an error processing your request. Please try again."
                 logging.error(f"Agent error: {e}")
 
-            # Stream the response
+            # Nothing was streamed (e.g. early stopping), send the answer in one piece
             if full_response:
-                # Split by lines to preserve paragraphs and bullet points
-                for line in full_response.splitlines(keepends=True):
-                    stripped_line = line.strip()
-                    if stripped_line:
-                        # Stream word by word for pseudo-streaming
-                        for word in stripped_line.split():
-                            full_answer += word + " "
-                            yield (json.dumps({"type": "token", "content": word + " "}) + "\n").encode("utf-8")
-                            await asyncio.sleep(0.03)
-                    # Send newline after each line to preserve paragraphs/bullets
-                    full_answer += "\n"
+                yield full_response
+        finally:
+            if not agent_task.done():
+                agent_task.cancel()
+
+    async def token_generator():
+        full_answer = ""
+        activate_trace(trace)
+        if inflight.enabled and not chat_history:
+            # first turns depend on nothing but the question, so identical ones share one run
+            key = coalesce_key(query.question, intent, get_retrieval_snapshot().corpus_version)
+            tokens = inflight.stream(key, answer_tokens)
+        else:
+            tokens = answer_tokens()
+        try:
+            yield (json.dumps({"type": "session", "session_id": session_id}) + "\n").encode("utf-8")
+
+            async for token in tokens:
+                if trace.ttft_ms is None:
+                    trace.ttft_ms = round((time.perf_counter() - trace.started) * 1000, 2)
+                full_answer += token
+                yield (json.dumps({"type": "token", "content": token}) + "\n").encode("utf-8")
 
         except Exception as e:
             logging.error(f"Error: {e}")
         finally:
-            insert_application_logs(session_id, query.question, full_answer)
+            await tokens.aclose()
+            insert_application_logs(session_id, query.question, full_answer, user_id=query.user_id)
+            conversation_summarizer.schedule(session_id)
+            summary = finish_trace(trace, path, intent)
+            # headers are already sent, so the trace travels as a trailing event
+            if CHAT_TRACE_EVENTS or request.headers.get("X-Debug-Trace") == "1":
+                yield (json.dumps({"type": "trace", "trace": summary}) + "\n").encode("utf-8")
             yield (json.dumps({"type": "end"}) + "\n").encode("utf-8")
 
     return StreamingResponse(token_generator(), media_type='application/x-ndjson')
 
 
-DATA_DIR = "./data"
+@app.post('/chat/batch')
+@limiter.limit(BATCH_RATE_LIMIT)
+async def chat_batch(request: Request, batch: BatchInput):
+    """
+    Runs a set of audit questions (answer / checklist / sop) with bounded
+    concurrency and streams one NDJSON result per item as it finishes.
+    Has its own rate limit, separate from interactive /chat.
+    """
+    if not batch.items:
+        raise HTTPException(status_code=422, detail="Batch has no items")
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch exceeds {BATCH_MAX_ITEMS} items")
+    session_id = batch.session_id or str(uuid.uuid4())
+    logging.info(f"'Session ID': {session_id}, batch of {len(batch.items)} items", extra={"session_id": session_id})
+
+    async def result_generator():
+        start = time.perf_counter()
+        failed = 0
+        yield (json.dumps({"type": "session", "session_id": session_id}) + "\n").encode("utf-8")
+        results = batch_runner.run(batch.items, session_id, batch.user_id)
+        try:
+            async for result in results:
+                failed += result["type"] == "error"
+                yield (json.dumps(result) + "\n").encode("utf-8")
+        finally:
+            await results.aclose()
+        yield (json.dumps({
+            "type": "end",
+            "items": len(batch.items),
+            "failed": failed,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }) + "\n").encode("utf-8")
+
+    return StreamingResponse(result_generator(), media_type='application/x-ndjson')
+
+
+SESSION_PAGE_MAX = 100
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        values = None
+    if not isinstance(values, list) or not values:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+@app.get('/sessions')
+async def list_sessions(user_id: str, limit: int = 20, cursor: str = None):
+    """
+    A user's chat sessions, most recently active first, in keyset pages.
+    Pass next_cursor back as cursor for the next page.
+    """
+    limit = max(1, min(limit, SESSION_PAGE_MAX))
+    before = decode_cursor(cursor) if cursor else None
+    sessions = await asyncio.to_thread(list_chat_sessions, user_id, limit, before)
+    next_cursor = None
+    if len(sessions) == limit:
+        next_cursor = encode_cursor(sessions[-1]["last_activity"], sessions[-1]["session_id"])
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+
+@app.get('/sessions/{session_id}/turns')
+async def session_turns(session_id: str, user_id: str, limit: int = 20, cursor: str = None):
+    """
+    One of the user's sessions, its turns newest first, in keyset pages over application_logs ids.
+    """
+    session = await asyncio.to_thread(get_chat_session, session_id)
+    if session is None or session["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    limit = max(1, min(limit, SESSION_PAGE_MAX))
+    before_id = decode_cursor(cursor)[0] if cursor else None
+    turns = await asyncio.to_thread(get_session_turns, session_id, limit, before_id)
+    committed = [turn for turn in turns if turn["id"] is not None]
+    next_cursor = encode_cursor(committed[-1]["id"]) if len(committed) == limit else None
+    return {"session_id": session_id, "turns": turns, "next_cursor": next_cursor}
+
+
+@app.delete('/sessions/{session_id}')
+async def delete_session(session_id: str, user_id: str):
+    """
+    Deletes one of the user's sessions and its history.
+    """
+    session = await asyncio.to_thread(get_chat_session, session_id)
+    if session is None or session["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await asyncio.to_thread(delete_chat_session, session_id)
+    return {"deleted": session_id}
+
 
-@app.post("/admin/upload-doc/")
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+@app.post("/admin/upload-doc/", status_code=202)
 async def upload_doc(file: UploadFile = File(...)):
     """
-    Admin endpoint to upload a new document and re-run ingestion.
+    Admin endpoint to upload a new document and queue a background ingestion job.
     """
     os.makedirs(DATA_DIR, exist_ok=True)
-    file_path = os.path.join(DATA_DIR, file.filename)
+    file_path = os.path.join(DATA_DIR, os.path.basename(file.filename))
+
+    def save_upload():
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+    await asyncio.to_thread(save_upload)
+
+    try:
+        job = ingestion_jobs.submit(DATA_DIR, file.filename)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    logging.info(f"✅ {file.filename} uploaded, ingestion job {job['job_id']} queued.")
+    return job
+
+
+@app.delete("/admin/docs/{filename}", status_code=202)
+async def remove_doc(filename: str):
+    """
+    Admin endpoint to remove a document from the corpus: deletes the uploaded
+    file and queues an ingestion job that drops its chunks.
+    """
+    filename = os.path.basename(filename)
+    file_path = os.path.join(DATA_DIR, filename)
+
+    def delete_upload():
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    await asyncio.to_thread(delete_upload)
+
+    try:
+        job = ingestion_jobs.submit(DATA_DIR, filename, remove=[filename])
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    logging.info(f"{filename} removed, ingestion job {job['job_id']} queued.")
+    return job
+
+
+@app.get("/admin/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Admin endpoint reporting the status and progress of an ingestion job.
+    """
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/admin/cache/stats")
+async def cache_stats():
+    """
+    Admin endpoint exposing answer cache, query-embedding cache, reranker, rewrite, summary, coalescing, batch and clause artifact counters.
+    """
+    return {
+        "answer_cache": answer_cache.stats(),
+        "query_embeddings": get_embeddings().stats(),
+        "reranker": reranker.stats(),
+        "question_rewrites": question_rewriter.stats(),
+        "conversation_summaries": conversation_summarizer.stats(),
+        "chat_coalescing": inflight.stats(),
+        "chat_batches": batch_runner.stats(),
+        "clause_artifacts": clause_artifacts.stats(),
+    }
+
+
+@app.get("/admin/llm/providers")
+async def llm_providers():
+    """
+    Admin endpoint exposing per-provider circuit state, error rate and latency histograms.
+    """
+    return provider_stats()
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint: request, stage, LLM and database write metrics.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/logs/export")
+async def export_logs(since: str = None, until: str = None, session_id: str = None, include_archived: bool = False):
+    """
+    Streams application_logs rows as NDJSON, oldest first, optionally
+    preceded by the archived rows. Reads page by page in constant memory;
+    since/until are 'YYYY-MM-DD[ HH:MM:SS]' UTC bounds.
+    """
+    archives = log_maintenance.archives() if include_archived else []
+
+    def rows():
+        if archives:
+            lines = []
+            for row in iter_archived_logs(archives, since, until, session_id):
+                lines.append(json.dumps(row))
+                if len(lines) >= LOG_EXPORT_PAGE_SIZE:
+                    yield ("\n".join(lines) + "\n").encode("utf-8")
+                    lines = []
+            if lines:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+        for page in iter_log_pages(since, until, session_id):
+            yield ("\n".join(json.dumps(row) for row in page) + "\n").encode("utf-8")
+
+    # a sync iterator, so Starlette pulls each page on a worker thread
+    return StreamingResponse(
+        rows(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=application_logs.ndjson"},
+    )
+
+
+@app.post("/admin/logs/compact")
+async def compact_logs():
+    """
+    Runs the retention / archive / vacuum pass now instead of waiting for the next interval.
+    """
+    return await asyncio.to_thread(log_maintenance.run_once)
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
 
-    run_ingestion(DATA_DIR)
-    logging.info(f"✅ {file.filename} uploaded and ingested.")
-    
\ No newline at end of file
+@app.get("/admin/logs/maintenance")
+async def log_maintenance_stats():
+    return log_maintenance.stats()
@@ -0,0 +1,274 @@
+import os
+import glob
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqldb_utils import sessions_inactive_since
+from sqldb_utils import oldest_sessions_over
+from sqldb_utils import read_session_logs
+from sqldb_utils import read_log_page
+from sqldb_utils import delete_chat_sessions
+from sqldb_utils import incremental_vacuum
+from sqldb_utils import enable_incremental_vacuum
+from sqldb_utils import auto_vacuum_mode
+
+logger = logging.getLogger(__name__)
+
+LOG_RETENTION_DAYS = float(os.getenv("LOG_RETENTION_DAYS", "0"))  # 0 keeps every session
+LOG_RETENTION_MAX_ROWS = int(os.getenv("LOG_RETENTION_MAX_ROWS", "0"))  # 0 for no row limit
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./archive")
+LOG_ARCHIVE_FORMAT = os.getenv("LOG_ARCHIVE_FORMAT", "jsonl")  # 'jsonl' (gzip) or 'parquet'
+LOG_COMPACTION_INTERVAL = float(os.getenv("LOG_COMPACTION_INTERVAL", "3600"))
+LOG_COMPACTION_BATCH = int(os.getenv("LOG_COMPACTION_BATCH", "100"))  # sessions per delete transaction
+LOG_VACUUM_PAGES = int(os.getenv("LOG_VACUUM_PAGES", "2000"))
+LOG_EXPORT_PAGE_SIZE = int(os.getenv("LOG_EXPORT_PAGE_SIZE", "500"))
+
+ARCHIVE_FIELDS = ("id", "session_id", "user_question", "gpt_answer", "timestamp")
+
+
+class _JsonlArchive:
+    suffix = ".jsonl.gz"
+
+    def __init__(self, path):
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows):
+        for row in rows:
+            self._file.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class _ParquetArchive:
+    suffix = ".parquet"
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()), ("session_id", pa.string()), ("user_question", pa.string()),
+            ("gpt_answer", pa.string()), ("timestamp", pa.string()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def write(self, rows):
+        if rows:
+            self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+    @staticmethod
+    def read(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=LOG_EXPORT_PAGE_SIZE):
+            yield from batch.to_pylist()
+
+
+ARCHIVE_FORMATS = {"jsonl": _JsonlArchive, "parquet": _ParquetArchive}
+
+
+def _archive_reader(path):
+    return _ParquetArchive.read if path.endswith(_ParquetArchive.suffix) else _JsonlArchive.read
+
+
+class LogMaintenance:
+    """
+    Retention for application_logs. Sessions inactive for longer than
+    retention_days, or the least recent ones once the table holds more than
+    max_rows turns, are written to a compressed archive file and then
+    deleted whole (turns, summary and listing), a batch of sessions per
+    short transaction so the log writer is never held up for long.
+    Freed pages are returned with an incremental vacuum; a database created
+    without auto_vacuum=INCREMENTAL is first rebuilt once with a full VACUUM.
+    Runs every interval seconds on a background thread, or on demand via
+    run_once().
+    """
+    def __init__(self, retention_days=LOG_RETENTION_DAYS, max_rows=LOG_RETENTION_MAX_ROWS,
+                 archive_dir=LOG_ARCHIVE_DIR, archive_format=LOG_ARCHIVE_FORMAT,
+                 interval=LOG_COMPACTION_INTERVAL, batch_sessions=LOG_COMPACTION_BATCH,
+                 vacuum_pages=LOG_VACUUM_PAGES):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown LOG_ARCHIVE_FORMAT {archive_format!r}")
+        self.retention_days = retention_days
+        self.max_rows = max_rows
+        self.archive_dir = archive_dir
+        self.archive_format = archive_format
+        self.interval = interval
+        self.batch_sessions = max(batch_sessions, 1)
+        self.vacuum_pages = vacuum_pages
+        self._lock = threading.Lock()  # one compaction at a time
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.sessions_archived = 0
+        self.rows_archived = 0
+        self.last_run = None
+        self.last_vacuum = None  # 'full', 'incremental' or 'skipped'
+        self.vacuum_skipped = None  # why the last run did not vacuum
+
+    @property
+    def enabled(self):
+        return self.retention_days > 0 or self.max_rows > 0
+
+    def start(self):
+        if not self.enabled or self.interval <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-maintenance", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Log compaction failed: {e}")
+
+    def _next_sessions(self):
+        if self.retention_days > 0:
+            cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+            sessions = sessions_inactive_since(cutoff, self.batch_sessions)
+            if sessions:
+                return sessions
+        if self.max_rows > 0:
+            return oldest_sessions_over(self.max_rows, self.batch_sessions)
+        return []
+
+    def run_once(self) -> dict:
+        """
+        Archives and deletes every session outside the retention policy.
+        """
+        if not self.enabled:
+            return {"sessions": 0, "rows": 0, "archive": None, "vacuum": "skipped", "vacuumed": False}
+        with self._lock:
+            start = time.perf_counter()
+            archive = path = None
+            sessions_done = rows_done = 0
+            try:
+                while not self._stop.is_set():
+                    sessions = self._next_sessions()
+                    if not sessions:
+                        break
+                    session_ids = [session_id for session_id, _ in sessions]
+                    rows = read_session_logs(session_ids)
+                    if archive is None:
+                        os.makedirs(self.archive_dir, exist_ok=True)
+                        archive_cls = ARCHIVE_FORMATS[self.archive_format]
+                        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+                        path = os.path.join(self.archive_dir, f"application_logs-{stamp}{archive_cls.suffix}")
+                        archive = archive_cls(path + ".tmp")
+                    archive.write(rows)
+                    delete_chat_sessions(session_ids)
+                    sessions_done += len(session_ids)
+                    rows_done += len(rows)
+            finally:
+                # rows are only deleted after being written, so a partial archive is still kept
+                if archive is not None:
+                    archive.close()
+                    os.replace(path + ".tmp", path)
+
+            vacuum = self._vacuum(sessions_done)
+            self.runs += 1
+            self.sessions_archived += sessions_done
+            self.rows_archived += rows_done
+            self.last_run = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            if sessions_done:
+                logger.info(
+                    f'Archived {rows_done} log rows of {sessions_done} sessions to {path} '
+                    f'in {(time.perf_counter() - start) * 1000:.0f} ms'
+                )
+            return {
+                "sessions": sessions_done, "rows": rows_done, "archive": path,
+                "vacuum": vacuum, "vacuumed": vacuum != "skipped",
+            }
+
+    def _vacuum(self, sessions_done):
+        skipped = None
+        try:
+            if enable_incremental_vacuum():
+                vacuum = "full"
+            elif not sessions_done:
+                vacuum, skipped = "skipped", "no sessions deleted"
+            elif incremental_vacuum(self.vacuum_pages):
+                vacuum = "incremental"
+            else:
+                vacuum, skipped = "skipped", "auto_vacuum is not INCREMENTAL"
+        except sqlite3.Error as e:
+            # e.g. the one-time rebuild timed out behind a long write; retried next run
+            logger.error(f"Log vacuum failed: {e}")
+            vacuum, skipped = "skipped", f"vacuum failed: {e}"
+        self.last_vacuum = vacuum
+        self.vacuum_skipped = skipped
+        return vacuum
+
+    def archives(self):
+        patterns = [os.path.join(self.archive_dir, f"application_logs-*{cls.suffix}") for cls in ARCHIVE_FORMATS.values()]
+        return sorted(path for pattern in patterns for path in glob.glob(pattern))
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "retention_days": self.retention_days,
+            "max_rows": self.max_rows,
+            "archive_format": self.archive_format,
+            "runs": self.runs,
+            "sessions_archived": self.sessions_archived,
+            "rows_archived": self.rows_archived,
+            "archives": len(self.archives()),
+            "last_run": self.last_run,
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(auto_vacuum_mode()),
+            "last_vacuum": self.last_vacuum,
+            "vacuum_skipped": self.vacuum_skipped,
+        }
+
+
+def _in_range(row, since, until, session_id):
+    if session_id is not None and row["session_id"] != session_id:
+        return False
+    if since is not None and row["timestamp"] < since:
+        return False
+    return until is None or row["timestamp"] < until
+
+
+def iter_archived_logs(archives, since=None, until=None, session_id=None):
+    """
+    Rows of the given archive files that match the filters, one file at a time.
+    """
+    for path in archives:
+        for row in _archive_reader(path)(path):
+            if _in_range(row, since, until, session_id):
+                yield row
+
+
+def iter_log_pages(since=None, until=None, session_id=None, page_size=LOG_EXPORT_PAGE_SIZE):
+    """
+    Live application_logs rows in keyset pages of page_size rows, oldest first.
+    Each page is a short read, so the export never holds a lock on the table.
+    """
+    after_id = 0
+    while True:
+        rows = read_log_page(after_id, page_size, since, until, session_id)
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1]["id"]
@@ -0,0 +1,292 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+from langchain.callbacks.base import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+CHAT_TRACE_EVENTS = os.getenv("CHAT_TRACE_EVENTS", "0") == "1"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+
+    def _render_value(self, key, value):
+        buckets, total = value
+        names = self.labelnames + ("le",)
+        lines = []
+        running = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], buckets):
+            running += count
+            lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {running}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {running}")
+        return lines
+
+
+REGISTRY = []
+
+chat_requests = Counter("chat_requests_total", "Chat requests by path and intent", ("path", "intent"))
+chat_seconds = Histogram("chat_request_seconds", "End-to-end /chat latency", ("path",))
+chat_ttft_seconds = Histogram("chat_ttft_seconds", "Time to the first streamed /chat token", ("path",))
+chat_queue_wait_seconds = Histogram("chat_queue_wait_seconds", "Wait for a worker thread before the pipeline starts")
+stage_seconds = Histogram("chat_stage_seconds", "Time spent per pipeline stage", ("stage",))
+llm_calls = Histogram("chat_llm_calls_per_request", "LLM calls made for one chat request", buckets=COUNT_BUCKETS)
+llm_tokens = Counter("llm_tokens_total", "LLM tokens by direction (estimated when the provider reports no usage)", ("direction",))
+llm_first_token_seconds = Histogram("llm_first_token_seconds", "Provider time to first token", ("provider",))
+db_write_seconds = Histogram("db_write_seconds", "application_logs batch commit time")
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """
+    Spans and counters of one chat request. Set as the current trace with
+    start_trace(); copied into worker threads by asyncio.to_thread.
+    """
+    def __init__(self, session_id=None):
+        self.session_id = session_id
+        self.started = time.perf_counter()
+        self.spans = []
+        self.llm_calls = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.ttft_ms = None
+        self.queue_wait_ms = None
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, end, **attributes):
+        span = {
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        }
+        if attributes:
+            span["attributes"] = attributes
+        with self._lock:
+            self.spans.append(span)
+
+    def stage_totals(self):
+        totals = {}
+        with self._lock:
+            for span in self.spans:
+                totals[span["name"]] = round(totals.get(span["name"], 0.0) + span["duration_ms"], 2)
+        return totals
+
+    def summary(self):
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "ttft_ms": self.ttft_ms,
+            "queue_wait_ms": self.queue_wait_ms,
+            "llm_calls": self.llm_calls,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "stages_ms": self.stage_totals(),
+            "spans": list(self.spans),
+        }
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(session_id=None) -> RequestTrace:
+    trace = RequestTrace(session_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def activate_trace(trace: RequestTrace):
+    """
+    Makes trace current in this context, e.g. inside a streaming generator.
+    """
+    _current_trace.set(trace)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a pipeline stage into chat_stage_seconds and the current trace.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        stage_seconds.observe(end - start, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, end, **attributes)
+
+
+def _estimate_tokens(text):
+    return max(len(text) // 4, 1) if text else 0
+
+
+class TraceHandler(BaseCallbackHandler):
+    """
+    Records LLM calls, token counts, agent steps and tool runs of one
+    request as spans on its RequestTrace.
+    """
+    run_inline = True
+
+    def __init__(self, trace: RequestTrace):
+        self.trace = trace
+        self._runs = {}  # run_id -> (span name, start, prompt tokens, streamed tokens)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        prompt = "".join(str(message.content) for batch in messages for message in batch)
+        self._runs[run_id] = ["llm", time.perf_counter(), _estimate_tokens(prompt), 0]
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._runs[run_id] = ["llm", time.perf_counter(), _estimate_tokens("".join(prompts)), 0]
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(run_id)
+        if run is not None:
+            run[3] += 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        _, start, tokens_in, tokens_out = run
+        usage = None
+        try:
+            usage = response.generations[0][0].message.usage_metadata
+        except (AttributeError, IndexError):
+            pass
+        if usage:
+            tokens_in, tokens_out = usage.get("input_tokens", tokens_in), usage.get("output_tokens", tokens_out)
+        elif not tokens_out:
+            tokens_out = _estimate_tokens(response.generations[0][0].text if response.generations else "")
+        self.trace.llm_calls += 1
+        self.trace.tokens_in += tokens_in
+        self.trace.tokens_out += tokens_out
+        llm_tokens.inc(tokens_in, direction="in")
+        llm_tokens.inc(tokens_out, direction="out")
+        end = time.perf_counter()
+        stage_seconds.observe(end - start, stage="llm")
+        self.trace.add_span("llm", start, end, tokens_in=tokens_in, tokens_out=tokens_out)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.trace.add_span("llm", run[1], time.perf_counter(), error=repr(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._runs[run_id] = [f"tool:{(serialized or {}).get('name', 'tool')}", time.perf_counter(), 0, 0]
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            end = time.perf_counter()
+            stage_seconds.observe(end - run[1], stage=run[0])
+            self.trace.add_span(run[0], run[1], end)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(run_id, None)
+        if run is not None:
+            self.trace.add_span(run[0], run[1], time.perf_counter(), error=repr(error))
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        self.trace.add_span("agent_step", time.perf_counter(), time.perf_counter(), tool=action.tool)
+
+
+def finish_trace(trace: RequestTrace, path: str, intent: str):
+    """
+    Folds a finished request into the /metrics histograms and the log.
+    """
+    summary = trace.summary()
+    chat_requests.inc(path=path, intent=intent)
+    chat_seconds.observe(summary["total_ms"] / 1000, path=path)
+    if trace.ttft_ms is not None:
+        chat_ttft_seconds.observe(trace.ttft_ms / 1000, path=path)
+    if trace.queue_wait_ms is not None:
+        chat_queue_wait_seconds.observe(trace.queue_wait_ms / 1000)
+    llm_calls.observe(trace.llm_calls)
+    logger.info(
+        f"'Session ID': {trace.session_id}, trace: total {summary['total_ms']} ms, ttft {summary['ttft_ms']} ms, "
+        f"llm calls {summary['llm_calls']}, tokens {summary['tokens_in']}/{summary['tokens_out']}, "
+        f"stages {summary['stages_ms']}",
+        extra={
+            "session_id": trace.session_id,
+            "path": path,
+            "intent": intent,
+            "total_ms": summary["total_ms"],
+            "ttft_ms": summary["ttft_ms"],
+            "queue_wait_ms": summary["queue_wait_ms"],
+            "llm_calls": summary["llm_calls"],
+            "stages_ms": summary["stages_ms"],
+        },
+    )
+    return summary
@@ -0,0 +1,148 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from sqldb_utils import get_session_summary
+from sqldb_utils import load_turns_after
+from sqldb_utils import upsert_session_summary
+
+logger = logging.getLogger(__name__)
+
+# llama-3.1-8b-instant on Groq; leaves room for the answer within the request's token limit
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_OVERHEAD_TOKENS = int(os.getenv("PROMPT_OVERHEAD_TOKENS", "500"))  # system prompt and instructions
+CONTEXT_MIN_TOKENS = int(os.getenv("CONTEXT_MIN_TOKENS", "800"))
+HISTORY_SUMMARIES = os.getenv("HISTORY_SUMMARIES", "1") == "1"
+HISTORY_VERBATIM_TURNS = int(os.getenv("HISTORY_VERBATIM_TURNS", "4"))
+SUMMARY_BATCH_TURNS = int(os.getenv("SUMMARY_BATCH_TURNS", "2"))
+SUMMARY_MAX_FOLD_TURNS = int(os.getenv("SUMMARY_MAX_FOLD_TURNS", "8"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+SUMMARY_TURN_TOKENS = int(os.getenv("SUMMARY_TURN_TOKENS", "400"))
+
+
+def estimate_tokens(text) -> int:
+    # ~4 characters per token for English text, like the history budget in sqldb_utils
+    return len(text) // 4 + 1 if text else 0
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > max_chars // 2 else max_chars].rstrip() + " ..."
+
+
+def context_budget(question: str, chat_history, total=PROMPT_TOKEN_BUDGET) -> int:
+    """
+    Tokens left for retrieved context once the instructions, the history
+    and the question are in the prompt.
+    """
+    used = PROMPT_OVERHEAD_TOKENS + estimate_tokens(question)
+    used += sum(estimate_tokens(str(message.get("content", ""))) for message in chat_history or [])
+    return max(total - used, CONTEXT_MIN_TOKENS)
+
+
+def fit_documents(documents, budget: int):
+    """
+    Keeps retrieved chunks in rank order until the token budget is spent;
+    the chunk that crosses the budget is truncated, the rest are dropped.
+    """
+    fitted = []
+    remaining = budget
+    for doc in documents:
+        tokens = estimate_tokens(doc.page_content)
+        if tokens <= remaining:
+            fitted.append(doc)
+            remaining -= tokens
+            continue
+        if remaining >= 50:
+            fitted.append(Document(
+                id=doc.id,
+                page_content=truncate_tokens(doc.page_content, remaining),
+                metadata=doc.metadata
+            ))
+        logger.info(f'Trimmed retrieved context to {len(fitted)} of {len(documents)} chunks for a {budget} token budget')
+        break
+    return fitted
+
+
+def format_turns(turns) -> str:
+    return "\n".join(
+        f"User: {truncate_tokens(question, SUMMARY_TURN_TOKENS)}\n"
+        f"Assistant: {truncate_tokens(answer, SUMMARY_TURN_TOKENS)}"
+        for question, answer in turns
+    )
+
+
+class ConversationSummarizer:
+    """
+    Folds the turns of a session that fall out of the verbatim window into
+    a rolling summary in SQLite (session_summaries), a few turns at a time.
+    Runs after the answer is streamed, on one background worker, so it
+    never adds latency to a request. summarize_fn(summary, turns_text)
+    returns the updated summary.
+    """
+    def __init__(self, summarize_fn, enabled=HISTORY_SUMMARIES, verbatim_turns=HISTORY_VERBATIM_TURNS,
+                 batch_turns=SUMMARY_BATCH_TURNS, max_fold_turns=SUMMARY_MAX_FOLD_TURNS):
+        self.summarize_fn = summarize_fn
+        self.enabled = enabled
+        self.verbatim_turns = verbatim_turns
+        self.batch_turns = max(batch_turns, 1)
+        self.max_fold_turns = max(max_fold_turns, self.batch_turns)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self._scheduled = set()
+        self._lock = threading.Lock()
+        self.folds = 0
+        self.turns_folded = 0
+        self.failures = 0
+
+    def schedule(self, session_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            if session_id in self._scheduled:
+                return
+            self._scheduled.add(session_id)
+        self._executor.submit(self._run, session_id)
+
+    def _run(self, session_id):
+        with self._lock:
+            self._scheduled.discard(session_id)
+        try:
+            self.summarize(session_id)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Failed to summarize session {session_id}: {e}")
+
+    def summarize(self, session_id) -> bool:
+        """
+        Folds aged-out turns into the summary; returns whether it changed.
+        """
+        summary, covered = get_session_summary(session_id)
+        changed = False
+        while True:
+            committed, pending = load_turns_after(session_id, covered)
+            # only flushed turns are folded, so turns_covered is an offset into application_logs
+            fold = min(len(committed) + len(pending) - self.verbatim_turns, len(committed), self.max_fold_turns)
+            if fold < self.batch_turns:
+                return changed
+            summary = truncate_tokens(
+                self.summarize_fn(summary, format_turns(committed[:fold])).strip(),
+                SUMMARY_MAX_TOKENS
+            )
+            covered += fold
+            upsert_session_summary(session_id, summary, covered)
+            self.folds += 1
+            self.turns_folded += fold
+            changed = True
+            logger.info(f'Summarized {fold} turns of session {session_id} ({covered} covered)')
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "folds": self.folds,
+            "turns_folded": self.turns_folded,
+            "failures": self.failures,
+        }
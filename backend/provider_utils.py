@@ -0,0 +1,448 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.chat_models import generate_from_stream, agenerate_from_stream
+from metrics_utils import llm_first_token_seconds
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_WINDOW = int(os.getenv("PROVIDER_WINDOW", "50"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "5"))
+BREAKER_LATENCY_MS = float(os.getenv("BREAKER_LATENCY_MS", "15000"))
+BREAKER_COOLDOWN_S = float(os.getenv("BREAKER_COOLDOWN_S", "30"))
+FIRST_TOKEN_TIMEOUT_S = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT_S", "20"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+HEDGE_MIN_MS = float(os.getenv("HEDGE_MIN_MS", "250"))
+HEDGE_MAX_MS = float(os.getenv("HEDGE_MAX_MS", "5000"))
+HEDGE_DEFAULT_MS = float(os.getenv("HEDGE_DEFAULT_MS", "2000"))
+LLM_STREAM_WORKERS = int(os.getenv("LLM_STREAM_WORKERS", "64"))
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    pass
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, ms: float):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.sum += ms
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = {}
+        running = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "sum": round(self.sum, 1), "count": self.count}
+
+
+class ProviderHealth:
+    """
+    Rolling health of one LLM provider and its circuit breaker. The breaker
+    opens when the error rate or the p95 time to first token over the last
+    `window` calls crosses its threshold, rejects calls for `cooldown`
+    seconds, then lets a single probe through (half-open) to decide whether
+    to close again.
+    """
+    def __init__(self, name, window=PROVIDER_WINDOW, error_rate=BREAKER_ERROR_RATE,
+                 min_requests=BREAKER_MIN_REQUESTS, latency_ms=BREAKER_LATENCY_MS,
+                 cooldown=BREAKER_COOLDOWN_S):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_requests = min_requests
+        self.latency_ms = latency_ms
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.first_token_ms = LatencyHistogram()
+        self.total_ms = LatencyHistogram()
+        self.launches = {"primary": 0, "hedge": 0, "failover": 0}
+        self.successes = 0
+        self.failures = 0
+        self.opens = 0
+        self._outcomes = deque(maxlen=window)
+        self._first_tokens = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probe = None  # token of the half-open probe in flight
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Returns a permit for one call, falsy when the circuit rejects it. The
+        half-open probe gets a token of its own to hand back to release().
+        """
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._probe = None
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+            return False
+
+    def release(self, permit):
+        """
+        An abandoned call (hedge loser) frees the half-open probe slot if its
+        permit is the probe.
+        """
+        with self._lock:
+            if permit is self._probe:
+                self._probe = None
+
+    def record_first_token(self, ms: float):
+        with self._lock:
+            self._first_tokens.append(ms)
+            self.first_token_ms.observe(ms)
+        llm_first_token_seconds.observe(ms / 1000, provider=self.name)
+
+    def record_success(self, ms: float):
+        with self._lock:
+            self.successes += 1
+            self.total_ms.observe(ms)
+            self._outcomes.append(True)
+            if self.state == HALF_OPEN:
+                self.state = CLOSED
+                self._probe = None
+                self._outcomes.clear()
+                self._first_tokens.clear()
+                logger.info(f'Circuit for {self.name} closed')
+            else:
+                self._evaluate()
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self._outcomes.append(False)
+            logger.warning(f'LLM provider {self.name} failed: {error!r}')
+            if self.state == HALF_OPEN:
+                self._open()
+            else:
+                self._evaluate()
+
+    def _p95(self):
+        if len(self._first_tokens) < self.min_requests:
+            return None
+        ordered = sorted(self._first_tokens)
+        return ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+
+    def _evaluate(self):
+        if self.state != CLOSED or len(self._outcomes) < self.min_requests:
+            return
+        error_rate = self._outcomes.count(False) / len(self._outcomes)
+        p95 = self._p95()
+        if error_rate >= self.error_rate or (p95 is not None and p95 > self.latency_ms):
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe = None
+        self.opens += 1
+        logger.warning(f'Circuit for {self.name} opened for {self.cooldown}s')
+
+    def hedge_delay(self) -> float:
+        """
+        Seconds to wait for a first token before hedging: the provider's p95
+        time to first token, clamped to [HEDGE_MIN_MS, HEDGE_MAX_MS].
+        """
+        with self._lock:
+            p95 = self._p95()
+        ms = HEDGE_DEFAULT_MS if p95 is None else min(max(p95, HEDGE_MIN_MS), HEDGE_MAX_MS)
+        return ms / 1000
+
+    def stats(self):
+        with self._lock:
+            requests = len(self._outcomes)
+            return {
+                "state": self.state,
+                "successes": self.successes,
+                "failures": self.failures,
+                "opens": self.opens,
+                "launches": dict(self.launches),
+                "window_error_rate": self._outcomes.count(False) / requests if requests else 0.0,
+                "p95_first_token_ms": self._p95(),
+                "first_token_ms": self.first_token_ms.snapshot(),
+                "total_ms": self.total_ms.snapshot(),
+            }
+
+
+_health = {}
+_health_lock = threading.Lock()
+# reads provider streams for synchronous routed calls; a cancelled attempt
+# frees its worker at its next chunk or when the provider call times out
+_stream_executor = ThreadPoolExecutor(max_workers=LLM_STREAM_WORKERS, thread_name_prefix="llm-stream")
+
+
+def provider_health(name: str) -> ProviderHealth:
+    """
+    Health is tracked per provider, shared by every routed model using it.
+    """
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth(name)
+        return _health[name]
+
+
+def provider_stats():
+    with _health_lock:
+        names = list(_health)
+    return {name: provider_health(name).stats() for name in names}
+
+
+class _Race:
+    """
+    Bookkeeping for one routed call: providers tried, attempts still waiting
+    for their first token, and the attempt whose output is being returned.
+    `launch(name, model, permit)` starts an attempt with the permit its
+    breaker granted and returns a cancel callable.
+    """
+    def __init__(self, router, launch):
+        self.router = router
+        self._launch = launch
+        self.tried = []
+        self.live = {}  # name -> (started, cancel)
+        self.winner = None
+        self.last_error = None
+        self.hedge_at = None
+
+    def launch(self, reason):
+        provider = self.router._next_provider(self.tried)
+        if provider is None:
+            return False
+        name, model, permit = provider
+        self.tried.append(name)
+        provider_health(name).launches[reason] += 1
+        self.live[name] = (time.monotonic(), self._launch(name, model, permit))
+        return True
+
+    def start(self):
+        if not self.launch("primary"):
+            raise ProviderUnavailable("No LLM provider configured")
+        if self.router.hedging:
+            self.hedge_at = time.monotonic() + provider_health(self.tried[0]).hedge_delay()
+
+    def timeout(self):
+        """
+        Seconds until the next first-token or hedge deadline, None once streaming.
+        """
+        if self.winner is not None:
+            return None
+        deadlines = [started + self.router.first_token_timeout for started, _ in self.live.values()]
+        if self.hedge_at is not None:
+            deadlines.append(self.hedge_at)
+        return max(min(deadlines) - time.monotonic(), 0) if deadlines else 0
+
+    def tick(self):
+        if self.winner is not None:
+            return
+        now = time.monotonic()
+        for name, (started, cancel) in list(self.live.items()):
+            if now - started >= self.router.first_token_timeout:
+                cancel()
+                del self.live[name]
+                self.last_error = TimeoutError(f"{name} produced no token within {self.router.first_token_timeout}s")
+                provider_health(name).record_failure(self.last_error)
+        if self.hedge_at is not None and now >= self.hedge_at:
+            self.hedge_at = None
+            if self.live and self.launch("hedge"):
+                logger.info(f'Hedging LLM call to {self.tried[-1]}')
+        self._ensure_live()
+
+    def _ensure_live(self):
+        if self.winner is None and not self.live and not self.launch("failover"):
+            raise self.last_error or ProviderUnavailable("No LLM provider available")
+
+    def _claim(self, name):
+        if self.winner is None and name in self.live:
+            self.winner = name
+            for other, (_, cancel) in self.live.items():
+                if other != name:
+                    cancel()
+            if name != self.tried[0]:
+                logger.info(f'LLM call served by {name} instead of {self.tried[0]}')
+        return name == self.winner
+
+    def on_chunk(self, name) -> bool:
+        return self._claim(name)
+
+    def on_end(self, name) -> bool:
+        return self._claim(name)
+
+    def on_error(self, name, error):
+        if name == self.winner:
+            # tokens were already handed out; a mid-stream failure cannot be replayed
+            raise error
+        if name in self.live:
+            del self.live[name]
+            self.last_error = error
+            self._ensure_live()
+
+    def cancel_all(self):
+        # also stops the winner if the caller abandoned the stream early
+        for _, cancel in self.live.values():
+            cancel()
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model that routes each call across ordered (name, chat model)
+    providers. Providers whose circuit is open are skipped; a provider that
+    errors or produces no token within first_token_timeout is failed over
+    to the next one; with hedging, the next provider is also started when
+    the first has not produced a token within its p95 time to first token,
+    and whichever answers first wins. Providers are plain LangChain chat
+    models, so GROQ_API_BASE / MISTRAL_BASE_URL can point them at local
+    OpenAI-compatible servers.
+    """
+    providers: list
+    hedging: bool = LLM_HEDGING
+    first_token_timeout: float = FIRST_TOKEN_TIMEOUT_S
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat"
+
+    @property
+    def _identifying_params(self):
+        return {"providers": [name for name, _ in self.providers], "hedging": self.hedging}
+
+    def _next_provider(self, tried):
+        remaining = [(name, model) for name, model in self.providers if name not in tried]
+        for name, model in remaining:
+            permit = provider_health(name).allow()
+            if permit:
+                return name, model, permit
+        if not tried and remaining:
+            # every circuit is open: trying the primary beats failing outright
+            name, model = remaining[0]
+            return name, model, None
+        return None
+
+    def _pump(self, name, model, permit, messages, stop, kwargs, events, cancel):
+        health = provider_health(name)
+        start = time.perf_counter()
+        first = None
+        try:
+            for chunk in model._stream(messages, stop=stop, **kwargs):
+                if cancel.is_set():
+                    break
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+                    health.record_first_token(first)
+                events.put((name, "chunk", chunk))
+        except Exception as e:
+            if cancel.is_set():
+                health.release(permit)
+            else:
+                health.record_failure(e)
+                events.put((name, "error", e))
+            return
+        if cancel.is_set():
+            health.release(permit)
+            return
+        health.record_success((time.perf_counter() - start) * 1000)
+        events.put((name, "end", None))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        events = queue.Queue()
+
+        def launch(name, model, permit):
+            cancel = threading.Event()
+            _stream_executor.submit(self._pump, name, model, permit, messages, stop, kwargs, events, cancel)
+            return cancel.set
+
+        race = _Race(self, launch)
+        race.start()
+        try:
+            while True:
+                try:
+                    name, kind, payload = events.get(timeout=race.timeout())
+                except queue.Empty:
+                    race.tick()
+                    continue
+                if kind == "chunk":
+                    if race.on_chunk(name):
+                        if run_manager:
+                            run_manager.on_llm_new_token(payload.text, chunk=payload)
+                        yield payload
+                elif kind == "error":
+                    race.on_error(name, payload)
+                elif race.on_end(name):
+                    return
+        finally:
+            race.cancel_all()
+
+    async def _apump(self, name, model, permit, messages, stop, kwargs, events):
+        health = provider_health(name)
+        start = time.perf_counter()
+        first = None
+        try:
+            async for chunk in model._astream(messages, stop=stop, **kwargs):
+                if first is None:
+                    first = (time.perf_counter() - start) * 1000
+                    health.record_first_token(first)
+                events.put_nowait((name, "chunk", chunk))
+        except asyncio.CancelledError:
+            health.release(permit)
+            raise
+        except Exception as e:
+            health.record_failure(e)
+            events.put_nowait((name, "error", e))
+            return
+        health.record_success((time.perf_counter() - start) * 1000)
+        events.put_nowait((name, "end", None))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        events = asyncio.Queue()
+
+        def launch(name, model, permit):
+            task = asyncio.create_task(self._apump(name, model, permit, messages, stop, kwargs, events))
+            return task.cancel
+
+        race = _Race(self, launch)
+        race.start()
+        try:
+            while True:
+                try:
+                    name, kind, payload = await asyncio.wait_for(events.get(), race.timeout())
+                except asyncio.TimeoutError:
+                    race.tick()
+                    continue
+                if kind == "chunk":
+                    if race.on_chunk(name):
+                        if run_manager:
+                            await run_manager.on_llm_new_token(payload.text, chunk=payload)
+                        yield payload
+                elif kind == "error":
+                    race.on_error(name, payload)
+                elif race.on_end(name):
+                    return
+        finally:
+            race.cancel_all()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return generate_from_stream(self._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await agenerate_from_stream(self._astream(messages, stop=stop, run_manager=run_manager, **kwargs))
@@ -1,5 +1,16 @@
+from typing import List, Literal
 from pydantic import BaseModel, Field
 
 class QueryInput(BaseModel):
     question: str
-    session_id: str = Field(default = None)
\ No newline at end of file
+    session_id: str = Field(default = None)
+    user_id: str = Field(default = None)
+
+class BatchItem(BaseModel):
+    question: str
+    intent: Literal["answer", "checklist", "sop"] = Field(default = "answer")
+
+class BatchInput(BaseModel):
+    items: List[BatchItem]
+    session_id: str = Field(default = None)
+    user_id: str = Field(default = None)
\ No newline at end of file
@@ -0,0 +1,105 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger(__name__)
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH_N = int(os.getenv("RERANK_FETCH_N", "12"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "2"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "150"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores over-fetched retrieval candidates with a small local
+    cross-encoder and keeps the best top_n. Scoring runs on a dedicated CPU
+    worker; when it does not finish within budget_ms (or the model is still
+    loading) the candidates are returned in retrieval order instead.
+    """
+    def __init__(self, enabled=RERANK_ENABLED, model_name=RERANK_MODEL, fetch_n=RERANK_FETCH_N,
+                 top_n=RERANK_TOP_N, budget_ms=RERANK_BUDGET_MS, batch_size=RERANK_BATCH_SIZE):
+        self.enabled = enabled
+        self.model_name = model_name
+        self.fetch_n = fetch_n
+        self.top_n = top_n
+        self.budget = budget_ms / 1000
+        self.batch_size = batch_size
+        self._model = None
+        self._loading = None
+        self._lock = threading.Lock()
+        # one worker: a backlog of scoring work shows up as budget timeouts, not CPU contention
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self.reranked = 0
+        self.fallbacks = 0
+        self.total_ms = 0.0
+
+    def _load(self):
+        from sentence_transformers import CrossEncoder
+        model = CrossEncoder(self.model_name, device="cpu")
+        logger.info(f'Loaded reranker {self.model_name}')
+        return model
+
+    def warm_up(self):
+        """
+        Starts loading the model in the background; returns immediately.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._model is None and self._loading is None:
+                self._loading = self._executor.submit(self._load)
+                self._loading.add_done_callback(self._loaded)
+
+    def _loaded(self, future):
+        with self._lock:
+            try:
+                self._model = future.result()
+            except Exception as e:
+                logger.error(f"Reranker {self.model_name} failed to load, disabling: {e}")
+                self.enabled = False
+            self._loading = None
+
+    def _score(self, query, documents):
+        pairs = [(query, doc.page_content) for doc in documents]
+        return self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+
+    def rerank(self, query: str, documents):
+        if not self.enabled or len(documents) <= 1:
+            return documents[:self.top_n]
+        if self._model is None:
+            self.warm_up()
+            self.fallbacks += 1
+            return documents[:self.top_n]
+
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, documents)
+        try:
+            scores = future.result(timeout=self.budget)
+        except FutureTimeout:
+            future.cancel()
+            self.fallbacks += 1
+            logger.warning(f'Rerank exceeded {self.budget * 1000:.0f} ms budget; using retrieval order')
+            return documents[:self.top_n]
+        except Exception as e:
+            self.fallbacks += 1
+            logger.error(f"Rerank failed; using retrieval order: {e}")
+            return documents[:self.top_n]
+
+        self.reranked += 1
+        self.total_ms += (time.perf_counter() - start) * 1000
+        order = sorted(range(len(documents)), key=lambda i: float(scores[i]), reverse=True)
+        return [documents[i] for i in order[:self.top_n]]
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "model_loaded": self._model is not None,
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "avg_ms": round(self.total_ms / self.reranked, 1) if self.reranked else 0.0,
+        }
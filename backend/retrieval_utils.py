@@ -0,0 +1,191 @@
+import os
+import re
+import math
+import logging
+import numpy as np
+from collections import defaultdict
+from typing import Any, Optional
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from metrics_utils import span
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "2"))
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "8"))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# keeps clause numbers (7.3.7) and acronyms (EQA, LIS) as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me of on or shall "
+    "should tell that the this to us was what when where which who why with you your".split()
+)
+
+
+def tokenize(text: str):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Compact in-memory BM25 inverted index over the chunks of a collection.
+    """
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self._lengths = []
+        self._counts = []  # per chunk term -> frequency, kept so updates skip re-tokenizing
+        self._postings = defaultdict(list)  # term -> [(doc index, term frequency)]
+        self._weights = {}  # term -> (doc indices, precomputed BM25 weights) as numpy arrays
+
+    @classmethod
+    def from_vector_db(cls, vector_db, page_size=1000, where=None):
+        """
+        Builds the index from the chunks already persisted in Chroma, or
+        from those matching the `where` filter.
+        """
+        index = cls()
+        offset = 0
+        while True:
+            page = vector_db._collection.get(
+                where=where, limit=page_size, offset=offset, include=["documents", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                index._add(chunk_id, text or "", metadata or {})
+        index._finalize()
+        logger.info(f'Built BM25 index over {len(index.ids)} chunks')
+        return index
+
+    def updated(self, vector_db, added_ids, retired_ids, page_size=1000):
+        """
+        A new index with retired_ids dropped and the chunks of added_ids read
+        from Chroma. Only the added chunks are fetched and tokenized; this
+        index is left untouched for the snapshots still using it.
+        """
+        index = type(self)(self.k1, self.b)
+        retired = set(retired_ids)
+        for position, chunk_id in enumerate(self.ids):
+            if chunk_id not in retired:
+                index._add(chunk_id, self.texts[position], self.metadatas[position],
+                           self._counts[position], self._lengths[position])
+        added_ids = list(added_ids)
+        for start in range(0, len(added_ids), page_size):
+            page = vector_db._collection.get(
+                ids=added_ids[start:start + page_size], include=["documents", "metadatas"]
+            )
+            for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                index._add(chunk_id, text or "", metadata or {})
+        index._finalize()
+        logger.info(f'Updated BM25 index: {len(added_ids)} chunks added, {len(retired)} retired, {len(index.ids)} total')
+        return index
+
+    def _add(self, chunk_id, text, metadata, counts=None, length=None):
+        position = len(self.ids)
+        self.ids.append(chunk_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        if counts is None:
+            terms = tokenize(text)
+            length = len(terms)
+            counts = defaultdict(int)
+            for term in terms:
+                counts[term] += 1
+            counts = dict(counts)
+        self._lengths.append(length)
+        self._counts.append(counts)
+        for term, count in counts.items():
+            self._postings[term].append((position, count))
+
+    def _finalize(self):
+        # the corpus is immutable per index, so term weights are computed once
+        total = len(self.ids)
+        avg_length = (sum(self._lengths) / total if total else 0.0) or 1.0
+        lengths = np.asarray(self._lengths, dtype=np.float32)
+        for term, postings in self._postings.items():
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            positions = np.fromiter((position for position, _ in postings), dtype=np.int32, count=len(postings))
+            frequencies = np.fromiter((count for _, count in postings), dtype=np.float32, count=len(postings))
+            norm = self.k1 * (1 - self.b + self.b * lengths[positions] / avg_length)
+            self._weights[term] = (positions, idf * frequencies * (self.k1 + 1) / (frequencies + norm))
+        self._postings.clear()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query: str, k: int):
+        """
+        Returns up to k (doc index, score) pairs, best first.
+        """
+        matches = [self._weights[term] for term in set(tokenize(query)) if term in self._weights]
+        if not matches:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for positions, weights in matches:
+            scores[positions] += weights  # positions are unique within one term
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(scores[candidates], -k)[-k:]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(position), float(scores[position])) for position in candidates]
+
+    def document(self, position: int) -> Document:
+        return Document(id=self.ids[position], page_content=self.texts[position], metadata=self.metadatas[position])
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuses ranked lists of chunk ids; returns ids ordered by fused score.
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Dense bge-small search fused with BM25 lexical search by reciprocal rank
+    fusion, so exact terms (EQA, LIS, clause numbers) are not lost. Dense
+    search is restricted to the chunks matching `filter`.
+    """
+    vector_db: Any
+    lexical_index: Any = None
+    filter: Optional[dict] = None
+    k: int = RETRIEVAL_K
+    fetch_k: int = HYBRID_FETCH_K
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None):
+        embedding = self.vector_db.embeddings.embed_query(query)
+        return self.search_by_vector(query, embedding)
+
+    def search_by_vector(self, query: str, embedding, k: int = None):
+        k = k or self.k
+        if self.lexical_index is None or not len(self.lexical_index):
+            return self.vector_db.similarity_search_by_vector(embedding, k=k, filter=self.filter)
+
+        fetch_k = max(self.fetch_k, k)
+        with span("retrieval.dense"):
+            dense = self.vector_db.similarity_search_by_vector(embedding, k=fetch_k, filter=self.filter)
+        with span("retrieval.lexical"):
+            lexical = self.lexical_index.search(query, fetch_k)
+
+        documents = {doc.id: doc for doc in dense}
+        for position, _ in lexical:
+            chunk_id = self.lexical_index.ids[position]
+            if chunk_id not in documents:
+                documents[chunk_id] = self.lexical_index.document(position)
+
+        fused = reciprocal_rank_fusion([
+            [doc.id for doc in dense],
+            [self.lexical_index.ids[position] for position, _ in lexical],
+        ])
+        return [documents[chunk_id] for chunk_id in fused[:k]]
@@ -0,0 +1,106 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from retrieval_utils import tokenize
+
+logger = logging.getLogger(__name__)
+
+REWRITE_MODE = os.getenv("REWRITE_MODE", "auto")  # 'auto', 'always' or 'never'
+REWRITE_CACHE_SIZE = int(os.getenv("REWRITE_CACHE_SIZE", "1024"))
+REWRITE_MIN_TERMS = int(os.getenv("REWRITE_MIN_TERMS", "2"))
+
+# words that only make sense against an earlier turn
+REFERENCE_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|he|she|him|her|above|previous(ly)?|aforementioned|former|latter|same|"
+    r"(this|that|these|those) (one|ones|clause|clauses|section|requirement|requirements|point|points|"
+    r"part|step|steps|list|checklist|sop|procedure|document|answer))\b",
+    re.IGNORECASE
+)
+# elliptical follow-ups: "and for EQA?", "what about 8.5", "more detail"
+FOLLOW_UP_PATTERN = re.compile(
+    r"^\s*(and|also|but|so|then|what about|how about|why|more|elaborate|expand|continue|go on|"
+    r"explain (further|more)|give (me )?more|another|next|same)\b",
+    re.IGNORECASE
+)
+
+
+def needs_rewrite(question: str, chat_history) -> bool:
+    """
+    Local decision whether a follow-up depends on earlier turns. Questions
+    that carry their own subject pass through without the rewrite LLM call.
+    """
+    if not chat_history or REWRITE_MODE == "never":
+        return False
+    if REWRITE_MODE == "always":
+        return True
+    if REFERENCE_PATTERN.search(question) or FOLLOW_UP_PATTERN.match(question):
+        return True
+    # too few content words to stand on its own ("why?", "examples")
+    return len(tokenize(question)) < REWRITE_MIN_TERMS
+
+
+def _turn_key(question: str, chat_history) -> str:
+    # the history identifies the session and the turn within it
+    digest = hashlib.sha256()
+    for message in chat_history:
+        digest.update(f"{message.get('role')}\0{message.get('content')}\0".encode("utf-8"))
+    digest.update(" ".join(question.lower().split()).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QuestionRewriter:
+    """
+    History-aware question rewrite that skips the LLM when needs_rewrite
+    says the question is self-contained, and memoizes rewrites per
+    (session, turn) so retrieval, checklist and SOP steps of one turn share
+    a single call.
+    """
+    def __init__(self, cache_size=REWRITE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.memo_hits = 0
+        self.rewrites = 0
+
+    def rewrite(self, question: str, chat_history, rewrite_fn) -> str:
+        """
+        Returns the standalone question; rewrite_fn() performs the LLM rewrite.
+        First turns pass through and are not counted.
+        """
+        if not chat_history:
+            return question
+        if not needs_rewrite(question, chat_history):
+            with self._lock:
+                self.skipped += 1
+            return question
+
+        key = _turn_key(question, chat_history)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.memo_hits += 1
+                return cached
+
+        rewritten = rewrite_fn()
+        with self._lock:
+            self.rewrites += 1
+            if self.cache_size > 0:
+                self._cache[key] = rewritten
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        logger.info(f'Rewrote follow-up "{question}" as "{rewritten}"')
+        return rewritten
+
+    def stats(self):
+        total = self.skipped + self.memo_hits + self.rewrites
+        return {
+            "skipped": self.skipped,
+            "memo_hits": self.memo_hits,
+            "llm_rewrites": self.rewrites,
+            "llm_avoided_rate": (self.skipped + self.memo_hits) / total if total else 0.0,
+        }
@@ -0,0 +1,82 @@
+import os
+import re
+
+CHAT_ROUTER_MODE = os.getenv("CHAT_ROUTER_MODE", "fast")  # 'fast' or 'agent'
+
+EXPLANATION = "explanation"
+CHECKLIST = "checklist"
+SOP = "sop"
+OUT_OF_SCOPE = "out_of_scope"
+AMBIGUOUS = "ambiguous"
+
+GREETING_PATTERN = re.compile(
+    r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|ok(ay)?|bye)\b[\s!.,?]*(there)?[\s!.,?]*$",
+    re.IGNORECASE
+)
+FILE_FORMAT = r"(pdf|docx|xlsx|word( document| file)?|excel( file| spreadsheet| sheet)?|spreadsheet)"
+FILE_ACTION = r"(generate|create|make|produce|prepare|write|draft|provide|give|send|export|convert|save)"
+# only requests addressed to the assistant for a file as output; questions that
+# merely mention PDFs, spreadsheets or downloads are domain questions
+FILE_REQUEST_PATTERN = re.compile(
+    rf"(^\s*(please\s+)?{FILE_ACTION}|\b(can|could|would|will) you\s+(please\s+)?{FILE_ACTION}|\b(give|send|email) me)\b"
+    rf"[^?!\n]*?\b(as|into|to|in|an?)\s+(an?\s+)?{FILE_FORMAT}\b",
+    re.IGNORECASE
+)
+CHECKLIST_PATTERN = re.compile(r"\b(check\s?lists?|audit questions?)\b", re.IGNORECASE)
+SOP_PATTERN = re.compile(r"\b(sops?|standard operating procedures?)\b", re.IGNORECASE)
+QUESTION_PATTERN = re.compile(
+    r"^\s*(what|how|why|when|where|who|which|explain|describe|define|tell me|list|summari[sz]e|"
+    r"does|do|is|are|can|should|must|give me)\b",
+    re.IGNORECASE
+)
+DOMAIN_PATTERN = re.compile(
+    r"\b(iso|15189|clause|laborator(y|ies)|lab|quality|qms|accreditation|calibration|uncertainty|"
+    r"measurement|competen(ce|cy)|personnel|staff|equipment|reagents?|samples?|specimens?|"
+    r"examinations?|eqa|iqc|lis|turnaround|tat|risk|nonconform\w*|corrective|audit|"
+    r"management review|document control|records?|traceability|validation|verification|"
+    r"pre-?examination|post-?examination|complaints?|impartiality|confidentiality)\b|\b\d+(\.\d+)+\b",
+    re.IGNORECASE
+)
+
+GREETING_REPLY = (
+    "Hello! I'm your ISO 15189 assistant. Ask me about a clause, request an audit "
+    "checklist, or ask me to draft an SOP."
+)
+FILE_REPLY = (
+    "I can only provide text output, not PDF or Word documents. Ask for the content "
+    "you need and you can copy it into your own document."
+)
+
+
+def classify_intent(question: str) -> str:
+    """
+    Cheap rule-based intent for the fast path. Anything the rules cannot
+    place with confidence is AMBIGUOUS and goes to the agent.
+    """
+    if GREETING_PATTERN.match(question):
+        return OUT_OF_SCOPE
+    if FILE_REQUEST_PATTERN.search(question):
+        return OUT_OF_SCOPE
+
+    wants_checklist = bool(CHECKLIST_PATTERN.search(question))
+    wants_sop = bool(SOP_PATTERN.search(question))
+    if wants_checklist and wants_sop:
+        return AMBIGUOUS
+    if wants_checklist:
+        return CHECKLIST
+    if wants_sop:
+        return SOP
+
+    if DOMAIN_PATTERN.search(question) or QUESTION_PATTERN.match(question):
+        return EXPLANATION
+    return AMBIGUOUS
+
+
+def out_of_scope_reply(question: str) -> str:
+    if FILE_REQUEST_PATTERN.search(question):
+        return FILE_REPLY
+    return GREETING_REPLY
+
+
+def use_fast_path(intent: str) -> bool:
+    return CHAT_ROUTER_MODE == "fast" and intent != AMBIGUOUS
@@ -1,11 +1,41 @@
+import os
 import sqlite3
+import json
+import time
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
+from metrics_utils import span, db_write_seconds
+
+logger = logging.getLogger(__name__)
 
 DB_NAME = 'ISO15189'
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "10"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_CACHE_SESSIONS = int(os.getenv("HISTORY_CACHE_SESSIONS", "1024"))
+
+_local = threading.local()
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
+    """
+    Returns this thread's reused SQLite connection, opened in WAL mode so
+    readers never wait on the log writer.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_NAME, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # only takes effect on a new database file, existing ones are switched by
+        # enable_incremental_vacuum(); lets compaction free pages incrementally
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
     return conn
 
 def create_application_logs():
@@ -21,11 +51,273 @@ def create_application_logs():
         )
         """
     )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_application_logs_session
+        ON application_logs (session_id, id)
+        """
+    )
+    conn.commit()
+
+SESSION_TITLE_CHARS = 80
+
+def create_chat_sessions():
+    """
+    Per-session title and last activity, maintained by the log writer so
+    listing sessions never scans application_logs. Backfilled once from
+    existing logs.
+    """
+    conn = get_db_connection()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT,
+            title TEXT,
+            created_at DATETIME,
+            last_activity DATETIME,
+            turns INTEGER
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user
+        ON chat_sessions (user_id, last_activity, session_id)
+        """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_activity
+        ON chat_sessions (last_activity)
+        """
+    )
+    if conn.execute("SELECT 1 FROM chat_sessions LIMIT 1").fetchone() is None:
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO chat_sessions (session_id, user_id, title, created_at, last_activity, turns)
+            SELECT logs.session_id, NULL, substr(first.user_question, 1, {SESSION_TITLE_CHARS}),
+                MIN(logs.timestamp), MAX(logs.timestamp), COUNT(*)
+            FROM application_logs AS logs
+            JOIN application_logs AS first ON first.id = (
+                SELECT MIN(id) FROM application_logs WHERE session_id = logs.session_id
+            )
+            GROUP BY logs.session_id
+            """
+        )
     conn.commit()
-    conn.close()
 
-def insert_application_logs(session_id, user_question, gpt_answer):
+class LogWriter:
+    """
+    Write-behind queue for application_logs. Rows are flushed by a dedicated
+    thread in batches, every LOG_FLUSH_INTERVAL seconds or LOG_BATCH_SIZE rows.
+    """
+    def __init__(self, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._pending = []   # rows queued or in flight, visible to readers
+        self._pending_lock = threading.Lock()
+        self._dropped = set()  # ids of queued rows of deleted sessions
+        self.write_lock = threading.Lock()  # held while a batch is committed
+        self._thread = None
+        self.generation = 0  # odd while a batch is committed or sessions are deleted
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Drains every queued row and stops the writer thread.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+        # rows enqueued while no writer was running
+        self._write(self._drain())
+
+    def put(self, row):
+        with self._pending_lock:
+            self._pending.append(row)
+        self._queue.put(row)
+        if self._thread is None:
+            self.start()
+
+    def pending_for(self, session_id):
+        with self._pending_lock:
+            return [row for row in self._pending if row[0] == session_id]
 
+    def drop(self, session_ids):
+        """
+        Forgets the queued rows of the given sessions, so a deleted session is
+        not written back. The caller holds write_lock, so none is in flight.
+        """
+        session_ids = set(session_ids)
+        with self._pending_lock:
+            dropped = [row for row in self._pending if row[0] in session_ids]
+            self._dropped.update(map(id, dropped))
+            self._pending = [row for row in self._pending if row[0] not in session_ids]
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if row is not None:
+                rows.append(row)
+
+    def _run(self):
+        while True:
+            try:
+                row = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            stop = row is None
+            batch = [] if stop else [row]
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    row = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                else:
+                    batch.append(row)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        with self.write_lock:
+            with self._pending_lock:
+                rows = [row for row in batch if id(row) not in self._dropped]
+                self._dropped.difference_update(map(id, batch))
+            self._commit(rows)
+
+    def _commit(self, batch):
+        if not batch:
+            return
+        self.generation += 1
+        start = time.perf_counter()
+        try:
+            conn = get_db_connection()
+            conn.executemany(
+                """
+                INSERT INTO application_logs (session_id, user_question, gpt_answer, timestamp)
+                VALUES (?, ?, ?, ?)
+                """,
+                [row[:4] for row in batch]
+            )
+            # same transaction, so a listed session always has its turns
+            conn.executemany(
+                """
+                INSERT INTO chat_sessions (session_id, user_id, title, created_at, last_activity, turns)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    last_activity = excluded.last_activity,
+                    user_id = COALESCE(chat_sessions.user_id, excluded.user_id),
+                    turns = chat_sessions.turns + 1
+                """,
+                [(row[0], row[4], row[1][:SESSION_TITLE_CHARS], row[3], row[3]) for row in batch]
+            )
+            conn.commit()
+            db_write_seconds.observe(time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} application logs: {e}")
+        finally:
+            with self._pending_lock:
+                written = set(map(id, batch))
+                self._pending = [row for row in self._pending if id(row) not in written]
+            self.generation += 1
+
+log_writer = LogWriter()
+
+class SessionHistoryCache:
+    """
+    In-process LRU of hot sessions: the last HISTORY_MAX_TURNS turns, the
+    session's turn count and its rolling summary, kept current by
+    insert_application_logs and upsert_session_summary.
+    """
+    def __init__(self, max_sessions=HISTORY_CACHE_SESSIONS, max_turns=HISTORY_MAX_TURNS):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.inserts = 0  # turn and summary writes, to detect races with a load
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id):
+        """
+        Returns (turns, total_turns, summary, turns_covered) or None.
+        """
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return list(entry["turns"]), entry["total"], entry["summary"], entry["covered"]
+
+    def put(self, session_id, turns, total, summary, covered, inserts_seen):
+        """
+        Caches a session loaded from SQLite unless a write raced with the load.
+        """
+        with self._lock:
+            if self.max_sessions <= 0 or inserts_seen != self.inserts:
+                return
+            self._sessions[session_id] = {
+                "turns": list(turns[-self.max_turns:]),
+                "total": total,
+                "summary": summary,
+                "covered": covered,
+            }
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def append(self, session_id, turn):
+        with self._lock:
+            self.inserts += 1
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["turns"].append(turn)
+                del entry["turns"][:-self.max_turns]
+                entry["total"] += 1
+                self._sessions.move_to_end(session_id)
+
+    def evict(self, session_id):
+        with self._lock:
+            self.inserts += 1
+            self._sessions.pop(session_id, None)
+
+    def set_summary(self, session_id, summary, covered):
+        with self._lock:
+            self.inserts += 1
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry["summary"] = summary
+                entry["covered"] = covered
+
+history_cache = SessionHistoryCache()
+
+def start_log_writer():
+    log_writer.start()
+
+def stop_log_writer():
+    log_writer.stop()
+
+def insert_application_logs(session_id, user_question, gpt_answer, user_id=None):
+    """
+    Queues a chat turn for the background writer; never blocks on disk I/O.
+    user_id, when given, lists the session under that user (see list_chat_sessions).
+    """
     if hasattr(gpt_answer, "content"):
         gpt_answer = gpt_answer.content
     elif isinstance(gpt_answer, dict): 
@@ -33,34 +325,492 @@ def insert_application_logs(session_id, user_question, gpt_answer):
     elif not isinstance(gpt_answer, str): 
         gpt_answer = str(gpt_answer)
 
-    # --- Insert ---
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    log_writer.put(
+        (str(session_id), str(user_question), str(gpt_answer), timestamp,  # enforce strings
+         str(user_id) if user_id else None)
+    )
+    history_cache.append(str(session_id), (str(user_question), str(gpt_answer)))
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+def _read_session(session_id, sql, params):
+    """
+    Runs sql and returns (rows, pending rows of the session) as of one
+    consistent state of the write-behind queue.
+    """
+    conn = get_db_connection()
+    while True:
+        generation = log_writer.generation
+        if generation % 2:
+            time.sleep(0.001)
+            continue
+        rows = conn.execute(sql, params).fetchall()
+        # turns still waiting in the write-behind queue
+        pending = log_writer.pending_for(session_id)
+        # retry if a batch was committed while we were reading
+        if generation == log_writer.generation:
+            return rows, pending
+
+def _load_recent_turns(session_id, limit):
+    """
+    Returns the last limit turns of a session and its total turn count.
+    """
+    rows, pending = _read_session(
+        session_id,
+        """
+        SELECT user_question, gpt_answer,
+            (SELECT COUNT(*) FROM application_logs WHERE session_id = ?) AS total
+        FROM application_logs 
+        WHERE session_id = ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (session_id, session_id, limit)
+    )
+    turns = [(row["user_question"], row["gpt_answer"]) for row in reversed(rows)]
+    turns += [(row[1], row[2]) for row in pending]
+    total = (rows[0]["total"] if rows else 0) + len(pending)
+    return turns[-limit:], total
+
+def load_turns_after(session_id, offset):
+    """
+    Returns (committed, pending): the turns of a session after its first
+    offset turns, split by whether the log writer has flushed them yet.
+    """
+    rows, pending = _read_session(
+        str(session_id),
+        """
+        SELECT user_question, gpt_answer
+        FROM application_logs
+        WHERE session_id = ?
+        ORDER BY id
+        LIMIT -1 OFFSET ?
+        """,
+        (str(session_id), offset)
+    )
+    committed = [(row["user_question"], row["gpt_answer"]) for row in rows]
+    return committed, [(row[1], row[2]) for row in pending]
+
+def get_chat_history(session_id, max_turns=HISTORY_MAX_TURNS, token_budget=HISTORY_TOKEN_BUDGET):
+    """
+    Returns the session's rolling summary (as a system message) followed by
+    the turns it does not cover yet, bounded to max_turns and an approximate
+    token budget.
+    """
+    session_id = str(session_id)
+    cached = history_cache.get(session_id)
+    if cached is None:
+        inserts_seen = history_cache.inserts
+        with span("db.history"):
+            turns, total = _load_recent_turns(session_id, max(max_turns, history_cache.max_turns))
+            summary, covered = get_session_summary(session_id)
+        history_cache.put(session_id, turns, total, summary, covered, inserts_seen)
+    else:
+        turns, total, summary, covered = cached
+    # turns already folded into the summary are not repeated verbatim
+    uncovered = min(max_turns, total - covered) if summary else max_turns
+    turns = turns[-uncovered:] if uncovered > 0 else []
+
+    # keep the newest turns that fit in the budget
+    kept = []
+    used = _estimate_tokens(summary) if summary else 0
+    for user_question, gpt_answer in reversed(turns):
+        used += _estimate_tokens(user_question) + _estimate_tokens(gpt_answer)
+        if token_budget and used > token_budget:
+            break
+        kept.append((user_question, gpt_answer))
+
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    for user_question, gpt_answer in reversed(kept):
+        messages.append({"role": "user", "content": user_question})
+        messages.append({"role": "assistant", "content": gpt_answer})
+
+    return messages
+
+def list_chat_sessions(user_id, limit, before=None):
+    """
+    Keyset page of a user's sessions, most recent activity first. before is
+    the (last_activity, session_id) of the last row of the previous page.
+    """
+    conn = get_db_connection()
+    if before is None:
+        rows = conn.execute(
+            """
+            SELECT session_id, title, created_at, last_activity, turns
+            FROM chat_sessions
+            WHERE user_id = ?
+            ORDER BY last_activity DESC, session_id DESC
+            LIMIT ?
+            """,
+            (user_id, limit)
+        )
+    else:
+        rows = conn.execute(
+            """
+            SELECT session_id, title, created_at, last_activity, turns
+            FROM chat_sessions
+            WHERE user_id = ? AND (last_activity, session_id) < (?, ?)
+            ORDER BY last_activity DESC, session_id DESC
+            LIMIT ?
+            """,
+            (user_id, before[0], before[1], limit)
+        )
+    return [dict(row) for row in rows.fetchall()]
+
+def get_chat_session(session_id):
+    row = get_db_connection().execute(
+        "SELECT session_id, user_id, title, created_at, last_activity, turns FROM chat_sessions WHERE session_id = ?",
+        (str(session_id),)
+    ).fetchone()
+    return dict(row) if row is not None else None
+
+def get_session_turns(session_id, limit, before_id=None):
+    """
+    Keyset page of a session's turns, newest first. The first page also
+    includes turns still waiting in the write-behind queue (with id None).
+    """
+    session_id = str(session_id)
+    rows, pending = _read_session(
+        session_id,
+        """
+        SELECT id, user_question, gpt_answer, timestamp
+        FROM application_logs
+        WHERE session_id = ? AND id < ?
+        ORDER BY id DESC
+        LIMIT ?
+        """,
+        (session_id, before_id if before_id is not None else 2**63 - 1, limit)
+    )
+    turns = [dict(row) for row in rows]
+    if before_id is None:
+        turns = [
+            {"id": None, "user_question": row[1], "gpt_answer": row[2], "timestamp": row[3]}
+            for row in reversed(pending)
+        ] + turns
+    return turns
+
+def delete_chat_session(session_id):
+    """
+    Deletes a session's turns, summary and listing.
+    """
+    delete_chat_sessions([str(session_id)])
+
+def delete_chat_sessions(session_ids):
+    """
+    Deletes the turns, summaries and listings of several sessions in one transaction.
+    """
+    params = [(session_id,) for session_id in session_ids]
+    conn = get_db_connection()
+    # no batch in flight; turns still queued for these sessions are dropped
+    with log_writer.write_lock:
+        log_writer.generation += 1
+        try:
+            log_writer.drop(session_ids)
+            conn.executemany("DELETE FROM application_logs WHERE session_id = ?", params)
+            conn.executemany("DELETE FROM session_summaries WHERE session_id = ?", params)
+            conn.executemany("DELETE FROM chat_sessions WHERE session_id = ?", params)
+            conn.commit()
+            for session_id in session_ids:
+                history_cache.evict(session_id)
+        finally:
+            log_writer.generation += 1
+
+def sessions_inactive_since(cutoff, limit):
+    """
+    Up to limit sessions with no activity since cutoff, least recent first.
+    """
+    rows = get_db_connection().execute(
+        """
+        SELECT session_id, turns FROM chat_sessions
+        WHERE last_activity < ?
+        ORDER BY last_activity
+        LIMIT ?
+        """,
+        (cutoff, limit)
+    )
+    return [(row["session_id"], row["turns"]) for row in rows.fetchall()]
+
+def oldest_sessions_over(max_rows, limit):
+    """
+    The least recently active sessions (up to limit) whose removal brings
+    application_logs down towards max_rows rows.
+    """
+    conn = get_db_connection()
+    total = conn.execute("SELECT COALESCE(SUM(turns), 0) FROM chat_sessions").fetchone()[0]
+    excess = total - max_rows
+    sessions = []
+    if excess <= 0:
+        return sessions
+    rows = conn.execute(
+        "SELECT session_id, turns FROM chat_sessions ORDER BY last_activity LIMIT ?",
+        (limit,)
+    )
+    for row in rows:
+        if excess <= 0:
+            break
+        sessions.append((row["session_id"], row["turns"]))
+        excess -= row["turns"]
+    return sessions
+
+def read_session_logs(session_ids):
+    """
+    Every application_logs row of the given sessions, as dicts.
+    """
+    conn = get_db_connection()
+    rows = []
+    for session_id in session_ids:
+        rows.extend(dict(row) for row in conn.execute(
+            """
+            SELECT id, session_id, user_question, gpt_answer, timestamp
+            FROM application_logs
+            WHERE session_id = ?
+            ORDER BY id
+            """,
+            (session_id,)
+        ))
+    return rows
+
+def read_log_page(after_id, limit, since=None, until=None, session_id=None):
+    """
+    Keyset page of application_logs rows with id > after_id, oldest first.
+    """
+    conditions = ["id > ?"]
+    params = [after_id]
+    if session_id is not None:
+        conditions.append("session_id = ?")
+        params.append(session_id)
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    rows = get_db_connection().execute(
+        f"""
+        SELECT id, session_id, user_question, gpt_answer, timestamp
+        FROM application_logs
+        WHERE {" AND ".join(conditions)}
+        ORDER BY id
+        LIMIT ?
+        """,
+        params + [limit]
+    )
+    return [dict(row) for row in rows.fetchall()]
+
+def auto_vacuum_mode():
+    """
+    The database's auto_vacuum setting: 0 none, 1 full, 2 incremental.
+    """
+    return get_db_connection().execute("PRAGMA auto_vacuum").fetchone()[0]
+
+def enable_incremental_vacuum():
+    """
+    Switches a database created before auto_vacuum=INCREMENTAL was set to it.
+    The new mode only applies once a full VACUUM has rebuilt the file, so this
+    is a one-time migration; returns True when it ran.
+    """
+    if auto_vacuum_mode() == 2:
+        return False
+    conn = get_db_connection()
+    conn.commit()  # VACUUM cannot run inside a transaction
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+    logger.info("Rebuilt the database with auto_vacuum=INCREMENTAL")
+    return True
+
+def incremental_vacuum(pages):
+    """
+    Returns up to pages free pages to the filesystem; a no-op unless the
+    database uses auto_vacuum=INCREMENTAL (see enable_incremental_vacuum).
+    """
+    if auto_vacuum_mode() != 2:
+        return False
+    conn = get_db_connection()
+    # executescript steps the pragma to completion; execute() would free a single page
+    conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+    return True
+
+async def aget_chat_history(session_id):
+    """
+    get_chat_history off the event loop.
+    """
+    return await asyncio.to_thread(get_chat_history, session_id)
+
+def create_session_summaries():
+    conn = get_db_connection()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS session_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT,
+            turns_covered INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    conn.commit()
+
+def get_session_summary(session_id):
+    """
+    Returns (summary, turns_covered); ("", 0) for sessions without one.
+    """
+    row = get_db_connection().execute(
+        "SELECT summary, turns_covered FROM session_summaries WHERE session_id = ?",
+        (str(session_id),)
+    ).fetchone()
+    if row is None:
+        return "", 0
+    return row["summary"], row["turns_covered"]
+
+def upsert_session_summary(session_id, summary, turns_covered):
     conn = get_db_connection()
     conn.execute(
         """
-        INSERT INTO application_logs (session_id, user_question, gpt_answer)
-        VALUES (?, ?, ?)
+        INSERT OR REPLACE INTO session_summaries (session_id, summary, turns_covered, updated_at)
+        VALUES (?, ?, ?, ?)
         """,
-        (str(session_id), str(user_question), str(gpt_answer))  # enforce strings
+        (str(session_id), summary, turns_covered, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
     )
     conn.commit()
-    conn.close()
+    history_cache.set_summary(str(session_id), summary, turns_covered)
 
-def get_chat_history(session_id):
+def create_clause_artifacts():
+    conn = get_db_connection()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS clause_artifacts (
+            corpus_version TEXT,
+            clause TEXT,
+            kind TEXT,
+            content TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (corpus_version, clause, kind)
+        )
+        """
+    )
+    conn.commit()
+
+def get_clause_artifact(corpus_version, clause, kind):
+    row = get_db_connection().execute(
+        "SELECT content FROM clause_artifacts WHERE corpus_version = ? AND clause = ? AND kind = ?",
+        (corpus_version, clause, kind)
+    ).fetchone()
+    return row["content"] if row is not None else None
+
+def load_clause_artifact_keys(corpus_version):
+    """
+    Returns the (clause, kind) pairs already generated for a corpus version.
+    """
+    rows = get_db_connection().execute(
+        "SELECT clause, kind FROM clause_artifacts WHERE corpus_version = ?",
+        (corpus_version,)
+    )
+    return {(row["clause"], row["kind"]) for row in rows.fetchall()}
+
+def upsert_clause_artifact(corpus_version, clause, kind, content):
+    conn = get_db_connection()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO clause_artifacts (corpus_version, clause, kind, content, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (corpus_version, clause, kind, content, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+    conn.commit()
+
+def delete_clause_artifacts(keep_version):
+    """
+    Drops artifacts of every corpus version but keep_version.
+    """
+    conn = get_db_connection()
+    conn.execute("DELETE FROM clause_artifacts WHERE corpus_version != ?", (keep_version,))
+    conn.commit()
+
+def create_answer_cache():
+    conn = get_db_connection()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            cache_key TEXT PRIMARY KEY,
+            question TEXT,
+            embedding TEXT,
+            answer TEXT,
+            source_ids TEXT,
+            corpus_version TEXT,
+            latency_ms REAL,
+            created_at REAL
+        )
+        """
+    )
+    conn.commit()
+
+def upsert_answer_cache(entry):
+    conn = get_db_connection()
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO answer_cache
+            (cache_key, question, embedding, answer, source_ids, corpus_version, latency_ms, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            entry["cache_key"],
+            entry["question"],
+            json.dumps(entry["embedding"]),
+            entry["answer"],
+            json.dumps(entry["source_ids"]),
+            entry["corpus_version"],
+            entry["latency_ms"],
+            entry["created_at"],
+        )
+    )
+    conn.commit()
+
+def delete_answer_cache(cache_keys=None):
+    """
+    Deletes the given cache rows, or every row when no keys are given.
+    """
+    conn = get_db_connection()
+    if cache_keys is None:
+        conn.execute("DELETE FROM answer_cache")
+    else:
+        conn.executemany(
+            "DELETE FROM answer_cache WHERE cache_key = ?",
+            [(key,) for key in cache_keys]
+        )
+    conn.commit()
+
+def load_answer_cache(limit):
     conn = get_db_connection()
     rows = conn.execute(
         """
-        SELECT user_question, gpt_answer 
-        FROM application_logs 
-        WHERE session_id = ?
+        SELECT * FROM answer_cache
+        ORDER BY created_at DESC
+        LIMIT ?
         """,
-        (session_id,) 
+        (limit,)
     )
-    messages = []
+    entries = []
     for row in rows.fetchall():
-        messages.append({"role": "user", "content": row["user_question"]})
-        messages.append({"role": "assistant", "content": row["gpt_answer"]})
+        entries.append({
+            "cache_key": row["cache_key"],
+            "question": row["question"],
+            "embedding": json.loads(row["embedding"]),
+            "answer": row["answer"],
+            "source_ids": json.loads(row["source_ids"]),
+            "corpus_version": row["corpus_version"],
+            "latency_ms": row["latency_ms"],
+            "created_at": row["created_at"],
+        })
 
-    conn.close()
-    return messages
+    return entries
 
-create_application_logs()
\ No newline at end of file
+create_application_logs()
+create_chat_sessions()
+create_session_summaries()
+create_clause_artifacts()
\ No newline at end of file
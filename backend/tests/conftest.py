@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="iso15189-tests-")
+sys.path.insert(0, BACKEND_DIR)
+
+from fakes import FakeLLMServer, HashEmbeddings  # noqa: E402
+
+# Provider clients talk to local fake servers; started before the app modules
+# are imported because they read their configuration at import time.
+llm_servers = {"groq": FakeLLMServer().start(), "mistral": FakeLLMServer().start()}
+
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("MISTRALAI_API_KEY", "test")
+os.environ["GROQ_API_BASE"] = llm_servers["groq"].url
+os.environ["MISTRAL_BASE_URL"] = llm_servers["mistral"].url + "/v1"
+os.environ["CHROMA_PERSIST_DIR"] = os.path.join(WORK_DIR, "chroma_db")
+os.environ.setdefault("INGEST_PARSE_WORKERS", "1")
+# sqldb_utils opens ./ISO15189
+os.chdir(WORK_DIR)
+
+import chromadb_utils  # noqa: E402
+
+# bge-small would be downloaded on first use; like benchmark.py, swap in hash embeddings
+chromadb_utils.HuggingFaceEmbeddings = HashEmbeddings
+
+
+@pytest.fixture
+def groq_server():
+    server = llm_servers["groq"]
+    server.reset()
+    yield server
+    server.reset()
+
+
+@pytest.fixture
+def mistral_server():
+    server = llm_servers["mistral"]
+    server.reset()
+    yield server
+    server.reset()
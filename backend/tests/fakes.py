@@ -0,0 +1,134 @@
+"""
+Test doubles shared by the test modules: a local OpenAI-compatible chat
+completions server for the provider clients, plus the hash embeddings and
+PDF writer of fake_utils (shared with benchmark.py).
+"""
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fake_utils import HashEmbeddings, write_pdf  # noqa: F401
+
+DEFAULT_REPLY = "The laboratory shall retain records of examination results."
+
+
+class FakeLLMServer:
+    """
+    Serves POST .../chat/completions in the OpenAI wire format that both
+    the Groq and the Mistral clients speak, streamed or not. Behaviour can
+    be changed between calls: status (non-200 fails the call),
+    first_token_delay and token_delay in seconds, and the reply text.
+    """
+    def __init__(self, reply=DEFAULT_REPLY):
+        self.reply = reply
+        self.status = 200
+        self.first_token_delay = 0.0
+        self.token_delay = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self, reply=DEFAULT_REPLY):
+        self.reply = reply
+        self.status = 200
+        self.first_token_delay = 0.0
+        self.token_delay = 0.0
+        with self._lock:
+            self.requests = 0
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake._count()
+                if not self.path.endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "not found"}})
+                if fake.status != 200:
+                    return self._json(fake.status, {"error": {"message": "fake provider failure", "type": "server_error"}})
+                try:
+                    if body.get("stream"):
+                        self._stream(body.get("model", "fake"))
+                    else:
+                        time.sleep(fake.first_token_delay)
+                        self._json(200, _completion(body.get("model", "fake"), fake.reply))
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client cancelled the call
+                    pass
+
+            def _json(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                time.sleep(fake.first_token_delay)
+                words = fake.reply.split(" ")
+                for i, word in enumerate(words):
+                    if i:
+                        time.sleep(fake.token_delay)
+                    delta = {"content": word if i == 0 else " " + word}
+                    if i == 0:
+                        delta["role"] = "assistant"
+                    self._event(_chunk(model, delta))
+                self._event(_chunk(model, {}, "stop"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _event(self, payload):
+                self.wfile.write(b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _chunk(model, delta, finish_reason=None):
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+    }
+
+
+def _completion(model, reply):
+    tokens = len(reply.split())
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": tokens, "total_tokens": tokens + 1},
+    }
@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+from langchain_core.documents import Document
+import batch_utils
+from batch_utils import BatchRunner
+from clause_utils import ClauseIndex
+from pydantic_utils import BatchItem
+from sqldb_utils import create_application_logs, create_chat_sessions
+
+CLAUSES = {"iso15189.pdf": [
+    {"number": "7.3", "title": "Examination processes", "parent": None, "source": "iso15189.pdf", "page": 1,
+     "text": "The laboratory shall select examination methods."},
+]}
+CONTEXT = [Document(id="chunk-1", page_content="Records shall be retained."),
+           Document(id="chunk-2", page_content="Documents shall be controlled.")]
+
+
+def _run(items, monkeypatch):
+    """
+    Runs a batch in which every question retrieves the same chunks, and
+    returns the questions a checklist or SOP was generated for.
+    """
+    create_application_logs()
+    create_chat_sessions()
+    snapshot = SimpleNamespace(clause_index=ClauseIndex(CLAUSES), corpus_version="v1")
+    generated = []
+
+    def generate(intent, question, context, config):
+        generated.append(question)
+        return f"{intent} for {question}"
+
+    monkeypatch.setattr(batch_utils, "get_retrieval_snapshot", lambda: snapshot)
+    monkeypatch.setattr(batch_utils, "retrieve_context", lambda question, snapshot: CONTEXT)
+    monkeypatch.setattr(BatchRunner, "_generate", staticmethod(generate))
+
+    async def collect():
+        return [result async for result in BatchRunner().run(items, "batch-session")]
+
+    return asyncio.run(collect()), generated
+
+
+def test_differently_worded_questions_over_the_same_chunks_get_their_own_answer(monkeypatch):
+    items = [
+        BatchItem(question="Checklist for document control records", intent="checklist"),
+        BatchItem(question="Checklist for document retention", intent="checklist"),
+        BatchItem(question="checklist for  DOCUMENT retention", intent="checklist"),
+    ]
+    results, generated = _run(items, monkeypatch)
+
+    assert sorted(generated) == ["Checklist for document control records", "Checklist for document retention"]
+    answers = {result["index"]: result["answer"] for result in results}
+    assert answers[0] == "checklist for Checklist for document control records"
+    assert answers[1] == answers[2] == "checklist for Checklist for document retention"
+
+
+def test_whole_clause_requests_share_one_generation(monkeypatch):
+    items = [
+        BatchItem(question="Audit checklist for clause 7.3", intent="checklist"),
+        BatchItem(question="Create a checklist for 7.3", intent="checklist"),
+        BatchItem(question="Write an SOP for clause 7.3", intent="sop"),
+    ]
+    results, generated = _run(items, monkeypatch)
+
+    assert len(generated) == 2
+    assert {result["type"] for result in results} == {"result"}
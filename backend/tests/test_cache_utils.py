@@ -0,0 +1,62 @@
+import numpy as np
+from cache_utils import SemanticAnswerCache
+from embedding_utils import normalize_query
+
+
+def _vectors(similarity, size=384):
+    """
+    Two unit vectors whose cosine similarity is `similarity`.
+    """
+    first = np.zeros(size)
+    first[0] = 1.0
+    second = np.zeros(size)
+    second[0] = similarity
+    second[1] = np.sqrt(1 - similarity ** 2)
+    return first, second
+
+
+def test_questions_below_threshold_do_not_collide():
+    cache = SemanticAnswerCache(max_entries=8, threshold=0.95, persist=False)
+    stored, other = _vectors(0.94)
+    cache.store("What does clause 7.3.6 require?", stored, "answer for 7.3.6", [], "v1", 120.0)
+
+    assert cache.lookup(other, "v1") is None
+    assert cache.lookup(stored, "v1")["answer"] == "answer for 7.3.6"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_near_duplicate_question_hits():
+    cache = SemanticAnswerCache(max_entries=8, threshold=0.95, persist=False)
+    stored, paraphrase = _vectors(0.97)
+    cache.store("What does clause 7.3.6 require?", stored, "answer for 7.3.6", [], "v1", 120.0)
+
+    assert cache.lookup(paraphrase, "v1")["answer"] == "answer for 7.3.6"
+
+
+def test_entries_of_another_corpus_version_are_dropped():
+    cache = SemanticAnswerCache(max_entries=8, persist=False)
+    stored, _ = _vectors(0.5)
+    cache.store("What is EQA?", stored, "answer", [], "v1", 50.0)
+
+    assert cache.lookup(stored, "v2") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2, persist=False)
+    vectors = np.eye(3, 384)
+    for i, vector in enumerate(vectors):
+        cache.store(f"question {i}", vector, f"answer {i}", [], "v1", 10.0)
+
+    assert cache.lookup(vectors[0], "v1") is None
+    assert cache.lookup(vectors[2], "v1")["answer"] == "answer 2"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_questions_are_normalized_like_query_embeddings():
+    cache = SemanticAnswerCache(max_entries=8, persist=False)
+    stored, _ = _vectors(0.5)
+    cache.store("  What IS   EQA? ", stored, "answer", [], "v1", 10.0)
+
+    assert cache.lookup(stored, "v1")["question"] == normalize_query("what is eqa?") == "what is eqa?"
@@ -0,0 +1,83 @@
+import os
+from chromadb_utils import (
+    generation_filter,
+    get_active_collection,
+    get_chroma,
+    get_corpus_generation,
+    get_embeddings,
+    load_manifest,
+    run_ingestion,
+)
+from fakes import write_pdf
+
+
+def _write(data_dir, name, topic):
+    write_pdf(os.path.join(data_dir, name), [[f"{topic} requirement {i} of the laboratory." for i in range(3)]])
+
+
+def _visible(generation):
+    return set(get_chroma()._collection.get(where=generation_filter(generation), include=[])["ids"])
+
+
+def _ingest(data_dir, remove=()):
+    embeddings = get_embeddings().base
+    before = embeddings.embedded
+    run_ingestion(str(data_dir), remove=remove)
+    return embeddings.embedded - before
+
+
+def test_ingestion_embeds_only_the_delta(tmp_path):
+    _write(tmp_path, "a.pdf", "Calibration")
+    _write(tmp_path, "b.pdf", "Sample transport")
+    _ingest(tmp_path)
+    collection = get_active_collection()
+    first = get_corpus_generation()
+    first_ids = _visible(first)
+
+    # adding a file embeds its chunks only, in place
+    _write(tmp_path, "c.pdf", "Proficiency testing")
+    embedded = _ingest(tmp_path)
+    files = load_manifest()["files"]
+    c_ids = set(files["c.pdf"]["chunk_ids"])
+    assert embedded == len(c_ids) > 0
+    assert get_active_collection() == collection
+    second = get_corpus_generation()
+    assert second == first + 1
+    assert _visible(first) == first_ids
+    assert _visible(second) == first_ids | c_ids
+
+    # changing b and removing a: the published generation still sees both
+    old_b_ids = set(files["b.pdf"]["chunk_ids"])
+    a_ids = set(files["a.pdf"]["chunk_ids"])
+    _write(tmp_path, "b.pdf", "Specimen rejection")
+    os.remove(tmp_path / "a.pdf")
+    embedded = _ingest(tmp_path, remove=["a.pdf"])
+    files = load_manifest()["files"]
+    new_b_ids = set(files["b.pdf"]["chunk_ids"])
+    assert embedded == len(new_b_ids - old_b_ids)
+    third = get_corpus_generation()
+    assert _visible(second) == first_ids | c_ids
+    assert _visible(third) == (first_ids - a_ids - old_b_ids) | c_ids | new_b_ids
+
+    # retired chunks are deleted by the ingestion after next
+    _write(tmp_path, "d.pdf", "Internal audit")
+    _ingest(tmp_path)
+    stored = set(get_chroma()._collection.get(include=[])["ids"])
+    assert not (a_ids | old_b_ids - new_b_ids) & stored
+
+
+def test_files_missing_from_the_data_directory_are_kept(tmp_path):
+    _write(tmp_path, "kept.pdf", "Reagent acceptance")
+    _ingest(tmp_path)
+    kept_ids = set(load_manifest()["files"]["kept.pdf"]["chunk_ids"])
+
+    # e.g. a recreated container without the uploads: nothing is inferred as deleted
+    os.remove(tmp_path / "kept.pdf")
+    _write(tmp_path, "new.pdf", "Sample storage")
+    _ingest(tmp_path)
+    assert "kept.pdf" in load_manifest()["files"]
+    assert kept_ids <= _visible(get_corpus_generation())
+
+    _ingest(tmp_path, remove=["kept.pdf"])
+    assert "kept.pdf" not in load_manifest()["files"]
+    assert not kept_ids & _visible(get_corpus_generation())
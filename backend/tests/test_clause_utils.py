@@ -0,0 +1,31 @@
+from clause_utils import ClauseIndex
+
+
+def _clause(number, source, text):
+    return {"number": number, "title": "Ensuring the validity of examination results",
+            "parent": number.rsplit(".", 1)[0], "source": source, "page": 1, "text": text}
+
+
+def test_clauses_come_from_the_standard_only():
+    index = ClauseIndex({
+        "ISO_15189_2022.pdf": [_clause("7.3.7", "ISO_15189_2022.pdf", "The laboratory shall monitor validity.")],
+        "sops/lab-sop-qc.pdf": [_clause("7.3.7", "sops/lab-sop-qc.pdf", "Run IQC every shift. " * 50)],
+        "sops/lab-sop-eqa.pdf": [_clause("9.1", "sops/lab-sop-eqa.pdf", "Enrol in the EQA scheme.")],
+    })
+    assert index.get("7.3.7")["source"] == "ISO_15189_2022.pdf"
+    assert index.get("9.1") is None
+    assert index.resolve("What does clause 9.1 require?") is None
+
+
+def test_later_edition_wins_regardless_of_text_length():
+    index = ClauseIndex({
+        "ISO15189-2012.pdf": [_clause("5.6.2", "ISO15189-2012.pdf", "Quality control. " * 50)],
+        "ISO15189-2022.pdf": [_clause("5.6.2", "ISO15189-2022.pdf", "Validity of results.")],
+    })
+    assert index.get("5.6.2")["source"] == "ISO15189-2022.pdf"
+
+
+def test_clause_sources_are_configurable():
+    clauses = {"standard.pdf": [_clause("7.3.7", "standard.pdf", "The laboratory shall monitor validity.")]}
+    assert len(ClauseIndex(clauses)) == 0
+    assert ClauseIndex(clauses, sources=["standard.pdf"]).get("7.3.7") is not None
@@ -0,0 +1,136 @@
+import asyncio
+from coalesce_utils import SingleFlight
+
+KEY = ("explanation", "what is eqa", "v1")
+TOKENS = ["External ", "quality ", "assessment."]
+
+
+class Producer:
+    """
+    An async generator function that streams TOKENS, each one released by
+    the test through step, and records how often and how far it ran.
+    """
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.step = asyncio.Semaphore(0)
+        self.runs = 0
+        self.cancelled = False
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            for i, token in enumerate(TOKENS):
+                if i == self.fail_after:
+                    raise RuntimeError("provider error")
+                await self.step.acquire()
+                yield token
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+    def release(self, count=len(TOKENS)):
+        for _ in range(count):
+            self.step.release()
+
+
+async def _collect(stream, received=None):
+    received = [] if received is None else received
+    async for token in stream:
+        received.append(token)
+    return received
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_concurrent_identical_requests_run_once():
+    async def scenario():
+        flights = SingleFlight(enabled=True)
+        produce = Producer()
+        consumers = [asyncio.create_task(_collect(flights.stream(KEY, produce))) for _ in range(3)]
+        await _settle()
+        produce.release()
+        results = await asyncio.wait_for(asyncio.gather(*consumers), 1)
+        return flights, produce, results
+
+    flights, produce, results = asyncio.run(scenario())
+    assert produce.runs == 1
+    assert results == [TOKENS] * 3
+    assert flights.stats()["pipeline_runs"] == 1
+    assert flights.stats()["coalesced"] == 2
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_late_joiner_receives_the_full_replay():
+    async def scenario():
+        flights = SingleFlight(enabled=True)
+        produce = Producer()
+        first = []
+        leader = asyncio.create_task(_collect(flights.stream(KEY, produce), first))
+        produce.release(2)
+        while len(first) < 2:
+            await asyncio.sleep(0)
+        follower = asyncio.create_task(_collect(flights.stream(KEY, produce)))
+        await _settle()
+        produce.release(1)
+        return produce, await asyncio.wait_for(asyncio.gather(leader, follower), 1)
+
+    produce, (first, late) = asyncio.run(scenario())
+    assert produce.runs == 1
+    assert first == late == TOKENS
+
+
+def test_failed_run_ends_every_subscriber():
+    async def scenario():
+        flights = SingleFlight(enabled=True)
+        produce = Producer(fail_after=1)
+        consumers = [asyncio.create_task(_collect(flights.stream(KEY, produce))) for _ in range(2)]
+        await _settle()
+        produce.release()
+        results = await asyncio.wait_for(asyncio.gather(*consumers), 1)
+        # the failed flight is forgotten, so the next request runs again
+        retry = Producer()
+        retry.release()
+        again = await asyncio.wait_for(_collect(flights.stream(KEY, retry)), 1)
+        return results, again, retry
+
+    results, again, retry = asyncio.run(scenario())
+    assert results == [TOKENS[:1]] * 2
+    assert again == TOKENS
+    assert retry.runs == 1
+
+
+def test_cancelled_leader_keeps_the_run_going_for_followers():
+    async def scenario():
+        flights = SingleFlight(enabled=True)
+        produce = Producer()
+        leader = asyncio.create_task(_collect(flights.stream(KEY, produce)))
+        follower = asyncio.create_task(_collect(flights.stream(KEY, produce)))
+        await _settle()
+        leader.cancel()
+        await _settle()
+        produce.release()
+        return produce, leader, await asyncio.wait_for(follower, 1)
+
+    produce, leader, received = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert received == TOKENS
+    assert not produce.cancelled
+
+
+def test_run_is_cancelled_once_every_subscriber_leaves():
+    async def scenario():
+        flights = SingleFlight(enabled=True)
+        produce = Producer()
+        consumers = [asyncio.create_task(_collect(flights.stream(KEY, produce))) for _ in range(2)]
+        await _settle()
+        for consumer in consumers:
+            consumer.cancel()
+        await _settle()
+        return flights, produce
+
+    flights, produce = asyncio.run(scenario())
+    assert produce.cancelled
+    assert flights.stats()["in_flight"] == 0
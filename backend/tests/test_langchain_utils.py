@@ -0,0 +1,82 @@
+import asyncio
+from chromadb_utils import run_ingestion
+from fakes import write_pdf
+from langchain_utils import DummyHandler, answer_cache, get_retrieval_snapshot, retrieval_chain, run_fast_path
+from retrieval_utils import BM25Index
+from router_utils import EXPLANATION
+
+QUESTION = "What records must be kept for equipment calibration?"
+HISTORY = [
+    {"role": "user", "content": "We are a small microbiology laboratory."},
+    {"role": "assistant", "content": "Understood, I will keep that in mind."},
+]
+
+
+def test_answer_cache_only_serves_turns_without_history(groq_server):
+    answer_cache.invalidate()
+
+    retrieval_chain.invoke({"input": QUESTION, "chat_history": HISTORY})
+    assert answer_cache.stats()["entries"] == 0
+
+    retrieval_chain.invoke({"input": QUESTION, "chat_history": []})
+    assert answer_cache.stats()["entries"] == 1
+
+    # a repeated first turn is served from the cache
+    requests = groq_server.requests
+    result = retrieval_chain.invoke({"input": QUESTION, "chat_history": []})
+    assert groq_server.requests == requests
+    assert result["answer"] == groq_server.reply
+
+    # the same question inside a conversation is answered afresh
+    retrieval_chain.invoke({"input": QUESTION, "chat_history": HISTORY})
+    assert groq_server.requests > requests
+
+
+def test_fast_path_streams_answer_tokens_without_new_event_loops(groq_server, monkeypatch):
+    answer_cache.invalidate()
+    runners = []
+
+    class CountingRunner(asyncio.Runner):
+        def __init__(self, *args, **kwargs):
+            runners.append(self)
+            super().__init__(*args, **kwargs)
+
+    # LangChain runs async handlers from worker threads in a fresh asyncio.Runner per event
+    monkeypatch.setattr(asyncio, "Runner", CountingRunner)
+
+    async def run():
+        queue = asyncio.Queue()
+        handler = DummyHandler(queue)
+        result = await asyncio.to_thread(run_fast_path, EXPLANATION, QUESTION, [], handler)
+        await asyncio.sleep(0)
+        tokens = []
+        while not queue.empty():
+            tokens.append(queue.get_nowait())
+        return result, tokens
+
+    result, tokens = asyncio.run(run())
+    assert not runners
+    assert len(tokens) == len(groq_server.reply.split(" "))
+    assert "".join(tokens) == result["output"] == groq_server.reply
+
+
+def test_lexical_index_follows_ingestion_incrementally(tmp_path, monkeypatch):
+    for name, topic in [("lex-a.pdf", "Proficiency testing"), ("lex-b.pdf", "Specimen labelling")]:
+        write_pdf(str(tmp_path / name), [[f"{topic} requirement {i} of the laboratory." for i in range(3)]])
+    run_ingestion(str(tmp_path))
+    full_build = BM25Index.from_vector_db
+
+    def no_full_build(*args, **kwargs):
+        raise AssertionError("BM25 index rebuilt from the whole collection")
+
+    # later snapshots only read the added chunks back from Chroma
+    monkeypatch.setattr(BM25Index, "from_vector_db", no_full_build)
+    write_pdf(str(tmp_path / "lex-c.pdf"), [["Reagent lot verification before use."]])
+    run_ingestion(str(tmp_path), remove=["lex-a.pdf"])
+
+    snapshot = get_retrieval_snapshot()
+    expected = full_build(snapshot.vector_db, where=snapshot.filter)
+    assert sorted(snapshot.lexical_index.ids) == sorted(expected.ids)
+    for query in ["proficiency testing", "reagent lot verification", "specimen labelling requirement"]:
+        found = {snapshot.lexical_index.ids[p]: round(s, 4) for p, s in snapshot.lexical_index.search(query, 10)}
+        assert found == {expected.ids[p]: round(s, 4) for p, s in expected.search(query, 10)}
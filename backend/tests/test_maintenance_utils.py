@@ -0,0 +1,52 @@
+import sqlite3
+import pytest
+import sqldb_utils
+from maintenance_utils import LogMaintenance
+from sqldb_utils import auto_vacuum_mode, create_application_logs, create_chat_sessions
+from sqldb_utils import create_session_summaries, insert_application_logs, stop_log_writer
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """
+    A database file created before auto_vacuum=INCREMENTAL was set.
+    """
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA auto_vacuum=NONE")
+    conn.execute("CREATE TABLE legacy (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    conn.close()
+    # the writer thread keeps its own connection to the suite's database
+    stop_log_writer()
+    monkeypatch.setattr(sqldb_utils, "DB_NAME", path)
+    monkeypatch.setattr(sqldb_utils._local, "conn", None)
+    create_application_logs()
+    create_chat_sessions()
+    create_session_summaries()
+    yield path
+    sqldb_utils._local.conn.close()
+
+
+def test_legacy_database_is_rebuilt_once_for_incremental_vacuum(legacy_db, tmp_path):
+    assert auto_vacuum_mode() == 0
+    maintenance = LogMaintenance(max_rows=1, archive_dir=str(tmp_path / "archive"), interval=0)
+
+    # nothing to archive yet, the migration still runs
+    assert maintenance.run_once()["vacuum"] == "full"
+    assert auto_vacuum_mode() == 2
+
+    result = maintenance.run_once()
+    assert result["vacuum"] == "skipped"
+    assert maintenance.stats()["vacuum_skipped"] == "no sessions deleted"
+
+    for session_id in ("old", "new"):
+        insert_application_logs(session_id, "What is EQA?", "External quality assessment.")
+    stop_log_writer()
+    result = maintenance.run_once()
+    assert result["sessions"] == 1
+    assert result["vacuum"] == "incremental"
+    stats = maintenance.stats()
+    assert stats["auto_vacuum"] == "incremental"
+    assert stats["last_vacuum"] == "incremental"
+    assert stats["vacuum_skipped"] is None
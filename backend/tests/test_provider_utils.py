@@ -0,0 +1,116 @@
+import time
+import asyncio
+import pytest
+from langchain_groq import ChatGroq
+from langchain_mistralai import ChatMistralAI
+import provider_utils
+from provider_utils import CLOSED, HALF_OPEN, OPEN, ProviderHealth, RoutedChatModel, provider_health
+
+MISTRAL_REPLY = "Mistral answered the question."
+
+
+def _router(prefix, **kwargs):
+    """
+    Groq then Mistral, both served by the fake servers. Health is tracked by
+    provider name, so every test routes over names of its own.
+    """
+    return RoutedChatModel(providers=[
+        (f"{prefix}-groq", ChatGroq(model_name="llama-3.1-8b-instant", temperature=0.0, max_retries=0)),
+        (f"{prefix}-mistral", ChatMistralAI(model="mistral-small-3.1", temperature=0.0, max_retries=0)),
+    ], **kwargs)
+
+
+def test_breaker_opens_on_errors_and_recovers_through_a_half_open_probe():
+    health = ProviderHealth("breaker", window=10, error_rate=0.5, min_requests=4, cooldown=0.05)
+    for _ in range(2):
+        health.record_success(100.0)
+    for _ in range(2):
+        health.record_failure(RuntimeError("503"))
+    assert health.state == OPEN
+    assert not health.allow()
+
+    # after the cooldown a single probe is let through, and its failure reopens the circuit
+    time.sleep(0.06)
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    assert not health.allow()
+    health.record_failure(RuntimeError("503"))
+    assert health.state == OPEN
+    assert health.opens == 2
+
+    time.sleep(0.06)
+    assert health.allow()
+    health.record_success(100.0)
+    assert health.state == CLOSED
+    assert health.allow()
+
+
+def test_only_the_probe_frees_the_half_open_slot():
+    health = ProviderHealth("probe", window=10, min_requests=2, cooldown=0.05)
+    # admitted while closed, still running when the circuit opens
+    straggler = health.allow()
+    for _ in range(2):
+        health.record_failure(RuntimeError("503"))
+    time.sleep(0.06)
+    probe = health.allow()
+    assert probe and health.state == HALF_OPEN
+
+    # an abandoned non-probe call must not let a second probe through
+    health.release(straggler)
+    assert not health.allow()
+    health.release(probe)
+    assert health.allow()
+
+
+def test_breaker_opens_on_slow_first_tokens():
+    health = ProviderHealth("slow", window=10, min_requests=4, latency_ms=1000, cooldown=30)
+    for _ in range(4):
+        health.record_first_token(1500.0)
+        health.record_success(2000.0)
+    assert health.state == OPEN
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_failover_on_rate_limits_and_server_errors(groq_server, mistral_server, status, mode):
+    groq_server.status = status
+    mistral_server.reply = MISTRAL_REPLY
+    prefix = f"failover-{mode}-{status}"
+    router = _router(prefix)
+
+    if mode == "sync":
+        result = router.invoke("What is EQA?")
+    else:
+        result = asyncio.run(router.ainvoke("What is EQA?"))
+
+    assert result.content == MISTRAL_REPLY
+    assert groq_server.requests == 1
+    assert provider_health(f"{prefix}-groq").failures == 1
+    assert provider_health(f"{prefix}-mistral").launches["failover"] == 1
+
+
+def test_open_circuit_is_skipped(groq_server, mistral_server):
+    mistral_server.reply = MISTRAL_REPLY
+    router = _router("skipped")
+    health = provider_health("skipped-groq")
+    for _ in range(health.min_requests):
+        health.record_failure(RuntimeError("503"))
+    assert health.state == OPEN
+
+    assert router.invoke("What is EQA?").content == MISTRAL_REPLY
+    assert groq_server.requests == 0
+
+
+def test_hedged_call_is_won_by_the_faster_provider(groq_server, mistral_server, monkeypatch):
+    # no latency history yet, so the hedge fires after HEDGE_DEFAULT_MS
+    monkeypatch.setattr(provider_utils, "HEDGE_DEFAULT_MS", 50.0)
+    groq_server.first_token_delay = 1.0
+    mistral_server.reply = MISTRAL_REPLY
+    router = _router("hedge", hedging=True)
+
+    start = time.perf_counter()
+    result = router.invoke("What is EQA?")
+    assert time.perf_counter() - start < 1.0
+    assert result.content == MISTRAL_REPLY
+    assert provider_health("hedge-mistral").launches["hedge"] == 1
+    assert provider_health("hedge-groq").failures == 0
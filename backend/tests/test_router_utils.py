@@ -0,0 +1,40 @@
+import pytest
+from router_utils import CHECKLIST, EXPLANATION, OUT_OF_SCOPE, SOP
+from router_utils import FILE_REPLY, GREETING_REPLY, classify_intent, out_of_scope_reply
+
+
+@pytest.mark.parametrize("question", [
+    "Can we keep calibration records in Excel spreadsheets?",
+    "Should PDF records of EQA results be signed?",
+    "Can we save calibration records as PDF files?",
+    "How are downloads of LIS software updates controlled?",
+    "Can attachments to reports include reference intervals?",
+    "Where can I download ISO 15189?",
+])
+def test_questions_mentioning_files_are_domain_questions(question):
+    assert classify_intent(question) == EXPLANATION
+
+
+@pytest.mark.parametrize("question", [
+    "Give me the clause 7.3 checklist as a PDF",
+    "Export this SOP to Word",
+    "Can you generate a docx of the SOP?",
+    "Please send me the audit checklist in Excel",
+    "Create an SOP for calibration as a Word document",
+])
+def test_explicit_file_requests_are_out_of_scope(question):
+    assert classify_intent(question) == OUT_OF_SCOPE
+    assert out_of_scope_reply(question) == FILE_REPLY
+
+
+def test_greetings_get_the_greeting_reply():
+    assert classify_intent("Hello there!") == OUT_OF_SCOPE
+    assert out_of_scope_reply("Hello there!") == GREETING_REPLY
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("Write an SOP for sample reception", SOP),
+    ("Audit checklist for clause 6.4 equipment", CHECKLIST),
+])
+def test_task_intents(question, intent):
+    assert classify_intent(question) == intent
@@ -0,0 +1,26 @@
+from sqldb_utils import create_application_logs, create_chat_sessions, create_session_summaries
+from sqldb_utils import delete_chat_session, get_chat_history, get_chat_session, get_session_turns
+from sqldb_utils import insert_application_logs, log_writer, stop_log_writer
+
+
+def test_deleted_session_is_not_written_back_by_the_log_writer(monkeypatch):
+    create_application_logs()
+    create_chat_sessions()
+    create_session_summaries()
+    stop_log_writer()
+    # keep the turns in the write-behind queue until stop_log_writer() drains it
+    monkeypatch.setattr(log_writer, "start", lambda: None)
+    insert_application_logs("deleted", "What is EQA?", "External quality assessment.")
+    insert_application_logs("kept", "What is IQC?", "Internal quality control.")
+    assert len(get_session_turns("deleted", 10)) == 1
+    assert get_chat_history("deleted")
+
+    delete_chat_session("deleted")
+    assert get_session_turns("deleted", 10) == []
+    assert get_chat_history("deleted") == []
+
+    monkeypatch.undo()
+    stop_log_writer()
+    assert get_chat_session("deleted") is None
+    assert get_session_turns("deleted", 10) == []
+    assert get_chat_session("kept")["turns"] == 1
@@ -1,21 +1,96 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json, os
 
-def get_api_response_stream(prompt: str, session_id: str):
+API_CONNECT_TIMEOUT = float(os.getenv('API_CONNECT_TIMEOUT', '5'))
+API_READ_TIMEOUT = float(os.getenv('API_READ_TIMEOUT', '120'))  # max silence between streamed lines
+STREAM_CHUNK_SIZE = 8192
+
+_session = None
+
+def get_http_session():
+    """
+    Returns the process-wide keep-alive session. Streamlit reruns the
+    script, not its imports, so the pool survives across reruns.
+    """
+    global _session
+    if _session is None:
+        # a POST is only retried when the connection itself fails, never after it was sent
+        retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.3)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+def _base_url():
+    return os.getenv('API_URL', 'http://localhost:8000')
+
+def _get_json(path: str, params: dict, default):
+    try:
+        response = get_http_session().get(
+            f'{_base_url()}{path}', params=params, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+        )
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError):
+        return default
+
+def list_sessions(user_id: str, cursor: str = None, limit: int = 20) -> dict:
+    """
+    One page of the user's sessions: {"sessions": [...], "next_cursor": ...}.
+    """
+    params = {"user_id": user_id, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    return _get_json('/sessions', params, {"sessions": [], "next_cursor": None})
+
+def get_session_turns(session_id: str, user_id: str, cursor: str = None, limit: int = 20) -> dict:
+    """
+    One page of one of the user's sessions, newest turn first: {"turns": [...], "next_cursor": ...}.
+    """
+    params = {"user_id": user_id, "limit": limit}
+    if cursor:
+        params["cursor"] = cursor
+    return _get_json(f'/sessions/{session_id}/turns', params, {"turns": [], "next_cursor": None})
+
+def delete_session(session_id: str, user_id: str) -> bool:
+    try:
+        response = get_http_session().delete(
+            f'{_base_url()}/sessions/{session_id}', params={"user_id": user_id},
+            timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+        )
+        return response.status_code == 200
+    except requests.RequestException:
+        return False
+
+def get_api_response_stream(prompt: str, session_id: str, user_id: str = None):
     """
     Generator function to stream API response tokens.
     """
-    base_url = os.getenv('API_URL', 'http://localhost:8000')
-    url = f'{base_url}/chat'
+    url = f'{_base_url()}/chat'
 
     payload = {"question": prompt}
     if session_id:
         payload["session_id"] = session_id
+    if user_id:
+        payload["user_id"] = user_id
 
-    with requests.post(url, json=payload, stream=True) as response:
-        for line in response.iter_lines(decode_unicode=True):
-            if line:
-                try:
-                    yield json.loads(line)
-                except json.JSONDecodeError:
-                    yield {"type": "error", "content": line}
\ No newline at end of file
+    try:
+        with get_http_session().post(
+            url, json=payload, stream=True, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+        ) as response:
+            if response.status_code != 200:
+                yield {"type": "error", "content": f"The server returned {response.status_code}. Please try again."}
+                return
+            # bytes lines straight into json.loads, no per-line decode step
+            for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE):
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        yield {"type": "error", "content": line.decode('utf-8', 'replace')}
+    except requests.RequestException as e:
+        yield {"type": "error", "content": f"Could not reach the server: {e}"}
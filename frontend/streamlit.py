@@ -1,8 +1,16 @@
 import streamlit as st 
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 import json
+import time
 from client import get_api_response_stream
+from client import list_sessions, get_session_turns
+from client import delete_session as delete_remote_session
+
+RENDER_INTERVAL = 0.05  # redraw the streaming answer at most ~20 times a second
+RENDER_MIN_CHARS = 200  # ...unless this much new text has arrived
+SESSION_PAGE_SIZE = 20
+TURN_PAGE_SIZE = 20
 
 st.set_page_config(
     page_title = 'QMS Assistant',
@@ -25,14 +33,16 @@ st.markdown(
 st.header('🤖 Hi, Where should we begin?')
 
 
-@st.cache_resource
-def get_persistent_store():
-    return {}
-
 # Initialize session state
 def initialize_session_state():
 
-    store = get_persistent_store()
+    if "user_id" not in st.session_state:
+        # kept in the URL so history survives reloads and can be opened on another device
+        user_id = st.query_params.get("user")
+        if not user_id:
+            user_id = str(uuid.uuid4())
+            st.query_params["user"] = user_id
+        st.session_state.user_id = user_id
 
     if "session_id" not in st.session_state:
         st.session_state.session_id = None
@@ -40,59 +50,93 @@ def initialize_session_state():
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
-    if "chat_sessions" not in st.session_state:
-        st.session_state.chat_sessions = {}
+    if "turns_cursor" not in st.session_state:
+        st.session_state.turns_cursor = None
     
-    if "current_session_id" not in st.session_state:
-        st.session_state.current_session_id = str(uuid.uuid4())
-
-def save_current_session():
-    """Save current messages to the sessions dictionary"""
-    if st.session_state.messages:
-        # Create a title from the first user message (truncated)
-        first_message = next((msg['content'] for msg in st.session_state.messages if msg['role'] == 'user'), "New Chat")
-        title = first_message[:50] + "..." if len(first_message) > 50 else first_message
-        
-        st.session_state.chat_sessions[st.session_state.current_session_id] = {
-            'title': title,
-            'messages': st.session_state.messages.copy(),
-            'timestamp': datetime.now().isoformat(),
-            'session_id': st.session_state.session_id
-        }
-
-def load_session(session_key):
-    """Load a specific session"""
-    if session_key in st.session_state.chat_sessions:
-        session_data = st.session_state.chat_sessions[session_key]
-        st.session_state.messages = session_data['messages'].copy()
-        st.session_state.current_session_id = session_key
-        st.session_state.session_id = session_data.get('session_id')
-        st.rerun()
+    if "session_list" not in st.session_state:
+        st.session_state.session_list = None  # fetched lazily by the sidebar
+        st.session_state.sessions_cursor = None
+
+def load_session_list(more=False):
+    """Fetch the first (or next) page of this user's sessions from the backend"""
+    page = list_sessions(
+        st.session_state.user_id,
+        cursor=st.session_state.sessions_cursor if more else None,
+        limit=SESSION_PAGE_SIZE
+    )
+    if more:
+        st.session_state.session_list.extend(page['sessions'])
+    else:
+        st.session_state.session_list = page['sessions']
+    st.session_state.sessions_cursor = page['next_cursor']
+
+def turns_to_messages(turns):
+    """Turns come newest first; messages are displayed oldest first"""
+    messages = []
+    for turn in reversed(turns):
+        messages.append({"role": "user", "content": turn['user_question']})
+        messages.append({"role": "assistant", "content": turn['gpt_answer']})
+    return messages
+
+def remember_current_session(prompt):
+    """Move the current session to the top of the sidebar list"""
+    if st.session_state.session_list is None or not st.session_state.session_id:
+        return
+    sessions = st.session_state.session_list
+    current = next((s for s in sessions if s['session_id'] == st.session_state.session_id), None)
+    if current is None:
+        current = {'session_id': st.session_state.session_id, 'title': prompt[:80]}
+    else:
+        sessions.remove(current)
+    current['last_activity'] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    sessions.insert(0, current)
+
+def load_session(session_id):
+    """Load the latest turns of a specific session"""
+    page = get_session_turns(session_id, st.session_state.user_id, limit=TURN_PAGE_SIZE)
+    st.session_state.messages = turns_to_messages(page['turns'])
+    st.session_state.turns_cursor = page['next_cursor']
+    st.session_state.session_id = session_id
+    st.rerun()
+
+def load_earlier_messages():
+    """Prepend the previous page of turns of the current session"""
+    page = get_session_turns(
+        st.session_state.session_id, st.session_state.user_id,
+        cursor=st.session_state.turns_cursor, limit=TURN_PAGE_SIZE
+    )
+    st.session_state.messages = turns_to_messages(page['turns']) + st.session_state.messages
+    st.session_state.turns_cursor = page['next_cursor']
+    st.rerun()
 
 def start_new_chat():
     """Start a new chat session"""
-    save_current_session()  # Save current session before starting new one
-    st.session_state.current_session_id = str(uuid.uuid4())
     st.session_state.session_id = None
     st.session_state.messages = []
+    st.session_state.turns_cursor = None
     st.rerun()
 
-def delete_session(session_key):
+def delete_session(session_id):
     """Delete a specific session"""
-    if session_key in st.session_state.chat_sessions:
-        del st.session_state.chat_sessions[session_key]
+    if delete_remote_session(session_id, st.session_state.user_id):
+        st.session_state.session_list = [
+            s for s in st.session_state.session_list if s['session_id'] != session_id
+        ]
         
         # If we deleted the current session, start a new one
-        if session_key == st.session_state.current_session_id:
+        if session_id == st.session_state.session_id:
             start_new_chat()
         else:
             st.rerun()
+    else:
+        st.error("Could not delete this chat. Please try again.")
 
 def format_timestamp(timestamp_str):
     """Format timestamp for display"""
     try:
-        dt = datetime.fromisoformat(timestamp_str)
-        now = datetime.now()
+        # the backend stores UTC
+        dt = datetime.fromisoformat(timestamp_str).replace(tzinfo=timezone.utc).astimezone()
+        now = datetime.now().astimezone()
         
         # If today, show time
         if dt.date() == now.date():
@@ -119,29 +163,28 @@ with st.sidebar:
     
     st.divider()
     
-    # Chat sessions list
-    if st.session_state.chat_sessions:
+    # Chat sessions list, fetched from the backend on first render
+    if st.session_state.session_list is None:
+        load_session_list()
+
+    if st.session_state.session_list:
         st.subheader("Recent Chats")
         
-        # Sort sessions by timestamp (most recent first)
-        sorted_sessions = sorted(
-            st.session_state.chat_sessions.items(),
-            key=lambda x: x[1]['timestamp'],
-            reverse=True
-        )
-        
-        for session_key, session_data in sorted_sessions:
+        for session_data in st.session_state.session_list:
+            session_key = session_data['session_id']
             col1, col2 = st.columns([4, 1])
             
             with col1:
                 # Create a button for each session
-                is_current = session_key == st.session_state.current_session_id
+                is_current = session_key == st.session_state.session_id
                 button_type = "primary" if is_current else "secondary"
+                title = session_data['title']
+                title = title[:50] + "..." if len(title) > 50 else title
                 
                 if st.button(
-                    f"{'🟢 ' if is_current else ''}{session_data['title']}", 
+                    f"{'🟢 ' if is_current else ''}{title}", 
                     key=f"load_{session_key}",
-                    help=f"Created: {format_timestamp(session_data['timestamp'])}",
+                    help=f"Last active: {format_timestamp(session_data['last_activity'])}",
                     use_container_width=True,
                     type=button_type
                 ):
@@ -152,13 +195,19 @@ with st.sidebar:
                 # Delete button
                 if st.button("🗑️", key=f"del_{session_key}", help="Delete chat"):
                     delete_session(session_key)
+
+        if st.session_state.sessions_cursor:
+            if st.button("Load more chats", use_container_width=True):
+                load_session_list(more=True)
+                st.rerun()
     
     else:
         st.info("No chat history yet. Start a conversation!")
 
-# Auto-save current session when messages change
-if st.session_state.messages:
-    save_current_session()
+# Older turns of a loaded session are fetched on demand
+if st.session_state.turns_cursor:
+    if st.button("Load earlier messages"):
+        load_earlier_messages()
 
 # Display chat messages
 for message in st.session_state.messages:
@@ -174,25 +223,44 @@ if prompt:
 
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        full_response = ""
+        chunks = []
+        rendered_chars = 0
+        streamed_chars = 0
+        last_render = 0.0
         
         with st.status('Just a sec...', expanded=False) as status_box:
-            for response in get_api_response_stream(prompt, st.session_state.session_id):
+            for response in get_api_response_stream(prompt, st.session_state.session_id, st.session_state.user_id):
                 if response['type'] == 'session':
                     st.session_state.session_id = response['session_id']
                     status_box.update(label="Processing your request...", state="running")
                     
                 elif response['type'] == 'token':
-                    full_response += response['content']
-                    status_box.update(label="Generating response...", state="running")
-                    message_placeholder.markdown(full_response + "▌")
+                    if not chunks:
+                        status_box.update(label="Generating response...", state="running")
+                    chunks.append(response['content'])
+                    streamed_chars += len(response['content'])
+                    # Redrawing the whole answer per token is quadratic; redraw per frame instead
+                    now = time.monotonic()
+                    if now - last_render >= RENDER_INTERVAL or streamed_chars - rendered_chars >= RENDER_MIN_CHARS:
+                        message_placeholder.markdown("".join(chunks) + "▌")
+                        rendered_chars = streamed_chars
+                        last_render = now
+
+                elif response['type'] == 'error':
+                    if not chunks:
+                        chunks.append(response['content'])
+                    status_box.update(label="Something went wrong", state="error")
+                    break
                     
                 elif response['type'] == 'end':
                     status_box.update(label="Done!", state="complete")
                     break
         
+        full_response = "".join(chunks)
+        
         st.session_state.messages.append({"role": "assistant", "content": full_response})
         message_placeholder.markdown(full_response)
+        remember_current_session(prompt)
 
 # Display session info in footer (optional)
 with st.container():